@@ -8,7 +8,14 @@ import streamlit as st
 import requests
 import pandas as pd
 import time
+import csv
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlencode
+from collections import defaultdict
+from persistent_cache import PersistentCache
+import http_client
+from http_client import HTTP_POOL_WORKERS
 
 # ------------------------------------------------------------
 # Constantes
@@ -17,100 +24,273 @@ HAL_SEARCH_API = "https://api.archives-ouvertes.fr/search/"
 HAL_AUTHOR_API = "https://api.archives-ouvertes.fr/ref/author/"
 FIELDS_LIST = "form_i,person_i,lastName_s,firstName_s,valid_s,idHal_s,halId_s,idrefId_s,orcidId_s,emailDomain_s "
 REQUEST_DELAY = 0.5  # délai recommandé entre requêtes
+AUTHOR_FACET_FIELD = "structHasAuthId_fs"
+CURSOR_ROWS = 10000
+
+# Récupération des formes-auteurs : lots POST, concurrence adaptative de l'hôte HAL (http_client)
+AUTHOR_POST_BATCH_SIZE = 200    # identifiants person_i par requête
+AUTHOR_ROWS_MAX = 10000         # plusieurs formes par personne : on demande large
+MAX_RETRIES_429 = 5
+SCHEDULER_WAIT_MAX = 1.0        # attente maximale (s) de la boucle d'envoi entre deux vérifications
+
+# Cache persistant des notices ref/author (par person_i), partagé entre collections et exécutions
+AUTHOR_CACHE_TTL = 7 * 24 * 3600
 
 # ------------------------------------------------------------
 # Fonctions utilitaires
 # ------------------------------------------------------------
 def fetch_publications_for_collection(collection_code, years):
-    """ Récupère toutes les publications d'une collection HAL. """
+    """ Récupère toutes les publications d'une collection HAL (pagination par cursorMark). """
     all_docs = []
-    rows = 10000
-    start = 0
 
     query_params = {
         "q": "*:*",
         "wt": "json",
         "fl": "structHasAuthId_fs",
-        "rows": rows,
+        "rows": CURSOR_ROWS,
+        # cursorMark impose un tri sur la clé unique
+        "sort": "docid asc",
     }
 
     if years:
         query_params["fq"] = f"producedDateY_i:{years}"
 
+    cursor_mark = "*"
     while True:
-        query_params["start"] = start
+        query_params["cursorMark"] = cursor_mark
         url = f"{HAL_SEARCH_API}{collection_code}/?{urlencode(query_params)}"
 
-        response = requests.get(url)
+        response = http_client.get(url, dedupe=False, route="hal-import")
         response.raise_for_status()
         data = response.json()
 
         docs = data.get("response", {}).get("docs", [])
-        num_found = data.get("response", {}).get("numFound", 0)
         all_docs.extend(docs)
 
-        if len(all_docs) >= num_found or not docs:
+        next_cursor_mark = data.get("nextCursorMark")
+        if not docs or not next_cursor_mark or next_cursor_mark == cursor_mark:
             break
 
-        start += rows
+        cursor_mark = next_cursor_mark
         time.sleep(REQUEST_DELAY)
 
     return all_docs
 
 
-def extract_author_ids(publications):
-    """ Extrait tous les docid auteurs uniques d'une liste de publications. """
+def fetch_author_facets_for_collection(collection_code, years, facet_field=AUTHOR_FACET_FIELD):
+    """
+    Récupère les valeurs distinctes de facet_field pour une collection HAL en une seule
+    requête (rows=0, facet.limit=-1), sans télécharger les documents.
+    Retourne (nombre de publications, liste des valeurs de facette).
+    """
+    query_params = {
+        "q": "*:*",
+        "wt": "json",
+        "rows": 0,
+        "facet": "true",
+        "facet.field": facet_field,
+        "facet.limit": -1,
+        "facet.mincount": 1,
+    }
+
+    if years:
+        query_params["fq"] = f"producedDateY_i:{years}"
+
+    url = f"{HAL_SEARCH_API}{collection_code}/?{urlencode(query_params)}"
+    response = http_client.get(url, route="hal-facettes")
+    response.raise_for_status()
+    data = response.json()
+
+    num_found = data.get("response", {}).get("numFound", 0)
+    # Solr renvoie une liste à plat [valeur, nombre, valeur, nombre, ...]
+    flat_counts = data.get("facet_counts", {}).get("facet_fields", {}).get(facet_field, [])
+    return num_found, flat_counts[0::2]
+
+
+def extract_author_ids_from_values(values):
+    """ Extrait les docid auteurs uniques d'une liste de valeurs structHasAuthId_fs. """
     author_ids = set()
-    for doc in publications:
-        authors = doc.get("structHasAuthId_fs", [])
-        for a in authors:
-            parts = a.split("_JoinSep_")
-            if len(parts) > 1:
-                full_id = parts[1].split("_FacetSep")[0]
-                docid = full_id.split("-")[-1].strip()
-                if docid.isdigit() and docid != "0":
-                    author_ids.add(docid)
+    for a in values:
+        parts = a.split("_JoinSep_")
+        if len(parts) > 1:
+            full_id = parts[1].split("_FacetSep")[0]
+            docid = full_id.split("-")[-1].strip()
+            if docid.isdigit() and docid != "0":
+                author_ids.add(docid)
     return list(author_ids)
 
 
-def fetch_author_details_batch(author_ids, fields, batch_size=20):
-    """ Récupère les formes-auteurs par lots pour accélérer les requêtes. """
-    authors_details = []
+def extract_author_ids(publications):
+    """ Extrait tous les docid auteurs uniques d'une liste de publications. """
+    return extract_author_ids_from_values(
+        a for doc in publications for a in doc.get("structHasAuthId_fs", [])
+    )
+
+
+def _post_author_batch(batch, fields):
+    """ Une requête POST sur ref/author pour un lot d'identifiants person_i. """
+    params = {
+        "q": f"person_i:({' OR '.join(batch)})",
+        "wt": "json",
+        "fl": fields,
+        "rows": AUTHOR_ROWS_MAX,
+    }
+    response = http_client.post(HAL_AUTHOR_API, data=params, timeout=60, route="hal-auteurs-lot")
+    if response.status_code == 429:
+        return None, response.headers.get("Retry-After")
+    response.raise_for_status()
+    return response.json().get("response", {}).get("docs", []), None
+
+
+def fetch_author_details_adaptive(author_ids, fields, csv_file=None, batch_size=AUTHOR_POST_BATCH_SIZE, on_batch=None):
+    """
+    Récupère les formes-auteurs par lots POST envoyés en parallèle (concurrence adaptative
+    partagée de l'hôte HAL, voir http_client)
+    et écrit les lignes dans csv_file au fur et à mesure. Retourne le nombre de lignes reçues.
+    on_batch(lot d'identifiants, formes reçues) est appelé pour chaque lot abouti.
+    """
     clean_ids = [i.strip() for i in author_ids if i.strip()]
     total = len(clean_ids)
+    requested_fields = [f.strip() for f in fields.split(",")]
+    writer = None
+    if csv_file is not None:
+        writer = csv.DictWriter(csv_file, fieldnames=requested_fields, delimiter=";", extrasaction="ignore")
+        writer.writeheader()
+
+    # (lot, tentatives, pas avant : instant time.monotonic() à partir duquel le lot peut être renvoyé)
+    pending = [(clean_ids[start:start + batch_size], 0, 0.0) for start in range(0, total, batch_size)]
+    controller = http_client.host_controller(HAL_AUTHOR_API)
+    n_rows = 0
+    n_done = 0
+    errors = []
 
-    # Barre de progression Streamlit
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    for start in range(0, total, batch_size):
-        batch = clean_ids[start:start + batch_size]
-        or_query = " OR ".join([f'person_i:\"{i}\"' for i in batch])
-        params = {"q": or_query, "wt": "json", "fl": fields, "rows": batch_size}
-        url = f"{HAL_AUTHOR_API}?{urlencode(params)}"
+    with ThreadPoolExecutor(max_workers=HTTP_POOL_WORKERS) as executor:
+        in_flight = {}
+        while pending or in_flight:
+            now = time.monotonic()
+            waiting = []
+            for batch, attempts, not_before in pending:
+                if not_before <= now and len(in_flight) < controller.limit:
+                    in_flight[executor.submit(_post_author_batch, batch, fields)] = (batch, attempts)
+                else:
+                    waiting.append((batch, attempts, not_before))
+            pending = waiting
+
+            # Attente bornée : les lots mis en pause (429) sont renvoyés dès leur échéance
+            timeout = SCHEDULER_WAIT_MAX
+            deferred = [not_before for _, _, not_before in pending if not_before > now]
+            if deferred:
+                timeout = min(timeout, min(deferred) - now)
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, attempts = in_flight.pop(future)
+                try:
+                    docs, retry_after = future.result()
+                except requests.exceptions.RequestException as e:
+                    errors.append(f"⚠️ Erreur sur un lot de {len(batch)} auteurs : {e}")
+                    n_done += len(batch)
+                    continue
+
+                if docs is None:
+                    # 429 (la concurrence a été réduite par http_client) : lot remis en file, renvoyé
+                    # après la pause demandée sans bloquer les autres lots
+                    if attempts + 1 >= MAX_RETRIES_429:
+                        errors.append(f"⚠️ Lot de {len(batch)} auteurs abandonné après {attempts + 1} réponses 429.")
+                        n_done += len(batch)
+                    else:
+                        delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempts
+                        pending.append((batch, attempts + 1, time.monotonic() + delay))
+                    continue
+
+                # On conserve les valeurs brutes de valid_s
+                if writer is not None:
+                    writer.writerows(docs)
+                if on_batch is not None:
+                    on_batch(batch, docs)
+                n_rows += len(docs)
+                n_done += len(batch)
+
+            progress_bar.progress(n_done / total if total else 1.0)
+            status_text.text(f"Traitement : {n_done}/{total} auteurs ({controller.limit} requêtes simultanées)...")
+
+    if csv_file is not None:
+        csv_file.flush()
+    progress_bar.empty()
+    status_text.text("✅ Téléchargement terminé !")
+    for message in errors:
+        st.warning(message)
 
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            docs = data.get("response", {}).get("docs", [])
+    return n_rows
 
-            # On conserve les valeurs brutes de valid_s
-            authors_details.extend(docs)
 
-        except requests.exceptions.RequestException as e:
-            st.warning(f"⚠️ Erreur sur le lot {batch}: {e}")
-            continue
+def collect_author_ids(collection_code, years, use_facets=True):
+    """ (nombre de publications, identifiants auteurs) d'une collection, par facettes ou documents. """
+    if use_facets:
+        num_pubs, facet_values = fetch_author_facets_for_collection(collection_code, years)
+        return num_pubs, extract_author_ids_from_values(facet_values)
+    pubs = fetch_publications_for_collection(collection_code, years)
+    return len(pubs), extract_author_ids(pubs)
 
-        progress = min(start + batch_size, total)
-        progress_bar.progress(progress / total)
-        status_text.text(f"Traitement : {progress}/{total} auteurs...")
-        time.sleep(REQUEST_DELAY)
 
-    progress_bar.empty()
-    status_text.text("✅ Téléchargement terminé !")
+_author_cache = None
+
+
+def get_author_cache():
+    global _author_cache
+    if _author_cache is None:
+        _author_cache = PersistentCache("ref_author", AUTHOR_CACHE_TTL)
+    return _author_cache
+
+
+def resolve_persons_cached(author_ids, fields, cache):
+    """
+    Formes-auteurs de chaque person_i ({id: [formes]}), lues dans le cache persistant ;
+    seuls les identifiants absents du cache sont demandés à ref/author.
+    """
+    # Les champs demandés font partie de la clé : changer fields ne réutilise pas d'anciennes notices
+    fields_key = ",".join(f.strip() for f in fields.split(",") if f.strip())
+    forms_by_person = {}
+    missing = []
+    for person_id in author_ids:
+        cached = cache.get(f"{fields_key}|{person_id}")
+        if cached is None:
+            missing.append(person_id)
+        else:
+            forms_by_person[person_id] = cached
+
+    def store_batch(batch, docs):
+        grouped = defaultdict(list)
+        for doc in docs:
+            grouped[str(doc.get("person_i", ""))].append(doc)
+        for person_id in batch:
+            forms_by_person[person_id] = grouped.get(person_id, [])
+            cache.set(f"{fields_key}|{person_id}", forms_by_person[person_id])
+
+    if missing:
+        fetch_author_details_adaptive(missing, fields, on_batch=store_batch)
+    return forms_by_person, len(missing)
+
+
+def write_multi_collection_csv(csv_file, forms_by_person, collections_by_person, fields):
+    """ CSV combiné : une ligne par forme-auteur, avec les collections où la personne apparaît. """
+    requested_fields = [f.strip() for f in fields.split(",")]
+    writer = csv.DictWriter(csv_file, fieldnames=requested_fields + ["collections"], delimiter=";", extrasaction="ignore")
+    writer.writeheader()
+    n_rows = 0
+    for person_id in sorted(collections_by_person, key=int):
+        collections = "|".join(sorted(collections_by_person[person_id]))
+        for form in forms_by_person.get(person_id, []):
+            writer.writerow({**form, "collections": collections})
+            n_rows += 1
+    csv_file.flush()
+    return n_rows
 
-    return authors_details
 
 # ------------------------------------------------------------
 # Interface Streamlit
@@ -120,58 +300,112 @@ st.set_page_config(page_title="Extraction HAL - Auteurs", page_icon="📚", layo
 st.title("🧲 Extraction des formes-auteurs HAL")
 st.markdown(
     """
-    Cette application extrait les **formes-auteurs** à partir d’une **collection HAL**.
+    Cette application extrait les **formes-auteurs** à partir d’une ou plusieurs **collections HAL**.
     """
 )
 
 # Entrées utilisateur
+scope = st.radio("Périmètre", ["Une collection", "Plusieurs collections"], horizontal=True)
 col1, col2 = st.columns(2)
 with col1:
-    collection_code = st.text_input("Code de la collection HAL", "")
+    if scope == "Une collection":
+        collection_code = st.text_input("Code de la collection HAL", "")
+        collection_codes = [collection_code] if collection_code.strip() else []
+    else:
+        codes_text = st.text_area("Codes des collections HAL (un par ligne ou séparés par des virgules)", "")
+        collection_codes = list(dict.fromkeys(c.strip() for c in codes_text.replace(",", "\n").splitlines() if c.strip()))
 with col2:
     years = st.text_input("Année ou intervalle (ex : 2025 ou [2020 TO 2024])", "")
 
-batch_size = st.slider("Taille des lots (requêtes groupées)", 10, 50, 20, step=5)
-delay = st.slider("Délai entre requêtes (secondes)", 0.1, 1.0, 0.5, 0.1)
+mode = st.radio(
+    "Mode de récupération des auteurs",
+    ["Facettes (rapide, sans télécharger les publications)", "Publications (pagination cursorMark)"],
+)
+use_facets = mode.startswith("Facettes")
 
 # Lancement
-if st.button("🚀 Lancer l'extraction") and collection_code:
-    REQUEST_DELAY = delay
+launch = st.button("🚀 Lancer l'extraction")
+if launch:
+    # Réponses HTTP propres à cette extraction : les facettes d'un clic précédent ne sont pas réutilisées
+    http_client.start_run()
+if launch and collection_codes and scope == "Une collection":
     st.info(f"Extraction en cours pour **{collection_code}**, période **{years or 'toutes'}**...")
 
     try:
-        with st.spinner("🔎 Récupération des publications..."):
-            pubs = fetch_publications_for_collection(collection_code, years)
+        with st.spinner("🔎 Récupération des auteurs de la collection..."):
+            num_pubs, author_ids = collect_author_ids(collection_code, years, use_facets)
 
-        if not pubs:
+        if not num_pubs:
             st.error("Aucune publication trouvée pour cette collection.")
         else:
-            st.success(f"✅ {len(pubs)} publications récupérées.")
-            time.sleep(0.3)
-
-            with st.spinner("👥 Extraction des identifiants d’auteurs..."):
-                author_ids = extract_author_ids(pubs)
+            st.success(f"✅ {num_pubs} publications dans la collection.")
             st.success(f"✅ {len(author_ids)} formes-auteurs détectées.")
 
             if not author_ids:
                 st.warning("Aucune forme-auteur détectée. Vérifie la collection ou la période.")
             else:
-                with st.spinner("📡 Récupération des détails auteurs (mode batch)..."):
-                    details = fetch_author_details_batch(author_ids, FIELDS_LIST, batch_size=batch_size)
+                filename = f"formes_auteurs_{collection_code}_{years or 'all'}.csv"
+                with tempfile.NamedTemporaryFile("w+", encoding="utf-8", newline="", suffix=".csv") as csv_tmp:
+                    with st.spinner("📡 Récupération des détails auteurs (lots parallèles)..."):
+                        n_forms = fetch_author_details_adaptive(author_ids, FIELDS_LIST, csv_tmp)
+
+                    if not n_forms:
+                        st.error("Aucune forme-auteur récupérée.")
+                    else:
+                        csv_tmp.seek(0)
+                        csv_content = csv_tmp.read()
+
+                        st.success(f"✅ Extraction terminée : {n_forms} formes-auteurs récupérées.")
+                        st.download_button("📥 Télécharger le CSV", csv_content, file_name=filename, mime="text/csv")
+                        csv_tmp.seek(0)
+                        st.dataframe(pd.read_csv(csv_tmp, sep=";", nrows=5))
+
+    except Exception as e:
+        st.error(f"Erreur pendant l'extraction : {e}")
+
+elif launch and collection_codes:
+    st.info(f"Extraction en cours pour **{len(collection_codes)} collections**, période **{years or 'toutes'}**...")
 
-                if not details:
+    try:
+        # 1) Identifiants auteurs de chaque collection, dédoublonnés globalement
+        collections_by_person = defaultdict(set)
+        progress_collections = st.progress(0)
+        for idx, code in enumerate(collection_codes):
+            try:
+                _, collection_author_ids = collect_author_ids(code, years, use_facets)
+            except requests.exceptions.RequestException as e:
+                st.warning(f"⚠️ Collection {code} ignorée : {e}")
+                continue
+            for person_id in collection_author_ids:
+                collections_by_person[person_id].add(code)
+            progress_collections.progress((idx + 1) / len(collection_codes))
+        progress_collections.empty()
+
+        total_mentions = sum(len(c) for c in collections_by_person.values())
+        st.success(f"✅ {len(collections_by_person)} auteurs distincts ({total_mentions} occurrences sur l'ensemble des collections).")
+
+        if not collections_by_person:
+            st.warning("Aucune forme-auteur détectée. Vérifie les collections ou la période.")
+        else:
+            # 2) Une seule résolution par personne, via le cache persistant
+            with st.spinner("📡 Récupération des détails auteurs (cache + lots parallèles)..."):
+                forms_by_person, n_fetched = resolve_persons_cached(list(collections_by_person), FIELDS_LIST, get_author_cache())
+            st.info(f"{len(collections_by_person) - n_fetched} auteurs lus dans le cache, {n_fetched} demandés à HAL.")
+
+            # 3) Sortie combinée avec la correspondance collection → auteur
+            filename = f"formes_auteurs_multi_{len(collection_codes)}_collections_{years or 'all'}.csv"
+            with tempfile.NamedTemporaryFile("w+", encoding="utf-8", newline="", suffix=".csv") as csv_tmp:
+                n_forms = write_multi_collection_csv(csv_tmp, forms_by_person, collections_by_person, FIELDS_LIST)
+                if not n_forms:
                     st.error("Aucune forme-auteur récupérée.")
                 else:
-                    df = pd.DataFrame(details)
-                    requested_fields = [f.strip() for f in FIELDS_LIST.split(",")]
-                    df = df[[f for f in requested_fields if f in df.columns]]
-
-                    filename = f"formes_auteurs_{collection_code}_{years or 'all'}.csv"
-                    csv = df.to_csv(index=False, sep=";", encoding="utf-8")
+                    csv_tmp.seek(0)
+                    csv_content = csv_tmp.read()
 
-                    st.success(f"✅ Extraction terminée : {len(df)} formes-auteurs récupérées.")
-                    st.download_button("📥 Télécharger le CSV", csv, file_name=filename, mime="text/csv")
-                    st.dataframe(df.head())
+                    st.success(f"✅ Extraction terminée : {n_forms} formes-auteurs récupérées.")
+                    st.download_button("📥 Télécharger le CSV combiné", csv_content, file_name=filename, mime="text/csv")
+                    csv_tmp.seek(0)
+                    st.dataframe(pd.read_csv(csv_tmp, sep=";", nrows=5))
 
     except Exception as e:
         st.error(f"Erreur pendant l'extraction : {e}")
@@ -0,0 +1,63 @@
+# Empreinte mémoire d'une collection HAL importée : HalCollection compacte
+# contre l'ancien DataFrame (une ligne par titre, colonnes objets Python).
+#
+#     python benchmarks/bench_hal_collection_memory.py [--docs 50000] [--titles-per-doc 2]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import HalCollection  # noqa: E402
+
+WORDS = ("analysis", "model", "cancer", "climate", "learning", "protein", "network", "soil", "ocean",
+         "évaluation", "données", "patients", "risk", "imaging", "dynamics", "carbon", "cells", "trial")
+SUBMIT_TYPES = ("file", "notice", "annex")
+
+
+def synthetic_hal_docs(n_docs, titles_per_doc, seed=0):
+    """ Documents au format de l'API HAL (HAL_COLLECTION_FIELDS). """
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        titles = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() for _ in range(titles_per_doc)]
+        docs.append({
+            "docid": 1000000 + i,
+            "doiId_s": f"10.{rng.randint(1000, 9999)}/journal.{i}" if rng.random() < 0.8 else "",
+            "title_s": titles,
+            "submitType_s": rng.choice(SUBMIT_TYPES),
+            "linkExtUrl_s": f"https://europepmc.org/articles/PMC{i}" if rng.random() < 0.3 else "",
+            "linkExtId_s": "pubmedcentral" if rng.random() < 0.3 else "",
+            "uri_s": f"https://hal.science/hal-{i:08d}",
+            "pubmedId_s": str(30000000 + i) if rng.random() < 0.4 else "",
+        })
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mémoire HalCollection contre DataFrame par titre")
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--titles-per-doc", type=int, default=2)
+    args = parser.parse_args()
+
+    hal_docs = synthetic_hal_docs(args.docs, args.titles_per_doc)
+
+    start = time.perf_counter()
+    collection = HalCollection.from_hal_docs(hal_docs)
+    build_s = time.perf_counter() - start
+    compact_mb = collection.memory_usage() / 1e6
+
+    legacy_df = collection.to_dataframe()
+    legacy_mb = legacy_df.memory_usage(deep=True).sum() / 1e6
+
+    print(f"{args.docs} documents, {collection.num_titles} titres")
+    print(f"HalCollection         : {compact_mb:8.1f} MB (construction {build_s:.2f} s)")
+    print(f"DataFrame par titre   : {legacy_mb:8.1f} MB")
+    print(f"Rapport               : {legacy_mb / compact_mb:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Débit de génération TEI : generate_hal_xml (ElementTree) contre generate_hal_xml_fast
+# (squelette lxml) et iter_hal_xml (pool de processus), sur des publications synthétiques.
+#
+#     python benchmarks/bench_tei_generation.py [--records 10000] [--workers N]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hal_xml_export import TEI_EXPORT_WORKERS, generate_hal_xml, generate_hal_xml_fast, iter_hal_xml  # noqa: E402
+
+WORDS = ("analysis", "model", "cancer", "climate", "learning", "protein", "network", "Rennes", "océan",
+         "évaluation", "données", "a&b", "<tag>", "\"quoted\"", "l'été", "risk", "imaging", "carbon")
+
+
+def _words(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def random_publication(rng):
+    """ Publication au format attendu par generate_hal_xml, champs optionnels tirés au hasard. """
+    pub = {"Title": _words(rng, 4, 14)}
+    optional = {
+        "doi": lambda: f"10.{rng.randint(1000, 9999)}/x.{rng.randint(0, 10**6)}",
+        "pubmed": lambda: str(rng.randint(10**7, 4 * 10**7)),
+        "Source title": lambda: _words(rng, 1, 5),
+        "Date": lambda: rng.choice(["2023", "2024-05-02", float("nan"), None]),
+        "publisher": lambda: _words(rng, 1, 3),
+        "volume": lambda: str(rng.randint(1, 300)),
+        "issue": lambda: rng.choice([str(rng.randint(1, 12)), None]),
+        "pages": lambda: f"{rng.randint(1, 500)}-{rng.randint(501, 999)}",
+        "issn": lambda: f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        "eissn": lambda: f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        "keywords": lambda: [_words(rng, 1, 3) for _ in range(rng.randint(0, 6))],
+        "abstract": lambda: _words(rng, 20, 80),
+        "classCode": lambda: rng.choice(["ART", "COMM", "OUV"]),
+        "authors": lambda: [
+            {
+                "name": rng.choice(["", "Plato", f"{_words(rng, 1, 1)} {_words(rng, 1, 2)}"]),
+                "orcid": rng.choice(["", f"https://orcid.org/0000-0002-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"]),
+                "raw_affiliations": [_words(rng, 3, 8) for _ in range(rng.randint(0, 3))],
+            }
+            for _ in range(rng.randint(0, 12))
+        ],
+        "institutions": lambda: [
+            {
+                "ror": rng.choice(["", "05qec5a53", "https://ror.org/015m7wh34"]),
+                "display_name": _words(rng, 2, 5),
+                "type": rng.choice(["institution", "laboratory"]),
+                "country": rng.choice(["", "FR", "DE"]),
+            }
+            for _ in range(rng.randint(0, 4))
+        ],
+    }
+    for key, make_value in optional.items():
+        if rng.random() < 0.7:
+            pub[key] = make_value()
+    return pub
+
+
+def random_publications(n_records, seed=0):
+    rng = random.Random(seed)
+    return [random_publication(rng) for _ in range(n_records)]
+
+
+def _timed(label, generate, n_records):
+    start = time.perf_counter()
+    n_bytes = sum(len(xml_bytes) for xml_bytes in generate())
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32}: {elapsed:6.2f} s  ({n_records / elapsed:8.0f} TEI/s, {n_bytes / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit de génération des TEI HAL")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=TEI_EXPORT_WORKERS)
+    args = parser.parse_args()
+
+    publications = random_publications(args.records)
+    print(f"{args.records} publications, {os.cpu_count()} CPU")
+    _timed("generate_hal_xml (ElementTree)", lambda: map(generate_hal_xml, publications), args.records)
+    _timed("generate_hal_xml_fast (lxml)", lambda: map(generate_hal_xml_fast, publications), args.records)
+    _timed(f"iter_hal_xml ({args.workers} processus)",
+           lambda: iter_hal_xml(publications, n_workers=args.workers), args.records)
+
+
+if __name__ == "__main__":
+    main()
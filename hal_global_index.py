@@ -0,0 +1,364 @@
+# hal_global_index.py
+# ------------------------------------------------------------
+# Index local de tout HAL (DOI et titres normalisés) pour répondre
+# sans requête réseau aux tests "dans HAL mais hors de la collection"
+# quand le document est indexé (une absence est vérifiée auprès de l'API).
+#
+# - notices : base sqlite (docid, DOI, titres, type de dépôt, liens)
+# - clés    : table de hachage à adressage ouvert (numpy, mémoire mappée)
+# - négatifs rapides : filtre de Bloom (numpy, mémoire mappée)
+# Les tableaux d'une construction sont écrits dans un répertoire de génération ;
+# le fichier CURRENT désigne la génération en service et est remplacé atomiquement.
+#
+# Construction / mise à jour (récolte cursorMark, puis incrémentale
+# sur modifiedDate_tdate) ; les notices supprimées ou fusionnées dans
+# HAL sont retirées à chaque passage (liste complète des docid) :
+#     python hal_global_index.py build
+#     python hal_global_index.py refresh
+# ------------------------------------------------------------
+
+import os
+import json
+import calendar
+import sqlite3
+import hashlib
+import time
+import argparse
+import shutil
+import threading
+
+import numpy as np
+
+import http_client
+
+HAL_SEARCH_API = "https://api.archives-ouvertes.fr/search/"
+INDEX_FIELDS = "docid,doiId_s,title_s,submitType_s,linkExtUrl_s,linkExtId_s,uri_s"
+HARVEST_ROWS = 10000
+HAL_INDEX_DIR = os.environ.get(
+    "C2LABHAL_HAL_INDEX_DIR",
+    os.path.join(os.environ.get("C2LABHAL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "c2labhal")), "hal_index")
+)
+
+BLOOM_BITS_PER_KEY = 10   # ~1 % de faux positifs
+BLOOM_NUM_HASHES = 7
+TABLE_LOAD_FACTOR = 0.5
+ARRAY_NAMES = ("keys", "values", "bloom")
+CURRENT_POINTER = "CURRENT"
+GENERATIONS_KEPT = 2      # la génération précédente reste lisible par les processus qui l'ont ouverte
+HARVESTED_AT_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def doi_key(doi):
+    """ Clé DOI de l'index : minuscules, sans préfixe de résolveur. """
+    if not doi:
+        return ""
+    s = str(doi).strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "doi:", "doi.org/"):
+        s = s.replace(prefix, "")
+    return s
+
+
+def generation_dir(index_dir):
+    """ Répertoire des tableaux en service (désigné par CURRENT), ou None si l'index n'a pas été construit. """
+    try:
+        with open(os.path.join(index_dir, CURRENT_POINTER), encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(index_dir, name) if name else None
+
+
+def _hash64(key):
+    """ Empreinte 64 bits non nulle (0 marque une case vide de la table). """
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1
+
+
+class HalGlobalIndex:
+    """
+    Index en lecture : lookup_doi / lookup_title renvoient le document HAL
+    (dict au format de l'API) ou None. Le filtre de Bloom écarte la plupart
+    des clés absentes sans toucher la table de hachage ni la base sqlite ;
+    une empreinte trouvée est confirmée sur la notice (DOI ou titre normalisé).
+    Les trois tableaux sont lus dans la même génération (CURRENT à l'ouverture).
+    normalise_title doit être la normalisation utilisée à la construction (utils.normalise).
+    """
+
+    def __init__(self, index_dir=HAL_INDEX_DIR, normalise_title=None):
+        if normalise_title is None:
+            from utils import normalise as normalise_title
+        self.index_dir = index_dir
+        self.normalise_title = normalise_title
+        self.generation_dir = generation_dir(index_dir)
+        if self.generation_dir is None:
+            raise FileNotFoundError(f"index HAL non construit dans {index_dir}")
+        self.keys, self.values, self.bloom = (
+            np.load(os.path.join(self.generation_dir, f"{name}.npy"), mmap_mode="r") for name in ARRAY_NAMES
+        )
+        self._mask = len(self.keys) - 1
+        self._bloom_bits = len(self.bloom) * 8
+        self._conn = sqlite3.connect(os.path.join(index_dir, "docs.sqlite"), check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(index_dir=HAL_INDEX_DIR):
+        gen_dir = generation_dir(index_dir)
+        return (gen_dir is not None and os.path.isfile(os.path.join(index_dir, "docs.sqlite"))
+                and all(os.path.isfile(os.path.join(gen_dir, f"{name}.npy")) for name in ARRAY_NAMES))
+
+    def metadata(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT name, value FROM meta").fetchall()
+        return dict(rows)
+
+    def age_days(self):
+        """ Jours écoulés depuis le début de la dernière récolte, ou None si la date est inconnue. """
+        harvested_at = self.metadata().get("harvested_at")
+        if not harvested_at:
+            return None
+        return (time.time() - calendar.timegm(time.strptime(harvested_at, HARVESTED_AT_FORMAT))) / 86400
+
+    def _maybe_contains(self, h):
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        for i in range(BLOOM_NUM_HASHES):
+            bit = (h1 + i * h2) % self._bloom_bits
+            if not (self.bloom[bit >> 3] >> (bit & 7)) & 1:
+                return False
+        return True
+
+    def _lookup_key(self, key):
+        if not key:
+            return None
+        h = _hash64(key)
+        if not self._maybe_contains(h):
+            return None
+        pos = h & self._mask
+        while True:
+            stored = int(self.keys[pos])
+            if stored == 0:
+                return None
+            if stored == h:
+                return int(self.values[pos])
+            pos = (pos + 1) & self._mask
+
+    def _doc(self, docid):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT docid, doi, titles, submit_type, link_ext_url, link_ext_id, uri FROM docs WHERE docid = ?", (docid,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "docid": row[0], "doiId_s": row[1], "title_s": json.loads(row[2]), "submitType_s": row[3],
+            "linkExtUrl_s": row[4], "linkExtId_s": row[5], "uri_s": row[6],
+        }
+
+    def lookup_doi(self, doi):
+        key = doi_key(doi)
+        docid = self._lookup_key("doi:" + key)
+        doc = self._doc(docid) if docid is not None else None
+        # Collision d'empreintes 64 bits : la notice doit porter ce DOI
+        if doc is None or doi_key(doc["doiId_s"]) != key:
+            return None
+        return doc
+
+    def lookup_title(self, normalised_title):
+        docid = self._lookup_key("titre:" + normalised_title) if normalised_title else None
+        doc = self._doc(docid) if docid is not None else None
+        if doc is None or not any(self.normalise_title(title) == normalised_title for title in doc["title_s"]):
+            return None
+        return doc
+
+
+# ------------------------------------------------------------
+# Construction et mise à jour
+# ------------------------------------------------------------
+
+def _open_store(index_dir):
+    os.makedirs(index_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(index_dir, "docs.sqlite"))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS docs (docid INTEGER PRIMARY KEY, doi TEXT, titles TEXT, "
+        "submit_type TEXT, link_ext_url TEXT, link_ext_id TEXT, uri TEXT)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _harvest_pages(params, progress, label):
+    """ Pages de documents d'une récolte cursorMark de HAL (tri sur docid). """
+    params = dict(params, rows=HARVEST_ROWS, sort="docid asc", wt="json")
+    cursor_mark = "*"
+    n_docs = 0
+    while True:
+        params["cursorMark"] = cursor_mark
+        response = http_client.get(HAL_SEARCH_API, params=params, timeout=120, dedupe=False, route="hal-index")
+        response.raise_for_status()
+        data = response.json()
+        docs = data.get("response", {}).get("docs", [])
+        yield docs
+        n_docs += len(docs)
+        progress(f"{n_docs} {label}")
+        next_cursor_mark = data.get("nextCursorMark")
+        if not docs or not next_cursor_mark or next_cursor_mark == cursor_mark:
+            break
+        cursor_mark = next_cursor_mark
+
+
+def _start_live_docids(conn):
+    """ Table temporaire des docid présents dans HAL, remplie pendant une récolte complète. """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_docids (docid INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM live_docids")
+
+
+def _add_live_docids(conn, docs):
+    conn.executemany("INSERT OR IGNORE INTO live_docids VALUES (?)", [(int(doc["docid"]),) for doc in docs])
+
+
+def _remove_absent_docs(conn):
+    """ Supprime les notices absentes de live_docids ; rien si la liste est vide (récolte anormale). """
+    n_removed = 0
+    if conn.execute("SELECT 1 FROM live_docids LIMIT 1").fetchone() is not None:
+        n_removed = conn.execute("DELETE FROM docs WHERE docid NOT IN (SELECT docid FROM live_docids)").rowcount
+    conn.execute("DROP TABLE live_docids")
+    conn.commit()
+    return n_removed
+
+
+def harvest_docs(conn, modified_since=None, progress=print):
+    """
+    Récolte cursorMark de HAL (ou des notices modifiées depuis modified_since) dans la base sqlite.
+    Une récolte complète retire aussi les notices qui ne sont plus dans HAL.
+    Retourne (notices récoltées, notices retirées).
+    """
+    params = {"q": "*:*", "fl": INDEX_FIELDS}
+    if modified_since:
+        params["fq"] = f"modifiedDate_tdate:[{modified_since} TO *]"
+    else:
+        _start_live_docids(conn)
+    n_docs = 0
+    for docs in _harvest_pages(params, progress, "notices récoltées"):
+        conn.executemany(
+            "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(
+                int(doc["docid"]), doi_key(doc.get("doiId_s")),
+                json.dumps(doc.get("title_s", []) if isinstance(doc.get("title_s"), list) else [str(doc.get("title_s", ""))]),
+                doc.get("submitType_s", ""), doc.get("linkExtUrl_s", ""), doc.get("linkExtId_s", ""), doc.get("uri_s", ""),
+            ) for doc in docs]
+        )
+        if not modified_since:
+            _add_live_docids(conn, docs)
+        conn.commit()
+        n_docs += len(docs)
+    n_removed = 0 if modified_since else _remove_absent_docs(conn)
+    return n_docs, n_removed
+
+
+def sync_removed_docs(conn, progress=print):
+    """
+    Retire de la base les notices supprimées ou fusionnées dans HAL depuis la dernière récolte
+    (invisibles pour la récolte incrémentale) : liste complète des docid, sans les autres champs.
+    """
+    _start_live_docids(conn)
+    for docs in _harvest_pages({"q": "*:*", "fl": "docid"}, progress, "identifiants vérifiés"):
+        _add_live_docids(conn, docs)
+    return _remove_absent_docs(conn)
+
+
+def build_key_arrays(conn, index_dir, normalise_title):
+    """ (Re)construit la table de hachage et le filtre de Bloom à partir de la base sqlite. """
+    hashes = []
+    docids = []
+    for docid, doi, titles in conn.execute("SELECT docid, doi, titles FROM docs ORDER BY docid"):
+        if doi:
+            hashes.append(_hash64("doi:" + doi))
+            docids.append(docid)
+        for title in json.loads(titles):
+            title_norm = normalise_title(title)
+            if title_norm:
+                hashes.append(_hash64("titre:" + title_norm))
+                docids.append(docid)
+
+    size = 1
+    while size * TABLE_LOAD_FACTOR < max(len(hashes), 1):
+        size *= 2
+    mask = size - 1
+    keys = np.zeros(size, dtype=np.uint64)
+    values = np.zeros(size, dtype=np.int64)
+    for h, docid in zip(hashes, docids):
+        pos = h & mask
+        while keys[pos] != 0 and keys[pos] != h:
+            pos = (pos + 1) & mask
+        if keys[pos] == 0:  # première notice pour cette clé (docid le plus ancien)
+            keys[pos] = h
+            values[pos] = docid
+
+    n_bits = max(8, len(hashes) * BLOOM_BITS_PER_KEY)
+    bloom = np.zeros((n_bits + 7) // 8, dtype=np.uint8)
+    n_bits = len(bloom) * 8
+    if hashes:
+        h_arr = np.array(hashes, dtype=np.uint64)
+        h1 = h_arr & np.uint64(0xFFFFFFFF)
+        h2 = (h_arr >> np.uint64(32)) | np.uint64(1)
+        for i in range(BLOOM_NUM_HASHES):
+            bits = (h1 + np.uint64(i) * h2) % np.uint64(n_bits)
+            np.bitwise_or.at(bloom, (bits >> np.uint64(3)).astype(np.int64), (np.uint8(1) << (bits & np.uint64(7)).astype(np.uint8)))
+
+    # Nouvelle génération complète, puis bascule atomique de CURRENT : un lecteur voit
+    # toujours les trois tableaux d'une même construction
+    # Nom triable dans l'ordre des constructions, y compris plusieurs dans la même seconde
+    gen_name = time.strftime("gen-%Y%m%dT%H%M%S") + f"-{time.time_ns() % 10**9:09d}-{os.getpid()}"
+    gen_path = os.path.join(index_dir, gen_name)
+    os.makedirs(gen_path)
+    for name, array in zip(ARRAY_NAMES, (keys, values, bloom)):
+        np.save(os.path.join(gen_path, f"{name}.npy"), array)
+    pointer_tmp = os.path.join(index_dir, CURRENT_POINTER + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(gen_name)
+    os.replace(pointer_tmp, os.path.join(index_dir, CURRENT_POINTER))
+    _remove_old_generations(index_dir, gen_name)
+    return len(hashes)
+
+
+def _remove_old_generations(index_dir, current_name):
+    """ Supprime les générations au-delà de GENERATIONS_KEPT (les lecteurs ouverts gardent leurs fichiers mappés). """
+    generations = sorted(name for name in os.listdir(index_dir)
+                         if name.startswith("gen-") and os.path.isdir(os.path.join(index_dir, name)))
+    for name in generations[:-GENERATIONS_KEPT]:
+        if name == current_name:
+            continue
+        try:
+            shutil.rmtree(os.path.join(index_dir, name))
+        except OSError:
+            pass  # fichiers encore ouverts (Windows) : supprimés à la prochaine construction
+
+
+def build_index(index_dir=HAL_INDEX_DIR, normalise_title=None, incremental=False, progress=print):
+    """
+    Récolte complète (ou incrémentale depuis la dernière récolte, suivie du retrait des notices
+    supprimées dans HAL), puis reconstruction des clés.
+    normalise_title doit être la normalisation utilisée pour comparer les titres (utils.normalise).
+    """
+    if normalise_title is None:
+        from utils import normalise as normalise_title
+    conn = _open_store(index_dir)
+    meta = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+    started_at = time.strftime(HARVESTED_AT_FORMAT, time.gmtime())
+    modified_since = meta.get("harvested_at") if incremental else None
+    n_docs, n_removed = harvest_docs(conn, modified_since, progress)
+    if modified_since:
+        n_removed = sync_removed_docs(conn, progress)
+    n_keys = build_key_arrays(conn, index_dir, normalise_title)
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('harvested_at', ?)", (started_at,))
+    conn.commit()
+    conn.close()
+    progress(f"Index HAL : {n_docs} notices récoltées, {n_removed} retirées, {n_keys} clés indexées.")
+    return n_docs, n_keys
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index local HAL (DOI et titres normalisés)")
+    parser.add_argument("action", choices=["build", "refresh"], help="build : récolte complète ; refresh : notices modifiées depuis la dernière récolte, puis retrait des notices supprimées")
+    parser.add_argument("--dir", default=HAL_INDEX_DIR, help="répertoire de l'index")
+    args = parser.parse_args()
+    build_index(args.dir, incremental=args.action == "refresh")
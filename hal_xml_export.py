@@ -1,12 +1,33 @@
 import io
 import re
 import zipfile
+import tempfile
 import xml.etree.ElementTree as ET
 import pandas as pd
 import streamlit as st
 import traceback
 import json
 import ast
+import os
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    # Optionnel : génération TEI rapide (squelette pré-analysé)
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+# Au-delà de cette taille, le ZIP en cours d'écriture bascule de la mémoire vers un fichier temporaire
+ZIP_SPOOL_MAX_MEMORY = 32 * 1024 * 1024
+
+# Génération TEI en parallèle : nombre de processus, taille des lots, seuil en dessous duquel on reste séquentiel
+TEI_EXPORT_WORKERS = int(os.environ.get("C2LABHAL_EXPORT_WORKERS", str(os.cpu_count() or 1)))
+TEI_EXPORT_CHUNK_SIZE = 200
+TEI_PARALLEL_MIN_RECORDS = 1000
+
+# Pas de validation locale des XML contre aofr-sword.xsd : le schéma (et ceux qu'il importe)
+# n'est pas livré avec l'application ; la validation reste celle de HAL au dépôt SWORD.
 
 # ==============================
 # Utilitaires internes
@@ -336,53 +357,254 @@ def generate_hal_xml(pub_data):
 
 
 # ==============================
-# Génération du ZIP global
+# Génération XML HAL rapide (lxml + squelette TEI)
 # ==============================
 
-def generate_zip_from_xmls(publications_list):
-    """Génère un zip à partir de publications_list (liste de dicts).
-       Affiche du debug dans Streamlit pour chaque item.
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+# Partie fixe du TEI produite par generate_hal_xml, analysée une seule fois puis copiée
+TEI_SKELETON = (
+    '<TEI xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://www.tei-c.org/ns/1.0" '
+    'xmlns:hal="http://hal.archives-ouvertes.fr/" '
+    'xsi:schemaLocation="http://www.tei-c.org/ns/1.0 http://api.archives-ouvertes.fr/documents/aofr-sword.xsd">'
+    '<text><body><listBibl><biblFull>'
+    '<titleStmt/><seriesStmt/>'
+    '<notesStmt><note type="audience" n="2"/><note type="popular" n="0">No</note><note type="peer" n="1">Yes</note></notesStmt>'
+    '<sourceDesc><biblStruct>'
+    '<analytic><title xml:lang="en"/></analytic>'
+    '<monogr><title level="j"/><imprint><publisher/>'
+    '<biblScope unit="volume"/><biblScope unit="issue"/><biblScope unit="pp"/><date type="datePub"/>'
+    '</imprint></monogr>'
+    '</biblStruct></sourceDesc>'
+    '<profileDesc><langUsage><language ident="en"/></langUsage>'
+    '<textClass><classCode scheme="halTypology">Journal articles</classCode></textClass></profileDesc>'
+    '</biblFull></listBibl></body></text></TEI>'
+)
+
+_tei_skeleton_root = None
+
+
+def _tei(tag):
+    return f"{{{TEI_NS}}}{tag}"
+
+
+def _get_tei_skeleton():
+    global _tei_skeleton_root
+    if _tei_skeleton_root is None:
+        _tei_skeleton_root = LET.fromstring(TEI_SKELETON)
+    return _tei_skeleton_root
+
+
+def _lxml_sub(parent, tag, attrib=None, text=None):
+    el = LET.SubElement(parent, _tei(tag), attrib or {})
+    if text is not None:
+        el.text = text
+    return el
+
+
+def generate_hal_xml_fast(pub_data):
     """
-    st.info(f"🔧 generate_zip_from_xmls démarrée — {len(publications_list)} publications à traiter")
-    zip_buffer = io.BytesIO()
-    written_files = []  # debug: keep track of filenames actually written
+    Même TEI que generate_hal_xml (équivalent après canonicalisation C14N), construit en
+    copiant un squelette lxml pré-analysé puis en remplissant les champs de la publication.
+    Repli sur generate_hal_xml si lxml est absent ou refuse un texte (caractères de contrôle).
+    """
+    if LET is None:
+        return generate_hal_xml(pub_data)
+    try:
+        return _generate_hal_xml_lxml(pub_data)
+    except ValueError:
+        return generate_hal_xml(pub_data)
+
+
+def _generate_hal_xml_lxml(pub_data):
+    TEI = copy.deepcopy(_get_tei_skeleton())
+    text = TEI[0]
+    biblFull = text[0][0][0]
+    biblStruct = biblFull[3][0]
+    analytic, monogr = biblStruct[0], biblStruct[1]
+    imprint = monogr[1]
+    profileDesc = biblFull[4]
+    textClass = profileDesc[1]
+    lang_attr = {f"{{{XML_NS}}}lang": "en"}
+
+    analytic[0].text = _safe_text(pub_data.get("Title", ""))
+
+    for author in _ensure_list(pub_data.get("authors", [])):
+        author_el = _lxml_sub(analytic, "author", {"role": "aut"})
+        persName = _lxml_sub(author_el, "persName")
+        raw_name = _safe_text(author.get("name", ""))
+        name_parts = raw_name.split(" ", 1) if raw_name else []
+        if len(name_parts) == 2:
+            _lxml_sub(persName, "forename", {"type": "first"}, _safe_text(name_parts[0]))
+            _lxml_sub(persName, "surname", text=_safe_text(name_parts[1]))
+        elif len(name_parts) == 1:
+            _lxml_sub(persName, "surname", text=_safe_text(name_parts[0]))
+        else:
+            _lxml_sub(persName, "surname", text="")
+        if author.get("orcid"):
+            _lxml_sub(author_el, "idno", {"type": "ORCID"}, _safe_text(author.get("orcid")))
+        for raw_aff in _ensure_list(author.get("raw_affiliations", [])):
+            _lxml_sub(author_el, "rawAffs", text=_safe_text(raw_aff))
 
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for idx, pub in enumerate(publications_list):
-            try:
-                # debug: afficher statut source/Statut_HAL/Action
-                title_preview = (pub.get('Title') or pub.get('title') or "")[:120]
-                doi_preview = pub.get('doi') or ""
-                statut_hal = pub.get('Statut_HAL') or pub.get('statut_hal') or ""
-                action_val = pub.get('Action') or pub.get('action') or ""
+    # ISSN / eISSN avant le titre de la revue
+    if pub_data.get("eissn"):
+        idno = LET.Element(_tei("idno"), {"type": "eissn"})
+        idno.text = _safe_text(pub_data.get("eissn"))
+        monogr.insert(0, idno)
+    if pub_data.get("issn"):
+        idno = LET.Element(_tei("idno"), {"type": "issn"})
+        idno.text = _safe_text(pub_data.get("issn"))
+        monogr.insert(0, idno)
+    monogr[-2].text = _safe_text(pub_data.get("Source title", ""))
 
-                st.write(f"  · [{idx+1}/{len(publications_list)}] Titre: {title_preview}")
-                st.write(f"      DOI: {doi_preview} | Statut_HAL: {statut_hal} | Action: {action_val}")
+    imprint[0].text = _safe_text(pub_data.get("publisher", ""))
+    imprint[1].text = _safe_text(pub_data.get("volume", ""))
+    imprint[2].text = _safe_text(pub_data.get("issue", ""))
+    imprint[3].text = _safe_text(pub_data.get("pages", ""))
+    imprint[4].text = _safe_text(pub_data.get("Date", ""))
+
+    if pub_data.get("doi"):
+        _lxml_sub(biblStruct, "idno", {"type": "doi"}, _safe_text(pub_data.get("doi")))
+    if pub_data.get("pubmed"):
+        _lxml_sub(biblStruct, "idno", {"type": "pubmed"}, _safe_text(pub_data.get("pubmed")))
 
-                # Génération XML
-                xml_bytes = generate_hal_xml(pub)  # ta fonction
+    profileDesc[0][0].text = _safe_text(pub_data.get("language", "English"))
+
+    keywords = _ensure_list(pub_data.get("keywords", []))
+    if keywords:
+        kw_el = LET.Element(_tei("keywords"), {"scheme": "author"})
+        for kw in keywords:
+            _lxml_sub(kw_el, "term", lang_attr, _safe_text(kw))
+        textClass.insert(0, kw_el)
+    textClass[-1].set("n", _safe_text(pub_data.get("classCode", "ART")))
+
+    if pub_data.get("abstract"):
+        _lxml_sub(profileDesc, "abstract", lang_attr, _safe_text(pub_data.get("abstract")))
+
+    institutions = _ensure_list(pub_data.get("institutions", []))
+    if institutions:
+        back_el = _lxml_sub(text, "back")
+        listOrg = _lxml_sub(back_el, "listOrg", {"type": "structures"})
+        for idx, inst in enumerate(institutions):
+            org_el = _lxml_sub(listOrg, "org", {"type": inst.get("type", "institution"),
+                                                f"{{{XML_NS}}}id": f"localStruct-Aff{idx+1}"})
+            ror = _safe_text(inst.get("ror", ""))
+            if ror:
+                idno_val = ror if ror.startswith("http") else f"https://ror.org/{ror}"
+                _lxml_sub(org_el, "idno", {"type": "ROR"}, _safe_text(idno_val))
+            _lxml_sub(org_el, "orgName", text=_safe_text(inst.get("display_name", "")))
+            country = _safe_text(inst.get("country", ""))
+            if country:
+                addr = _lxml_sub(_lxml_sub(org_el, "desc"), "address")
+                _lxml_sub(addr, "country", {"key": country})
+
+    return LET.tostring(TEI, encoding="utf-8", xml_declaration=True)
+
+
+def _generate_hal_xml_chunk(publications_chunk):
+    """ Génère un lot de TEI (exécuté dans un processus) ; une erreur n'interrompt pas le lot. """
+    results = []
+    for pub in publications_chunk:
+        try:
+            results.append(generate_hal_xml_fast(pub))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def iter_hal_xml(publications_list, n_workers=None, chunk_size=TEI_EXPORT_CHUNK_SIZE):
+    """
+    Génère les TEI dans l'ordre de publications_list (bytes, ou l'exception levée pour
+    la publication). Au-delà de TEI_PARALLEL_MIN_RECORDS, les lots sont répartis
+    sur un pool de processus.
+    """
+    if n_workers is None:
+        n_workers = TEI_EXPORT_WORKERS
+    chunks = [publications_list[i:i + chunk_size] for i in range(0, len(publications_list), chunk_size)]
+    if n_workers <= 1 or len(publications_list) < TEI_PARALLEL_MIN_RECORDS:
+        for chunk in chunks:
+            yield from _generate_hal_xml_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        for chunk_results in executor.map(_generate_hal_xml_chunk, chunks):
+            yield from chunk_results
+
+
+# ==============================
+# Génération du ZIP global
+# ==============================
+
+def _unique_zip_name(base_name, used_names):
+    """Nom d'entrée ZIP unique : ajoute _2, _3... si _safe_filename produit un doublon."""
+    candidate = f"{base_name}.xml"
+    n = 1
+    while candidate.lower() in used_names:
+        n += 1
+        candidate = f"{base_name}_{n}.xml"
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def write_zip_from_xmls(publications_list, show_progress=True):
+    """Écrit les XML HAL de publications_list dans un ZIP temporaire (SpooledTemporaryFile).
+       Retourne (fichier positionné au début, liste des fichiers écrits).
+       La progression est affichée dans une seule barre Streamlit ; les erreurs sont regroupées.
+    """
+    total = len(publications_list)
+    zip_tmp = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_MEMORY, suffix=".zip")
+    written_files = []
+    errors = []
+    used_names = set()
+
+    progress_bar = st.progress(0, text=f"Génération des XML HAL : 0/{total}") if show_progress and total else None
+    # Mise à jour de la barre environ tous les 1 % (pas à chaque publication)
+    progress_step = max(1, total // 100)
+
+    with zipfile.ZipFile(zip_tmp, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for idx, (pub, xml_bytes) in enumerate(zip(publications_list, iter_hal_xml(publications_list))):
+            title_preview = _safe_text(pub.get('Title') or pub.get('title') or "")[:120]
+            try:
+                if isinstance(xml_bytes, Exception):
+                    raise xml_bytes
                 if not xml_bytes:
-                    st.warning(f"    ? generate_hal_xml a retourné None pour la pub {idx+1} ({title_preview})")
+                    errors.append(f"[{idx+1}] {title_preview} : generate_hal_xml a retourné un résultat vide")
                     continue
 
-                # filename sûr
-                filename = f"{_safe_filename(pub.get('Title','untitled'))}.xml"
+                filename = _unique_zip_name(_safe_filename(pub.get('Title', 'untitled')), used_names)
                 zip_file.writestr(filename, xml_bytes)
-                written_files.append({"filename": filename, "title": title_preview, "doi": doi_preview, "statut_hal": statut_hal, "action": action_val})
-
+                written_files.append({
+                    "filename": filename, "title": title_preview, "doi": pub.get('doi') or "",
+                    "statut_hal": pub.get('Statut_HAL') or pub.get('statut_hal') or "",
+                    "action": pub.get('Action') or pub.get('action') or ""
+                })
             except Exception as e:
-                st.error(f"Erreur lors de la génération XML pour index {idx} : {e}")
-                st.text(traceback.format_exc())
-                continue
+                errors.append(f"[{idx+1}] {title_preview} : {e}")
+            finally:
+                if progress_bar is not None and ((idx + 1) % progress_step == 0 or idx + 1 == total):
+                    progress_bar.progress((idx + 1) / total, text=f"Génération des XML HAL : {idx+1}/{total}")
 
-    zip_buffer.seek(0)
-    zip_bytes = zip_buffer.getvalue()
+    if progress_bar is not None:
+        progress_bar.empty()
+    if errors:
+        st.warning(f"{len(errors)} publication(s) non exportée(s) dans le ZIP.")
+        with st.expander("Détail des erreurs de génération XML"):
+            st.text("\n".join(errors))
 
-    st.info("✅ generate_zip_from_xmls terminée")
-    st.write("🗂 Fichiers écrits dans le ZIP :")
-    for w in written_files:
-        st.write(f" - {w['filename']} | DOI: {w['doi']} | Statut_HAL: {w['statut_hal']} | Action: {w.get('action','')}")
+    zip_tmp.seek(0)
+    return zip_tmp, written_files
 
-    return zip_bytes
 
-    
+def read_zip_file(zip_tmp):
+    """Contenu du ZIP temporaire pour st.download_button (seule copie complète en mémoire)."""
+    zip_tmp.seek(0)
+    return zip_tmp.read()
+
+
+def generate_zip_from_xmls(publications_list):
+    """Génère un zip (bytes) à partir de publications_list (liste de dicts).
+       Conservée pour compatibilité : write_zip_from_xmls évite la copie en mémoire.
+    """
+    zip_tmp, _ = write_zip_from_xmls(publications_list)
+    with zip_tmp:
+        return read_zip_file(zip_tmp)
@@ -0,0 +1,585 @@
+# http_client.py
+# ------------------------------------------------------------
+# Couche HTTP commune aux étapes du pipeline (HAL, Unpaywall,
+# oa.works, Crossref, OpenAlex, ...).
+#
+# Concurrence adaptative par hôte (AIMD) : la limite de requêtes
+# simultanées augmente de 1 après une série de réponses à latence
+# stable, et est divisée par deux sur 429 / 5xx / timeout / pic de
+# latence. L'état est partagé par toutes les étapes d'un processus.
+#
+# Disjoncteur par hôte : après C2LABHAL_BREAKER_FAILURES échecs
+# consécutifs (timeout, connexion, 5xx), les appels suivants échouent
+# immédiatement (ServiceUnavailable) ; une requête de test est laissée
+# passer toutes les C2LABHAL_BREAKER_COOLDOWN secondes, et le service
+# reprend dès qu'elle aboutit. Un 429 n'est ni un échec ni un succès :
+# l'hôte répond, mais ne prouve pas qu'il est rétabli.
+#
+# Requêtes doublées (hedge=True, désactivable par C2LABHAL_HEDGE=0) :
+# si la réponse dépasse le p95 observé pour ce type de requête (route), un
+# doublon est envoyé dès qu'une place de l'hôte se libère et la première
+# réponse est retenue ; au plus HEDGE_BUDGET des requêtes de l'hôte sont
+# doublées. La réponse perdante rend sa place sans être comptée.
+#
+# Requêtes GET identiques (même adresse, mêmes paramètres une fois
+# triés) : une seule requête HTTP par exécution, partagée par les appels
+# simultanés et réutilisée par les appels suivants. Chaque start_run()
+# ouvre une exécution propre au contexte de l'appelant (une session ne
+# vide pas les réponses d'une autre) ; les pools RunExecutor la
+# transmettent à leurs threads. Hors exécution, pas de déduplication.
+#
+# Réglage sans modifier le code :
+#     C2LABHAL_HOST_LIMITS="bg.api.oa.works=2:1:4,api.unpaywall.org=8:2:16"
+#     (hôte=initial:minimum:maximum)
+# ------------------------------------------------------------
+
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+# Limites (initiale, minimum, maximum) de requêtes simultanées par hôte
+DEFAULT_HOST_LIMITS = (4, 1, 10)
+HOST_LIMITS = {
+    "api.archives-ouvertes.fr": (6, 1, 16),
+    "api.openalex.org": (6, 1, 16),
+    "api.crossref.org": (4, 1, 10),
+    "api.unpaywall.org": (4, 1, 10),
+    "bg.api.oa.works": (2, 1, 6),
+    "api.elsevier.com": (2, 1, 4),
+}
+
+# Taille des pools de threads des étapes réseau : borne haute, la limite effective est celle de l'hôte
+HTTP_POOL_WORKERS = 16
+
+LATENCY_FLOOR = 1.0           # secondes : en dessous, jamais considéré comme un pic
+LATENCY_SPIKE_FACTOR = 3.0    # pic = latence > facteur x latence minimale récente
+LATENCY_EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200          # latences conservées pour les percentiles
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("C2LABHAL_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("C2LABHAL_BREAKER_COOLDOWN", "30"))
+HEDGE_ENABLED = os.environ.get("C2LABHAL_HEDGE", "1") != "0"
+HEDGE_BUDGET = float(os.environ.get("C2LABHAL_HEDGE_BUDGET", "0.03"))   # part maximale de requêtes doublées
+HEDGE_MIN_SAMPLES = 20        # latences observées avant de doubler (p95 significatif)
+HEDGE_MIN_DELAY = 0.05        # secondes
+
+SINGLE_FLIGHT_MAX_ENTRIES = 50000   # réponses conservées par exécution
+
+# Texte repris dans les statuts des lignes concernées (ex. "Unpaywall : service indisponible")
+SERVICE_UNAVAILABLE = "service indisponible"
+
+# Valeur de CircuitBreaker.allow() pour la requête de test d'un disjoncteur semi-ouvert
+PROBE = "sonde"
+
+
+class ServiceUnavailable(requests.exceptions.RequestException):
+    """ Appel court-circuité : le disjoncteur de l'hôte est ouvert. """
+
+    def __init__(self, host):
+        super().__init__(f"{host} : {SERVICE_UNAVAILABLE} (disjoncteur ouvert)")
+        self.host = host
+
+
+def _parse_host_limits(spec):
+    """ "hôte=initial:min:max,..." -> {hôte: (initial, min, max)} ; les entrées invalides sont ignorées. """
+    limits = {}
+    for item in (spec or "").split(","):
+        host, _, values = item.strip().partition("=")
+        try:
+            initial, minimum, maximum = (int(v) for v in values.split(":"))
+        except ValueError:
+            continue
+        if host and 1 <= minimum <= initial <= maximum:
+            limits[host.lower()] = (initial, minimum, maximum)
+    return limits
+
+
+HOST_LIMITS.update(_parse_host_limits(os.environ.get("C2LABHAL_HOST_LIMITS")))
+
+
+class HostConcurrency:
+    """
+    Limite de requêtes simultanées d'un hôte, ajustée en AIMD.
+    acquire() bloque tant que la limite est atteinte ; release() enregistre la latence
+    et le résultat (surcharge ou non) de la requête.
+    """
+
+    def __init__(self, host, initial, minimum, maximum):
+        self.host = host
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.n_requests = 0
+        self.n_overloads = 0
+        self.n_hedged = 0
+        self.n_hedge_wins = 0
+        self.latency_ewma = None
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        # Latences par type de requête (route) : une page de récolte n'est pas comparée à une recherche unitaire
+        self._route_latencies = {}
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """ Attend une place ; False si aucune ne s'est libérée en timeout secondes. """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def record_hedge(self):
+        with self._cond:
+            self.n_hedged += 1
+
+    def hedge_delay(self, route):
+        """ p95 des latences de ce type de requête, ou None si trop peu de mesures ou budget épuisé. """
+        with self._cond:
+            latencies = self._route_latencies.get(route)
+            if not latencies or len(latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            if self.n_hedged >= HEDGE_BUDGET * self.n_requests:
+                return None
+            ordered = sorted(latencies)
+        return max(HEDGE_MIN_DELAY, ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))])
+
+    def record_hedge_win(self):
+        with self._cond:
+            self.n_hedge_wins += 1
+
+    def cancel(self):
+        """ Libère une place obtenue par acquire() sans qu'aucune requête n'ait été envoyée. """
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def release(self, latency, overloaded=False, route=None):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.on_overload()
+            else:
+                self.on_success(latency, route)
+            self._cond.notify_all()
+
+    def on_success(self, latency, route=None):
+        with self._cond:
+            self.n_requests += 1
+            # Référence : latence minimale récente du même type de requête (hôte peu chargé),
+            # qui ne dérive pas avec la charge
+            route_latencies = self._route_latencies.setdefault(route, deque(maxlen=LATENCY_WINDOW))
+            spike = bool(route_latencies) and latency > max(LATENCY_FLOOR, LATENCY_SPIKE_FACTOR * min(route_latencies))
+            route_latencies.append(latency)
+            self._latencies.append(latency)
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma
+            )
+            if spike:
+                self._decrease()
+                return
+            self._successes += 1
+            # Augmentation additive une fois par "fenêtre" (limit réponses à latence stable)
+            if self._successes >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1)
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_overload(self):
+        with self._cond:
+            self.n_requests += 1
+            self.n_overloads += 1
+            self._decrease()
+
+    def _decrease(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
+
+    def latency_percentile(self, q):
+        with self._cond:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self):
+        return {
+            "hôte": self.host,
+            "limite": self.limit,
+            "min": self.minimum,
+            "max": self.maximum,
+            "en cours": self.in_flight,
+            "requêtes": self.n_requests,
+            "surcharges": self.n_overloads,
+            "requêtes doublées": self.n_hedged,
+            "gagnées par le doublon": self.n_hedge_wins,
+            "latence moyenne (s)": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latence p50 (s)": self.latency_percentile(0.5),
+            "latence p95 (s)": self.latency_percentile(0.95),
+        }
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un hôte : fermé (appels normaux), ouvert (appels refusés), puis
+    semi-ouvert après BREAKER_COOLDOWN secondes : une seule requête de test passe ;
+    son succès referme le disjoncteur, son échec le rouvre, un 429 la rend (release_probe)
+    pour qu'une autre requête de test soit tentée.
+    """
+
+    def __init__(self, host, failure_threshold=None, cooldown=None):
+        self.host = host
+        self.failure_threshold = failure_threshold or BREAKER_FAILURE_THRESHOLD
+        self.cooldown = BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.state = "fermé"
+        self.consecutive_failures = 0
+        self.n_short_circuited = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ None : appel refusé ; PROBE : requête de test (semi-ouvert) ; True : appel normal. """
+        with self._lock:
+            if self.state == "fermé":
+                return True
+            if self.state == "ouvert" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "semi-ouvert"
+            if self.state == "semi-ouvert" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return PROBE
+            self.n_short_circuited += 1
+            return None
+
+    def reject_queued(self, probe=False):
+        """
+        Refuse un appel qui attendait une place alors que le disjoncteur n'est plus fermé :
+        seule la requête de test passe tant que l'hôte n'est pas rétabli.
+        """
+        with self._lock:
+            if self.state == "fermé" or probe:
+                return False
+            self.n_short_circuited += 1
+            return True
+
+    def release_probe(self):
+        """ Requête de test sans verdict (429) : le disjoncteur reste semi-ouvert, une autre pourra passer. """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "fermé"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "semi-ouvert" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "ouvert"
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        return {
+            "disjoncteur": self.state,
+            "échecs consécutifs": self.consecutive_failures,
+            "appels court-circuités": self.n_short_circuited,
+        }
+
+
+class SingleFlight:
+    """
+    Déduplication des requêtes identiques d'une exécution : un seul appel en vol par clé
+    (les appels simultanés attendent son résultat), puis réutilisation de la réponse
+    si elle est exploitable (statut < 500 et différent de 429).
+    """
+
+    def __init__(self, max_entries=SINGLE_FLIGHT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._responses = {}
+        self.n_calls = 0
+        self.n_saved = 0
+
+    def do(self, key, send):
+        with self._lock:
+            self.n_calls += 1
+            if key in self._responses:
+                self.n_saved += 1
+                return self._responses[key]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.n_saved += 1
+        if not owner:
+            return future.result()
+
+        try:
+            response = send()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        with self._lock:
+            if response.status_code < 500 and response.status_code != 429 and len(self._responses) < self.max_entries:
+                self._responses[key] = response
+        future.set_result(response)
+        return response
+
+    def report(self):
+        with self._lock:
+            return {"appels": self.n_calls, "appels évités": self.n_saved}
+
+
+# Exécution courante (SingleFlight ouvert par start_run()), propre à chaque contexte
+_current_run = contextvars.ContextVar("c2labhal_http_run", default=None)
+
+
+def request_key(method, url, params=None):
+    """ Clé canonique : méthode, adresse (schéma et hôte en minuscules) et paramètres triés. """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((str(k), str(v)) for k, v in (params.items() if isinstance(params, dict) else params))
+    base = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, "", ""))
+    return method.upper(), base, urlencode(sorted(query))
+
+
+def start_run():
+    """
+    Début d'une exécution dans le contexte courant : réponses et compteurs neufs, sans
+    toucher aux exécutions des autres sessions. Les threads doivent venir d'un RunExecutor.
+    """
+    run = SingleFlight()
+    _current_run.set(run)
+    return run
+
+
+def single_flight_report():
+    """ Appels GET reçus et appels évités (déjà en vol ou déjà faits) depuis start_run() dans ce contexte. """
+    run = _current_run.get()
+    return run.report() if run is not None else {"appels": 0, "appels évités": 0}
+
+
+class RunExecutor(ThreadPoolExecutor):
+    """ ThreadPoolExecutor dont les tâches s'exécutent dans le contexte de l'appelant (exécution de start_run()). """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+_controllers = {}
+_breakers = {}
+# Threads des requêtes doublées (la requête initiale et son doublon y sont exécutés)
+_hedge_executor = ThreadPoolExecutor(max_workers=2 * HTTP_POOL_WORKERS, thread_name_prefix="c2labhal-hedge")
+_controllers_lock = threading.Lock()
+
+
+def host_of(url):
+    return (urlsplit(url).hostname or "").lower()
+
+
+def host_controller(url_or_host):
+    """ Contrôleur partagé (un par hôte et par processus). """
+    host = host_of(url_or_host) if "/" in url_or_host else url_or_host.lower()
+    with _controllers_lock:
+        controller = _controllers.get(host)
+        if controller is None:
+            controller = HostConcurrency(host, *HOST_LIMITS.get(host, DEFAULT_HOST_LIMITS))
+            _controllers[host] = controller
+        return controller
+
+
+def host_breaker(url_or_host):
+    """ Disjoncteur partagé (un par hôte et par processus). """
+    host = host_of(url_or_host) if "/" in url_or_host else url_or_host.lower()
+    with _controllers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+        return breaker
+
+
+def _route(method, url, name=None):
+    """
+    Type de requête pour la référence de latence et le p95 des doublons : le nom donné
+    par l'appelant (ex. "hal-doi", "hal-import"), sinon méthode + premier segment du chemin.
+    """
+    if name:
+        return name
+    return method, "/" + urlsplit(url).path.strip("/").split("/")[0]
+
+
+def concurrency_report():
+    """ Limites courantes, latences observées et état du disjoncteur, une ligne par hôte contacté. """
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+        breakers = dict(_breakers)
+    report = []
+    for controller in controllers:
+        row = controller.snapshot()
+        if controller.host in breakers:
+            row.update(breakers[controller.host].snapshot())
+        report.append(row)
+    return report
+
+
+class _HedgeRace:
+    """ Requête initiale contre doublon : la première réponse reçue gagne, les suivantes sont ignorées. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner = None
+        self.closed = False
+
+    def claim(self, who):
+        with self._lock:
+            if self.winner is None and not self.closed:
+                self.winner = who
+                return True
+            return False
+
+    def settled(self):
+        with self._lock:
+            return self.winner is not None or self.closed
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+
+
+def _send(controller, breaker, method, url, route, kwargs, probe=False, race=None, who=None):
+    """
+    Envoie la requête (place déjà obtenue) et met à jour la concurrence et le disjoncteur :
+    échec sur exception ou 5xx, succès sur toute autre réponse sauf 429 (neutre).
+    race (requêtes doublées) : une réponse arrivée après la gagnante ne fait que rendre sa place.
+    """
+    started = time.monotonic()
+    overloaded = False
+    failed = True
+    throttled = False
+    answered = False
+    try:
+        response = requests.request(method, url, **kwargs)
+        answered = True
+        throttled = response.status_code == 429
+        failed = response.status_code >= 500
+        overloaded = throttled or failed
+        return response
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        overloaded = True
+        raise
+    finally:
+        lost = race is not None and (not race.claim(who) if answered else race.settled())
+        if lost:
+            # Perdante d'une requête doublée : ni latence, ni surcharge, ni verdict du disjoncteur
+            controller.cancel()
+        else:
+            controller.release(time.monotonic() - started, overloaded, route=route)
+            if failed:
+                breaker.record_failure()
+            elif not throttled:
+                breaker.record_success()
+            elif probe:
+                breaker.release_probe()
+
+
+def _backup_send(controller, breaker, method, url, route, kwargs, race):
+    """ Doublon : attend une place sous la limite de l'hôte, abandonné si la requête initiale a déjà abouti. """
+    while not controller.acquire(timeout=HEDGE_MIN_DELAY):
+        if race.settled():
+            return None
+    if race.settled():
+        controller.cancel()
+        return None
+    controller.record_hedge()
+    return _send(controller, breaker, method, url, route, kwargs, race=race, who="doublon")
+
+
+def _hedged_send(controller, breaker, method, url, route, kwargs, delay):
+    """ Requête initiale, puis doublon si aucune réponse après delay secondes ; la première réponse gagne. """
+    race = _HedgeRace()
+    primary = _hedge_executor.submit(_send, controller, breaker, method, url, route, kwargs, race=race, who="initiale")
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+    if breaker.state != "fermé":
+        return primary.result()
+    backup = _hedge_executor.submit(_backup_send, controller, breaker, method, url, route, kwargs, race)
+
+    pending = {primary, backup}
+    first_error = None
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if race.winner == "doublon":
+                controller.record_hedge_win()
+                return backup.result()
+            if race.winner == "initiale":
+                return primary.result()
+            for future in done:
+                first_error = first_error or future.exception()
+        raise first_error
+    finally:
+        race.close()
+
+
+def request(method, url, hedge=False, dedupe=None, route=None, **kwargs):
+    """
+    requests.request soumis au disjoncteur et à la limite de concurrence de l'hôte.
+    Lève ServiceUnavailable (une RequestException) si le disjoncteur est ouvert.
+    hedge=True (requêtes idempotentes uniquement) : doublon envoyé au-delà du p95 observé.
+    dedupe (par défaut : GET uniquement) : requêtes identiques partagées au sein de
+    l'exécution courante (start_run) ; False pour les pages de récolte, qui ne se répètent pas.
+    route : nom du type de requête (ex. "hal-doi", "hal-import") ; la détection des pics de
+    latence et le délai des doublons ne comparent que des requêtes de même route.
+    """
+    if dedupe is None:
+        dedupe = method.upper() == "GET"
+    run = _current_run.get() if dedupe else None
+    if run is not None:
+        key = request_key(method, url, kwargs.get("params"))
+        return run.do(key, lambda: _request(method, url, hedge, route, kwargs))
+    return _request(method, url, hedge, route, kwargs)
+
+
+def _request(method, url, hedge, route, kwargs):
+    route = _route(method, url, route)
+    breaker = host_breaker(url)
+    allowed = breaker.allow()
+    if not allowed:
+        raise ServiceUnavailable(breaker.host)
+    probe = allowed == PROBE
+    controller = host_controller(url)
+    controller.acquire()
+    if breaker.reject_queued(probe):
+        controller.cancel()
+        raise ServiceUnavailable(breaker.host)
+    delay = None if probe or not (hedge and HEDGE_ENABLED and breaker.state == "fermé") else controller.hedge_delay(route)
+    if delay is None:
+        return _send(controller, breaker, method, url, route, kwargs, probe)
+    return _hedged_send(controller, breaker, method, url, route, kwargs, delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
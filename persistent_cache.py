@@ -0,0 +1,92 @@
+# persistent_cache.py
+# ------------------------------------------------------------
+# Cache clé/valeur persistant (sqlite) partagé par les applications :
+# permissions oa.works, récoltes par année, historique des exécutions,
+# notices ref/author de l'extracteur.
+# ------------------------------------------------------------
+
+import os
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get("C2LABHAL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "c2labhal"))
+
+
+class PersistentCache:
+    """
+    Cache clé/valeur persistant (sqlite) avec durée de validité (TTL).
+    Les valeurs sont sérialisées en JSON ; un espace de noms sépare les usages
+    (permissions, récoltes, ...). Si le répertoire n'est pas accessible en écriture,
+    le cache reste en mémoire pour la durée de l'exécution.
+    """
+
+    def __init__(self, namespace, ttl_seconds, path=None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if path is None:
+            path = os.path.join(CACHE_DIR, "c2labhal_cache.sqlite")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        except (OSError, sqlite3.Error):
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, "
+                "stored_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            self._conn.commit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+        if row is None:
+            return default
+        value, stored_at = row
+        if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+            return default
+        return json.loads(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), time.time())
+            )
+            self._conn.commit()
+
+    def items(self, prefix=""):
+        """ {clé: valeur} des entrées encore valides dont la clé commence par prefix. """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, stored_at FROM cache WHERE namespace = ? AND substr(key, 1, ?) = ?",
+                (self.namespace, len(prefix), prefix)
+            ).fetchall()
+        now = time.time()
+        return {
+            key: json.loads(value) for key, value, stored_at in rows
+            if self.ttl_seconds is None or now - stored_at <= self.ttl_seconds
+        }
+
+    def set_many(self, entries):
+        """ Enregistre {clé: valeur} en une seule transaction. """
+        stored_at = time.time()
+        rows = [(self.namespace, key, json.dumps(value), stored_at) for key, value in entries.items()]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
@@ -5,12 +5,13 @@ import io
 # Supprimé: requests, json, metapub, regex, unidecode, unicodedata, difflib, langdetect, tqdm, concurrent
 # Ces imports sont maintenant dans utils.py
 
+import http_client
 # Importer les fonctions et constantes partagées depuis utils.py
 from utils import (
     get_scopus_data, get_openalex_data, get_pubmed_data, convert_to_dataframe,
-    clean_doi, HalCollImporter, merge_rows_with_sources, get_authors_from_crossref,
-    check_df, enrich_w_upw_parallel, add_permissions_parallel, deduce_todo,
-    normalise, normalize_name, get_initial_form # normalise est utilisé par HalCollImporter et check_df via statut_titre
+    clean_doi, HalCollImporter, fetch_years_cached, RunHistory, merge_rows_with_sources, resolve_authors,
+    check_df, enrich_oa_status, add_permissions_by_journal, flag_rows_for_retry, deduce_todo, display_http_report,
+    normalise, ResearcherIndex # normalise est utilisé par HalCollImporter et check_df via statut_titre
 )
 # Les constantes comme HAL_API_ENDPOINT, etc., sont utilisées par les fonctions dans utils.py
 
@@ -70,11 +71,12 @@ def main():
         end_year = st.number_input("Année de fin", min_value=1900, max_value=2100, value=pd.Timestamp.now().year) 
 
     with st.expander("🔧 Options avancées"):
-        fetch_authors = st.checkbox("🧑‍🔬 Récupérer les auteurs via Crossref", value=False)
+        delta_run = st.checkbox("♻️ Ne revérifier que les publications nouvelles ou non résolues depuis la dernière exécution", value=True)
+        fetch_authors = st.checkbox("🧑‍🔬 Récupérer les auteurs (OpenAlex, puis Crossref)", value=False)
         compare_authors = False
         uploaded_authors_file = None
         if fetch_authors:
-            compare_authors = st.checkbox("🔍 Comparer les auteurs Crossref avec ma liste de chercheurs", value=False)
+            compare_authors = st.checkbox("🔍 Comparer les auteurs avec ma liste de chercheurs", value=False)
             if compare_authors:
                 uploaded_authors_file = st.file_uploader(
                     "📤 Téléversez un fichier CSV avec la liste des chercheurs du labo (colonnes: 'collection', 'prénom nom')", 
@@ -86,6 +88,7 @@ def main():
     progress_text_area = st.empty() 
 
     if st.button("🚀 Lancer la recherche et la comparaison"):
+        http_client.start_run()
         scopus_api_key_secret = st.secrets.get("SCOPUS_API_KEY")
         pubmed_api_key_secret = st.secrets.get("PUBMED_API_KEY")
         
@@ -98,6 +101,7 @@ def main():
 
         scopus_df = pd.DataFrame()
         openalex_df = pd.DataFrame()
+        openalex_works = [] # notices OpenAlex brutes, réutilisées pour les auteurs
         pubmed_df = pd.DataFrame()
         
         # --- Étape 1 : Récupération des données OpenAlex ---
@@ -105,9 +109,13 @@ def main():
             with st.spinner("Récupération OpenAlex..."):
                 progress_text_area.info("Étape 1/9 : Récupération des données OpenAlex...")
                 progress_bar.progress(5)
-                openalex_query = f"authorships.institutions.id:{openalex_institution_id},publication_year:{start_year}-{end_year}"
-                openalex_data = get_openalex_data(openalex_query, max_items=5000) 
+                openalex_data, _ = fetch_years_cached(
+                    "openalex", openalex_institution_id, start_year, end_year,
+                    lambda year: get_openalex_data(f"authorships.institutions.id:{openalex_institution_id},publication_year:{year}", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if openalex_data:
+                    openalex_works = openalex_data
                     openalex_df = convert_to_dataframe(openalex_data, 'openalex')
                     openalex_df['Source title'] = openalex_df.apply(
                         lambda row: row.get('primary_location', {}).get('source', {}).get('display_name') if isinstance(row.get('primary_location'), dict) and row['primary_location'].get('source') else None, axis=1
@@ -130,8 +138,11 @@ def main():
         if pubmed_query_input:
             with st.spinner("Récupération PubMed..."):
                 progress_text_area.info("Étape 2/9 : Récupération des données PubMed...")
-                pubmed_full_query = f"({pubmed_query_input}) AND ({start_year}/01/01[Date - Publication] : {end_year}/12/31[Date - Publication])"
-                pubmed_data = get_pubmed_data(pubmed_full_query, max_items=5000) 
+                pubmed_data, _ = fetch_years_cached(
+                    "pubmed", pubmed_query_input, start_year, end_year,
+                    lambda year: get_pubmed_data(f"({pubmed_query_input}) AND ({year}/01/01[Date - Publication] : {year}/12/31[Date - Publication])", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if pubmed_data:
                     pubmed_df = pd.DataFrame(pubmed_data) 
                 st.success(f"{len(pubmed_df)} publications trouvées sur PubMed.")
@@ -141,8 +152,11 @@ def main():
         if scopus_lab_id and scopus_api_key_secret:
             with st.spinner("Récupération Scopus..."):
                 progress_text_area.info("Étape 3/9 : Récupération des données Scopus...")
-                scopus_query = f"AF-ID({scopus_lab_id}) AND PUBYEAR > {start_year - 1} AND PUBYEAR < {end_year + 1}"
-                scopus_data = get_scopus_data(scopus_api_key_secret, scopus_query, max_items=5000)
+                scopus_data, _ = fetch_years_cached(
+                    "scopus", scopus_lab_id, start_year, end_year,
+                    lambda year: get_scopus_data(scopus_api_key_secret, f"AF-ID({scopus_lab_id}) AND PUBYEAR > {year - 1} AND PUBYEAR < {year + 1}", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if scopus_data:
                     scopus_df_raw = convert_to_dataframe(scopus_data, 'scopus')
                     required_scopus_cols = {'dc:title', 'prism:doi', 'dc:identifier', 'prism:publicationName', 'prism:coverDate'}
@@ -198,8 +212,8 @@ def main():
         combined_df['doi'] = s_doi.replace(valeurs_a_remplacer_par_na, pd.NA)
 
         # --- Maintenant, séparer les lignes ---
-        with_doi_df = combined_df[combined_df['doi'].notna()].copy()
-        without_doi_df = combined_df[combined_df['doi'].isna()].copy()
+        with_doi_df = combined_df[combined_df['doi'].notna()]
+        without_doi_df = combined_df[combined_df['doi'].isna()]
 
         
         merged_data_doi = pd.DataFrame()
@@ -213,7 +227,7 @@ def main():
         
         merged_data_no_doi = pd.DataFrame()
         if not without_doi_df.empty:
-            merged_data_no_doi = without_doi_df.copy() 
+            merged_data_no_doi = without_doi_df
         
       
         merged_data = pd.concat([merged_data_doi, merged_data_no_doi], ignore_index=True)
@@ -227,7 +241,7 @@ def main():
             with st.spinner(f"Import de la collection HAL '{collection_a_chercher}'..."):
                 progress_text_area.info(f"Étape 6a/9 : Import de la collection HAL '{collection_a_chercher}'...")
                 coll_importer = HalCollImporter(collection_a_chercher, start_year, end_year)
-                coll_df = coll_importer.import_data() 
+                coll_df = coll_importer.import_data_cached() 
                 if coll_df.empty:
                     st.warning(f"La collection HAL '{collection_a_chercher}' est vide ou n'a pas pu être chargée pour les années {start_year}-{end_year}.")
                 else:
@@ -235,25 +249,36 @@ def main():
         else: 
             st.info("Aucun code de collection HAL fourni. La comparaison se fera avec l'ensemble de HAL (peut être long et moins précis).")
         
+        # Exécution différentielle : les publications déjà résolues lors d'une exécution récente sont reprises
+        run_history = RunHistory(collection_a_chercher) if delta_run and collection_a_chercher else None
+        reused_df = pd.DataFrame()
+        if run_history is not None:
+            merged_data, reused_df = run_history.split(merged_data)
+            st.info(f"Exécution différentielle : {len(merged_data)} publication(s) à vérifier, {len(reused_df)} reprise(s) de l'exécution précédente.")
+
         progress_text_area.info("Étape 6b/9 : Comparaison avec les données HAL...")
-        final_df = check_df(merged_data.copy(), coll_df, progress_bar_st=progress_bar, progress_text_st=progress_text_area) 
+        final_df = check_df(merged_data, coll_df, progress_bar_st=progress_bar, progress_text_st=progress_text_area) 
         st.success("Comparaison avec HAL terminée.")
         # progress_bar est géré par check_df, donc pas besoin de le mettre à jour ici explicitement à 60%
 
         # --- Étape 7 : Enrichissement Unpaywall ---
         with st.spinner("Enrichissement Unpaywall..."):
             progress_text_area.info("Étape 7/9 : Enrichissement avec Unpaywall...")
-            final_df = enrich_w_upw_parallel(final_df.copy()) 
+            final_df = enrich_oa_status(final_df, openalex_works) 
             st.success("Enrichissement Unpaywall terminé.")
         progress_bar.progress(70)
 
         # --- Étape 8 : Ajout des permissions de dépôt (OA.Works) ---
         with st.spinner("Récupération des permissions de dépôt (OA.Works)..."):
             progress_text_area.info("Étape 8/9 : Récupération des permissions de dépôt...")
-            final_df = add_permissions_parallel(final_df.copy()) 
+            final_df = add_permissions_by_journal(final_df, openalex_works) 
             st.success("Récupération des permissions terminée.")
+        final_df = flag_rows_for_retry(final_df)
         progress_bar.progress(80)
 
+        if not reused_df.empty:
+            final_df = pd.concat([final_df, reused_df], ignore_index=True)
+
         # --- Étape 9 : Déduction des actions et récupération des auteurs (si cochée) ---
         progress_text_area.info("Étape 9/9 : Déduction des actions et traitement des auteurs...")
         if 'Action' not in final_df.columns: 
@@ -261,18 +286,9 @@ def main():
         final_df['Action'] = final_df.apply(deduce_todo, axis=1)
         
         if fetch_authors:
-            with st.spinner("Récupération des auteurs via Crossref..."):
+            with st.spinner("Récupération des auteurs (OpenAlex, puis Crossref)..."):
                 if 'doi' in final_df.columns:
-                    # Utiliser ThreadPoolExecutor directement ici pour get_authors_from_crossref
-                    from concurrent.futures import ThreadPoolExecutor
-                    from tqdm import tqdm
-
-                    dois_for_authors = final_df['doi'].fillna("").tolist()
-                    authors_results = []
-                    with ThreadPoolExecutor(max_workers=10) as executor:
-                        authors_results = list(tqdm(executor.map(get_authors_from_crossref, dois_for_authors), total=len(dois_for_authors), desc="Récupération auteurs Crossref"))
-                    
-                    final_df['Auteurs_Crossref'] = ['; '.join(author_list) if isinstance(author_list, list) and not any("Erreur" in str(a) or "Timeout" in str(a) for a in author_list) else (author_list[0] if isinstance(author_list, list) and author_list else '') for author_list in authors_results]
+                    final_df['Auteurs_Crossref'], final_df['Source auteurs'] = resolve_authors(final_df['doi'], openalex_works)
                     st.success("Récupération des auteurs terminée.")
                 else:
                     st.warning("Colonne 'doi' non trouvée, impossible de récupérer les auteurs.")
@@ -291,34 +307,8 @@ def main():
                             if not noms_ref_list:
                                 st.warning(f"Aucun chercheur trouvé pour la collection '{collection_a_chercher}' dans le fichier fourni.")
                             else:
-                                chercheur_map_norm = {normalize_name(n): n for n in noms_ref_list} 
-                                initial_map_norm = {get_initial_form(normalize_name(n)): n for n in noms_ref_list} 
-                                
-                                from difflib import get_close_matches # S'assurer de l'import si pas global à utils
-
-                                def detect_known_authors_optimized(authors_crossref_str):
-                                    if pd.isna(authors_crossref_str) or not str(authors_crossref_str).strip() or "Erreur" in authors_crossref_str or "Timeout" in authors_crossref_str :
-                                        return ""
-                                    
-                                    authors_from_pub = [a.strip() for a in str(authors_crossref_str).split(';') if a.strip()]
-                                    noms_detectes_originaux = set() 
-
-                                    for author_pub_orig in authors_from_pub:
-                                        author_pub_norm = normalize_name(author_pub_orig) 
-                                        author_pub_initial_norm = get_initial_form(author_pub_norm) 
-
-                                        match_complet = get_close_matches(author_pub_norm, chercheur_map_norm.keys(), n=1, cutoff=0.85) 
-                                        if match_complet:
-                                            noms_detectes_originaux.add(chercheur_map_norm[match_complet[0]])
-                                            continue 
-
-                                        match_initial = get_close_matches(author_pub_initial_norm, initial_map_norm.keys(), n=1, cutoff=0.9) 
-                                        if match_initial:
-                                            noms_detectes_originaux.add(initial_map_norm[match_initial[0]])
-                                            
-                                    return "; ".join(sorted(list(noms_detectes_originaux))) if noms_detectes_originaux else ""
-
-                                final_df['Auteurs_Laboratoire_Détectés'] = final_df['Auteurs_Crossref'].apply(detect_known_authors_optimized)
+                                researcher_index = ResearcherIndex(noms_ref_list)
+                                final_df['Auteurs_Laboratoire_Détectés'] = final_df['Auteurs_Crossref'].apply(researcher_index.detect_known_authors)
                                 st.success("Comparaison des auteurs avec le fichier terminée.")
 
                     except Exception as e_author_file:
@@ -330,6 +320,12 @@ def main():
 
         progress_bar.progress(90) # Avant affichage et DL
         st.success("Déduction des actions et traitement des auteurs terminés.")
+
+        if collection_a_chercher:
+            if run_history is None:
+                run_history = RunHistory(collection_a_chercher)
+            final_df = run_history.annotate_changes(final_df, reused_df)
+            run_history.save(final_df, reused_df)
         
         st.dataframe(final_df)
 
@@ -346,6 +342,7 @@ def main():
             )
         progress_bar.progress(100)
         progress_text_area.success("🎉 Traitement terminé avec succès !")
+        display_http_report()
 
 if __name__ == "__main__":
     main()
@@ -6,15 +6,16 @@ import ast, json
 import traceback
 
 # Importer les fonctions et constantes partagées depuis utils.py
+import http_client
 from utils import (
     get_scopus_data, get_openalex_data, get_pubmed_data, convert_to_dataframe,
-    clean_doi, HalCollImporter, merge_rows_with_sources, get_authors_from_crossref,
-    check_df, enrich_w_upw_parallel, add_permissions_parallel, deduce_todo,
-    normalise, normalize_name, get_initial_form
+    clean_doi, HalCollImporter, fetch_years_cached, RunHistory, merge_rows_with_sources, resolve_authors,
+    check_df, enrich_oa_status, add_permissions_by_journal, flag_rows_for_retry, deduce_todo, display_http_report,
+    normalise, ResearcherIndex
 )
 
 # Importer la génération ZIP / XML (hal_xml_export.py)
-from hal_xml_export import generate_zip_from_xmls, extract_authors_from_openalex_json, _safe_text, _ensure_list
+from hal_xml_export import write_zip_from_xmls, read_zip_file, extract_authors_from_openalex_json, _safe_text, _ensure_list
 
 # --- Définition de la liste des laboratoires (spécifique à cette application) ---
 labos_list_rennes = [
@@ -177,7 +178,7 @@ def main():
     st.session_state.setdefault('publications_list', [])
     st.session_state.setdefault('last_result_df', None)       # contient la table résultat sérialisée (list of dicts)
     st.session_state.setdefault('last_collection', None)      # collection traitée (nom)
-    st.session_state.setdefault('zip_buffer', None)           # bytes du zip généré
+    st.session_state.setdefault('zip_buffer', None)           # fichier temporaire du zip généré
 
     add_sidebar_menu() 
 
@@ -206,7 +207,8 @@ def main():
         end_year_rennes = st.number_input("Année de fin", min_value=1900, max_value=2100, value=pd.Timestamp.now().year, key="rennes_end_year")
 
     with st.expander("🔧 Options avancées pour les auteurs"):
-        fetch_authors_rennes = st.checkbox("🧑‍🔬 Récupérer les auteurs via Crossref (peut ralentir)", value=False, key="rennes_fetch_authors_cb")
+        delta_run_rennes = st.checkbox("♻️ Ne revérifier que les publications nouvelles ou non résolues depuis la dernière exécution", value=True, key="rennes_delta_run_cb")
+        fetch_authors_rennes = st.checkbox("🧑‍🔬 Récupérer les auteurs (OpenAlex, puis Crossref)", value=False, key="rennes_fetch_authors_cb")
         compare_authors_rennes = False
         uploaded_authors_file_rennes = None
         if fetch_authors_rennes:
@@ -223,11 +225,13 @@ def main():
     progress_text_area_rennes = st.empty() # Correction: Suffixe _rennes ajouté
 
     if st.button(f"🚀 Lancer la recherche pour {collection_a_chercher_rennes}"):
+        http_client.start_run()
         if pubmed_api_key_secret_rennes and pubmed_query_labo_rennes:
             os.environ['NCBI_API_KEY'] = pubmed_api_key_secret_rennes
 
         scopus_df_rennes = pd.DataFrame()
         openalex_df_rennes = pd.DataFrame()
+        openalex_works_rennes = [] # notices OpenAlex brutes (les deux récoltes), réutilisées pour les auteurs
         pubmed_df_rennes = pd.DataFrame()
 
         # --- Étape 1 : Récupération OpenAlex (par id institution) ---
@@ -235,9 +239,13 @@ def main():
             with st.spinner(f"Récupération OpenAlex pour {collection_a_chercher_rennes}..."):
                 progress_text_area_rennes.info("Étape 1/9 : Récupération des données OpenAlex...")
                 progress_bar_rennes.progress(5)
-                openalex_query_complet_rennes = f"authorships.institutions.id:{openalex_institution_id_rennes},publication_year:{start_year_rennes}-{end_year_rennes}"
-                openalex_data_rennes = get_openalex_data(openalex_query_complet_rennes, max_items=5000)
+                openalex_data_rennes, _ = fetch_years_cached(
+                    "openalex", openalex_institution_id_rennes, start_year_rennes, end_year_rennes,
+                    lambda year: get_openalex_data(f"authorships.institutions.id:{openalex_institution_id_rennes},publication_year:{year}", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if openalex_data_rennes:
+                    openalex_works_rennes.extend(openalex_data_rennes)
                     openalex_df_rennes = convert_to_dataframe(openalex_data_rennes, 'openalex')
                     openalex_df_rennes['Source title'] = openalex_df_rennes.apply(
                         lambda row: row.get('primary_location', {}).get('source', {}).get('display_name') if isinstance(row.get('primary_location'), dict) and row['primary_location'].get('source') else None, axis=1
@@ -258,10 +266,14 @@ def main():
             with st.spinner(f"Récupération OpenAlex (raw) pour {collection_a_chercher_rennes}..."):
                 progress_text_area_rennes.info("Étape 1/9 : Récupération des données OpenAlex (raw)...")
                 progress_bar_rennes.progress(12)
-                openalex_query_complet_rennes = f"raw_affiliation_strings.search:{openalex_institution_raw_rennes},publication_year:{start_year_rennes}-{end_year_rennes}"
-                openalex_data_rennes = get_openalex_data(openalex_query_complet_rennes, max_items=5000)
+                openalex_data_rennes, _ = fetch_years_cached(
+                    "openalex_raw", openalex_institution_raw_rennes, start_year_rennes, end_year_rennes,
+                    lambda year: get_openalex_data(f"raw_affiliation_strings.search:{openalex_institution_raw_rennes},publication_year:{year}", max_items=5000, strict=True),
+                    max_items=5000
+                )
 
                 if openalex_data_rennes:
+                    openalex_works_rennes.extend(openalex_data_rennes)
                     openalex_df_rennes = convert_to_dataframe(openalex_data_rennes, 'openalex')
                     openalex_df_rennes['Source title'] = openalex_df_rennes.apply(
                         lambda row: row.get('primary_location', {}).get('source', {}).get('display_name')
@@ -330,8 +342,11 @@ def main():
             with st.spinner(f"Récupération PubMed pour {collection_a_chercher_rennes}..."):
                 progress_text_area_rennes.info("Étape 2/9 : Récupération des données PubMed...")
                 progress_bar_rennes.progress(20)
-                pubmed_full_query_rennes = f"({pubmed_query_labo_rennes}) AND ({start_year_rennes}/01/01[Date - Publication] : {end_year_rennes}/12/31[Date - Publication])"
-                pubmed_data_rennes = get_pubmed_data(pubmed_full_query_rennes, max_items=5000)
+                pubmed_data_rennes, _ = fetch_years_cached(
+                    "pubmed", pubmed_query_labo_rennes, start_year_rennes, end_year_rennes,
+                    lambda year: get_pubmed_data(f"({pubmed_query_labo_rennes}) AND ({year}/01/01[Date - Publication] : {year}/12/31[Date - Publication])", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if pubmed_data_rennes:
                     pubmed_df_rennes = pd.DataFrame(pubmed_data_rennes)
                 st.success(f"{len(pubmed_df_rennes)} publications PubMed trouvées pour {collection_a_chercher_rennes}.")
@@ -344,8 +359,11 @@ def main():
             with st.spinner(f"Récupération Scopus pour {collection_a_chercher_rennes}..."):
                 progress_text_area_rennes.info("Étape 3/9 : Récupération des données Scopus...")
                 progress_bar_rennes.progress(25)
-                scopus_query_complet_rennes = f"AF-ID({scopus_lab_id_rennes}) AND PUBYEAR > {start_year_rennes - 1} AND PUBYEAR < {end_year_rennes + 1}"
-                scopus_data_rennes = get_scopus_data(scopus_api_key_secret_rennes, scopus_query_complet_rennes, max_items=5000)
+                scopus_data_rennes, _ = fetch_years_cached(
+                    "scopus", scopus_lab_id_rennes, start_year_rennes, end_year_rennes,
+                    lambda year: get_scopus_data(scopus_api_key_secret_rennes, f"AF-ID({scopus_lab_id_rennes}) AND PUBYEAR > {year - 1} AND PUBYEAR < {year + 1}", max_items=5000, strict=True),
+                    max_items=5000
+                )
                 if scopus_data_rennes:
                     scopus_df_raw_rennes = convert_to_dataframe(scopus_data_rennes, 'scopus')
                     required_scopus_cols_rennes = {'dc:title', 'prism:doi', 'dc:identifier', 'prism:publicationName', 'prism:coverDate'}
@@ -379,8 +397,8 @@ def main():
         progress_text_area_rennes.info("Étape 5/9 : Fusion des doublons...")
         progress_bar_rennes.progress(40)
         
-        with_doi_df_rennes = combined_df_rennes[combined_df_rennes['doi'].notna()].copy()
-        without_doi_df_rennes = combined_df_rennes[combined_df_rennes['doi'].isna()].copy()
+        with_doi_df_rennes = combined_df_rennes[combined_df_rennes['doi'].notna()]
+        without_doi_df_rennes = combined_df_rennes[combined_df_rennes['doi'].isna()]
         
         
         merged_data_doi_rennes = pd.DataFrame()
@@ -394,7 +412,7 @@ def main():
        
         merged_data_no_doi_rennes = pd.DataFrame()
         if not without_doi_df_rennes.empty:
-            merged_data_no_doi_rennes = without_doi_df_rennes.copy() 
+            merged_data_no_doi_rennes = without_doi_df_rennes
         
        
         final_merged_data_rennes = pd.concat([merged_data_doi_rennes, merged_data_no_doi_rennes], ignore_index=True)
@@ -410,14 +428,21 @@ def main():
         with st.spinner(f"Importation de la collection HAL '{collection_a_chercher_rennes}'..."):
             progress_text_area_rennes.info(f"Étape 6a/9 : Importation de la collection HAL '{collection_a_chercher_rennes}'...")
             coll_importer_rennes_obj = HalCollImporter(collection_a_chercher_rennes, start_year_rennes, end_year_rennes)
-            coll_df_hal_rennes = coll_importer_rennes_obj.import_data()
+            coll_df_hal_rennes = coll_importer_rennes_obj.import_data_cached()
             if coll_df_hal_rennes.empty:
                 st.warning(f"Collection HAL '{collection_a_chercher_rennes}' vide ou non chargée.")
             else:
                 st.success(f"{len(coll_df_hal_rennes)} notices HAL pour {collection_a_chercher_rennes}.")
         
+        # Exécution différentielle : les publications déjà résolues lors d'une exécution récente sont reprises
+        run_history_rennes = RunHistory(collection_a_chercher_rennes)
+        reused_df_rennes = pd.DataFrame()
+        if delta_run_rennes:
+            final_merged_data_rennes, reused_df_rennes = run_history_rennes.split(final_merged_data_rennes)
+            st.info(f"Exécution différentielle : {len(final_merged_data_rennes)} publication(s) à vérifier, {len(reused_df_rennes)} reprise(s) de l'exécution précédente.")
+
         progress_text_area_rennes.info("Étape 6b/9 : Comparaison avec les données HAL...")
-        result_df_rennes = check_df(final_merged_data_rennes.copy(), coll_df_hal_rennes, progress_bar_st=progress_bar_rennes, progress_text_st=progress_text_area_rennes)
+        result_df_rennes = check_df(final_merged_data_rennes, coll_df_hal_rennes, progress_bar_st=progress_bar_rennes, progress_text_st=progress_text_area_rennes)
         st.success(f"Comparaison HAL pour {collection_a_chercher_rennes} terminée.")
 
         # Filtrage des publications à exporter (seulement celles hors HAL ou hors collection)
@@ -425,11 +450,11 @@ def main():
             mask_non_hal = result_df_rennes['Statut_HAL'].fillna("").astype(str).isin(
                 ["Hors HAL", "Dans HAL mais hors de la collection"]
             )
-            filtered_result_df_rennes = result_df_rennes[mask_non_hal].copy()
+            filtered_result_df_rennes = result_df_rennes[mask_non_hal]
             st.info(f"📦 {len(filtered_result_df_rennes)} publications retenues pour export XML (hors HAL ou hors collection).")
         else:
             st.warning("⚠️ Colonne 'Statut_HAL' absente — aucun filtrage appliqué.")
-            filtered_result_df_rennes = result_df_rennes.copy()
+            filtered_result_df_rennes = result_df_rennes
         
         # Sauvegarde pour le module d'export
         st.session_state['last_result_df'] = filtered_result_df_rennes.to_dict(orient="records")
@@ -440,15 +465,19 @@ def main():
         with st.spinner(f"Enrichissement Unpaywall pour {collection_a_chercher_rennes}..."):
             progress_text_area_rennes.info("Étape 7/9 : Enrichissement Unpaywall...")
             progress_bar_rennes.progress(70)
-            result_df_rennes = enrich_w_upw_parallel(result_df_rennes.copy())
+            result_df_rennes = enrich_oa_status(result_df_rennes, openalex_works_rennes)
             st.success(f"Enrichissement Unpaywall pour {collection_a_chercher_rennes} terminé.")
 
         # --- Étape 8 : Permissions de dépôt ---
         with st.spinner(f"Récupération des permissions pour {collection_a_chercher_rennes}..."):
             progress_text_area_rennes.info("Étape 8/9 : Récupération des permissions de dépôt...")
             progress_bar_rennes.progress(80)
-            result_df_rennes = add_permissions_parallel(result_df_rennes.copy())
+            result_df_rennes = add_permissions_by_journal(result_df_rennes, openalex_works_rennes)
             st.success(f"Permissions pour {collection_a_chercher_rennes} récupérées.")
+        result_df_rennes = flag_rows_for_retry(result_df_rennes)
+
+        if not reused_df_rennes.empty:
+            result_df_rennes = pd.concat([result_df_rennes, reused_df_rennes], ignore_index=True)
 
         # --- Étape 9 : Déduction des actions et auteurs ---
         progress_text_area_rennes.info("Étape 9/9 : Déduction des actions et traitement des auteurs...")
@@ -456,18 +485,10 @@ def main():
         result_df_rennes['Action'] = result_df_rennes.apply(deduce_todo, axis=1)
 
         if fetch_authors_rennes: 
-            with st.spinner(f"Récupération des auteurs Crossref pour {collection_a_chercher_rennes}..."):
+            with st.spinner(f"Récupération des auteurs pour {collection_a_chercher_rennes}..."):
                 if 'doi' in result_df_rennes.columns:
-                    from concurrent.futures import ThreadPoolExecutor 
-                    from tqdm import tqdm 
-
-                    dois_for_authors_rennes = result_df_rennes['doi'].fillna("").tolist()
-                    authors_results_rennes = []
-                    with ThreadPoolExecutor(max_workers=10) as executor:
-                        authors_results_rennes = list(tqdm(executor.map(get_authors_from_crossref, dois_for_authors_rennes), total=len(dois_for_authors_rennes), desc="Auteurs Crossref (rennes)"))
-                    
-                    result_df_rennes['Auteurs_Crossref'] = ['; '.join(author_l) if isinstance(author_l, list) and not any("Erreur" in str(a) or "Timeout" in str(a) for a in author_l) else (author_l[0] if isinstance(author_l, list) and author_l else '') for author_l in authors_results_rennes]
-                    st.success(f"Auteurs Crossref pour {collection_a_chercher_rennes} récupérés.")
+                    result_df_rennes['Auteurs_Crossref'], result_df_rennes['Source auteurs'] = resolve_authors(result_df_rennes['doi'], openalex_works_rennes)
+                    st.success(f"Auteurs pour {collection_a_chercher_rennes} récupérés.")
                 else:
                     st.warning("Colonne 'doi' non trouvée, impossible de récupérer les auteurs pour la version rennes.")
                     result_df_rennes['Auteurs_Crossref'] = ''
@@ -484,26 +505,8 @@ def main():
                             if not noms_ref_rennes_list:
                                 st.warning(f"Aucun chercheur pour '{collection_a_chercher_rennes}' dans le fichier fourni (rennes).")
                             else:
-                                chercheur_map_rennes_file = {normalize_name(n): n for n in noms_ref_rennes_list}
-                                initial_map_rennes_file = {get_initial_form(normalize_name(n)): n for n in noms_ref_rennes_list}
-                                from difflib import get_close_matches 
-
-                                def detect_known_authors_rennes_file(authors_str_rennes):
-                                    if pd.isna(authors_str_rennes) or not str(authors_str_rennes).strip() or "Erreur" in authors_str_rennes or "Timeout" in authors_str_rennes: return ""
-                                    authors_pub_rennes = [a.strip() for a in str(authors_str_rennes).split(';') if a.strip()]
-                                    detectes_originaux_rennes = set()
-                                    for author_o_rennes in authors_pub_rennes:
-                                        author_n_rennes = normalize_name(author_o_rennes)
-                                        author_i_n_rennes = get_initial_form(author_n_rennes)
-                                        match_c_rennes = get_close_matches(author_n_rennes, chercheur_map_rennes_file.keys(), n=1, cutoff=0.85)
-                                        if match_c_rennes:
-                                            detectes_originaux_rennes.add(chercheur_map_rennes_file[match_c_rennes[0]])
-                                            continue
-                                        match_i_rennes = get_close_matches(author_i_n_rennes, initial_map_rennes_file.keys(), n=1, cutoff=0.9)
-                                        if match_i_rennes:
-                                            detectes_originaux_rennes.add(initial_map_rennes_file[match_i_rennes[0]])
-                                    return "; ".join(sorted(list(detectes_originaux_rennes))) if detectes_originaux_rennes else ""
-                                result_df_rennes['Auteurs_Laboratoire_Détectés'] = result_df_rennes['Auteurs_Crossref'].apply(detect_known_authors_rennes_file)
+                                researcher_index_rennes = ResearcherIndex(noms_ref_rennes_list)
+                                result_df_rennes['Auteurs_Laboratoire_Détectés'] = result_df_rennes['Auteurs_Crossref'].apply(researcher_index_rennes.detect_known_authors)
                                 st.success(f"Comparaison auteurs (fichier) pour {collection_a_chercher_rennes} terminée.")
                     except Exception as e_auth_file_rennes_exc:
                         st.error(f"Erreur fichier auteurs (rennes): {e_auth_file_rennes_exc}")
@@ -512,6 +515,9 @@ def main():
 
         progress_bar_rennes.progress(90)
         st.success(f"Déduction des actions et traitement des auteurs pour {collection_a_chercher_rennes} terminés.")
+
+        result_df_rennes = run_history_rennes.annotate_changes(result_df_rennes, reused_df_rennes)
+        run_history_rennes.save(result_df_rennes, reused_df_rennes)
         
         st.dataframe(result_df_rennes)
         # --- Sauvegarde persistante des résultats pour permettre les actions après rerun ---
@@ -747,38 +753,29 @@ def main():
         # 3) Génération du ZIP
         try:
             with st.spinner("Génération du ZIP en cours..."):
-                zipbuf = generate_zip_from_xmls(pubs_to_export)
-
-                # ✅ Normalisation en bytes (nouveau bloc)
-                zip_bytes = None
-                if zipbuf:
-                    if hasattr(zipbuf, "getvalue"):
-                        zip_bytes = zipbuf.getvalue()
-                    elif isinstance(zipbuf, (bytes, bytearray)):
-                        zip_bytes = bytes(zipbuf)
-                    else:
-                        try:
-                            zipbuf.seek(0)
-                            zip_bytes = zipbuf.read()
-                        except Exception:
-                            zip_bytes = None
-
-                if zip_bytes:
-                    st.session_state['zip_buffer'] = zip_bytes
-                    st.success("✅ ZIP prêt — cliquez sur le bouton ci-dessous pour télécharger.")
-                    st.write(f"DEBUG : taille ZIP (octets) = {len(zip_bytes)}")
+                zip_tmp, written_files = write_zip_from_xmls(pubs_to_export)
+
+                if written_files:
+                    previous_zip = st.session_state.get('zip_buffer')
+                    if previous_zip is not None and hasattr(previous_zip, "close"):
+                        previous_zip.close()
+                    st.session_state['zip_buffer'] = zip_tmp
+                    zip_tmp.seek(0, 2)
+                    st.success(f"✅ ZIP prêt ({len(written_files)} fichiers XML, {zip_tmp.tell() / 1024:.0f} Ko) — cliquez sur le bouton ci-dessous pour télécharger.")
+                    zip_tmp.seek(0)
                 else:
-                    st.error("Erreur : la génération du ZIP a renvoyé None ou un objet vide.")
+                    zip_tmp.close()
+                    st.error("Erreur : la génération du ZIP n'a produit aucun fichier XML.")
         except Exception as e:
             import traceback
             st.error(f"Erreur pendant la génération du ZIP : {e}")
             st.text(traceback.format_exc())
 
         # 4) Bouton de téléchargement
-        if st.session_state.get('zip_buffer'):
+        if st.session_state.get('zip_buffer') is not None:
             st.download_button(
                 label="⬇️ Télécharger le fichier ZIP des XML HAL (cliquer ici)",
-                data=st.session_state['zip_buffer'],
+                data=read_zip_file(st.session_state['zip_buffer']),
                 file_name=f"hal_exports_{last_collection}.zip",
                 mime="application/zip",
                 key=f"download_zip_{last_collection}"
@@ -789,6 +786,7 @@ def main():
 
         progress_bar_rennes.progress(100)
         progress_text_area_rennes.success(f"🎉 Traitement pour {collection_a_chercher_rennes} terminé avec succès !")
+        display_http_report()
 
 
 
@@ -0,0 +1,55 @@
+# Récolte par année avec cache (fetch_years_cached) : plafond global max_items sur
+# toutes les années, années complètes en cache.
+
+from utils import fetch_years_cached
+
+
+class DictCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+def fake_source(per_year):
+    calls = []
+
+    def fetch_year(year):
+        calls.append(year)
+        return [f"{year}-{i}" for i in range(per_year[year])]
+    return fetch_year, calls
+
+
+def test_max_items_caps_the_total_across_years():
+    cache = DictCache()
+    fetch_year, calls = fake_source({2020: 4, 2021: 4, 2022: 4, 2023: 4})
+
+    records, fetched = fetch_years_cached("src", "labo", 2020, 2023, fetch_year, refresh_current_year=False,
+                                          cache=cache, max_items=6)
+
+    # Années récentes d'abord : 2023 entière, 2022 tronquée, 2021 et 2020 non récoltées
+    assert records == ["2022-0", "2022-1", "2023-0", "2023-1", "2023-2", "2023-3"]
+    assert calls == [2023, 2022]
+    assert fetched == [2022, 2023]
+    # L'année tronquée est en cache complète
+    assert len(cache.get("src|labo|2022")) == 4
+
+
+def test_no_cap_returns_every_year_in_order():
+    cache = DictCache()
+    fetch_year, _ = fake_source({2020: 2, 2021: 3})
+
+    records, fetched = fetch_years_cached("src", "labo", 2020, 2021, fetch_year, refresh_current_year=False, cache=cache)
+
+    assert records == ["2020-0", "2020-1", "2021-0", "2021-1", "2021-2"]
+    assert fetched == [2020, 2021]
+    # Deuxième passage : tout vient du cache, même plafonné
+    fetch_again, calls = fake_source({2020: 2, 2021: 3})
+    records, fetched = fetch_years_cached("src", "labo", 2020, 2021, fetch_again, refresh_current_year=False,
+                                          cache=cache, max_items=4)
+    assert records == ["2020-0", "2021-0", "2021-1", "2021-2"]
+    assert (calls, fetched) == ([], [])
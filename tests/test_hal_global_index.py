@@ -0,0 +1,186 @@
+# Index local de HAL (hal_global_index) construit à partir d'une fausse récolte :
+# recherches, filtre de Bloom, confirmation des empreintes, générations et retraits.
+
+import os
+import random
+import re
+
+import pytest
+
+import hal_global_index as hgi
+from utils import HAL_TITLE_APPROX_STATUS, HAL_TITLE_EXACT_STATUS, hal_index_title_result, normalise
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class FakeHal:
+    """ Récolte cursorMark (curseur = position) sur un corpus {docid: notice}, avec fq modifiedDate_tdate. """
+
+    def __init__(self, docs):
+        self.docs = {doc["docid"]: doc for doc in docs}
+        self.requests = []
+
+    def get(self, url, params=None, **kwargs):
+        self.requests.append(dict(params))
+        docs = [self.docs[docid] for docid in sorted(self.docs)]
+        since = re.match(r"modifiedDate_tdate:\[(.*) TO \*\]", params.get("fq", ""))
+        if since:
+            docs = [doc for doc in docs if doc["modifiedDate_tdate"] >= since.group(1)]
+        fields = params["fl"].split(",")
+        start = 0 if params["cursorMark"] == "*" else int(params["cursorMark"])
+        page = [{k: doc[k] for k in fields if k in doc} for doc in docs[start:start + params["rows"]]]
+        return FakeResponse({"response": {"docs": page}, "nextCursorMark": str(start + len(page))})
+
+
+def make_doc(docid, title, doi=None, modified="2026-01-01T00:00:00Z"):
+    doc = {"docid": docid, "title_s": [title], "uri_s": f"https://hal.science/hal-{docid}", "modifiedDate_tdate": modified}
+    if doi:
+        doc["doiId_s"] = doi
+    return doc
+
+
+CORPUS = [
+    make_doc(1, "Sediment transport in macrotidal estuaries", "10.1000/ABC.1"),
+    make_doc(2, "Graph neural networks for molecular property prediction", "10.1000/abc.2"),
+    make_doc(3, "Évaluation de la qualité de l'air intérieur"),
+    make_doc(4, "Long-term outcomes after liver transplantation", "10.1000/abc.4"),
+    make_doc(5, "Soil organic carbon dynamics under no-till agriculture", "10.1000/abc.5"),
+]
+
+
+@pytest.fixture
+def fake_hal(monkeypatch, tmp_path):
+    def install(docs):
+        hal = FakeHal(docs)
+        monkeypatch.setattr(hgi.http_client, "get", hal.get)
+        monkeypatch.setattr(hgi, "HARVEST_ROWS", 2)
+        return hal
+    return install
+
+
+def build(index_dir, incremental=False):
+    return hgi.build_index(str(index_dir), normalise_title=normalise, incremental=incremental, progress=lambda msg: None)
+
+
+def open_index(index_dir):
+    return hgi.HalGlobalIndex(str(index_dir), normalise_title=normalise)
+
+
+def test_build_and_lookup(fake_hal, tmp_path):
+    fake_hal(CORPUS)
+    assert not hgi.HalGlobalIndex.exists(str(tmp_path))
+    assert build(tmp_path) == (len(CORPUS), 9)   # 4 DOI + 5 titres
+    assert hgi.HalGlobalIndex.exists(str(tmp_path))
+
+    index = open_index(tmp_path)
+    assert index.lookup_doi("https://doi.org/10.1000/abc.1")["docid"] == 1
+    assert index.lookup_doi("10.1000/ABC.4")["docid"] == 4
+    assert index.lookup_doi("10.1000/abc.3") is None
+    assert index.lookup_title(normalise("Evaluation de la qualite de l'air interieur"))["docid"] == 3
+    assert index.lookup_title(normalise("An unrelated title")) is None
+    assert index.lookup_title("") is None
+    assert 0 <= index.age_days() < 1
+
+
+def test_bloom_filter_has_no_false_negatives(fake_hal, tmp_path):
+    rng = random.Random(7)
+    docs = [make_doc(i, f"Title {i} {rng.random()}", f"10.2000/x.{i}") for i in range(1, 501)]
+    fake_hal(docs)
+    build(tmp_path)
+    index = open_index(tmp_path)
+
+    for doc in docs:
+        assert index._maybe_contains(hgi._hash64("doi:" + hgi.doi_key(doc["doiId_s"])))
+        assert index._maybe_contains(hgi._hash64("titre:" + normalise(doc["title_s"][0])))
+    absent = [hgi._hash64(f"doi:10.3000/absent.{i}") for i in range(2000)]
+    false_positives = sum(index._maybe_contains(h) for h in absent)
+    assert false_positives / len(absent) < 0.05
+
+
+def test_hash_hit_is_confirmed_on_the_stored_doc(fake_hal, tmp_path, monkeypatch):
+    # Toutes les clés ont la même empreinte : seule la première notice occupe la case
+    monkeypatch.setattr(hgi, "_hash64", lambda key: 42)
+    fake_hal(CORPUS)
+    build(tmp_path)
+    index = open_index(tmp_path)
+
+    assert index.lookup_doi("10.1000/abc.1")["docid"] == 1
+    assert index.lookup_doi("10.1000/abc.2") is None
+    assert index.lookup_title(normalise(CORPUS[0]["title_s"][0]))["docid"] == 1
+    assert index.lookup_title(normalise(CORPUS[1]["title_s"][0])) is None
+
+
+def test_generation_switch_keeps_open_readers_consistent(fake_hal, tmp_path):
+    hal = fake_hal(CORPUS)
+    build(tmp_path)
+    old_reader = open_index(tmp_path)
+    old_generation = old_reader.generation_dir
+
+    hal.docs[6] = make_doc(6, "Mechanical properties of bio-based composites", "10.1000/abc.6")
+    build(tmp_path)
+    new_reader = open_index(tmp_path)
+
+    assert new_reader.generation_dir != old_generation
+    assert new_reader.lookup_doi("10.1000/abc.6")["docid"] == 6
+    # L'ancien lecteur garde ses tableaux (génération conservée) et reste cohérent
+    assert old_reader.lookup_doi("10.1000/abc.1")["docid"] == 1
+    assert old_reader.lookup_doi("10.1000/abc.6") is None
+
+    for _ in range(3):
+        build(tmp_path)
+    generations = [name for name in os.listdir(tmp_path) if name.startswith("gen-")]
+    assert len(generations) == hgi.GENERATIONS_KEPT
+    assert os.path.basename(hgi.generation_dir(str(tmp_path))) in generations
+
+
+def test_refresh_upserts_modified_docs_and_removes_deleted_ones(fake_hal, tmp_path):
+    hal = fake_hal(CORPUS)
+    build(tmp_path)
+
+    hal.docs[2] = make_doc(2, "Graph neural networks for molecular property prediction (revised)", "10.1000/abc.2",
+                           modified="2999-01-01T00:00:00Z")
+    del hal.docs[4]   # notice supprimée (ou fusionnée) dans HAL
+    hal.requests.clear()
+    build(tmp_path, incremental=True)
+
+    # Récolte incrémentale des notices modifiées, puis liste complète des docid seulement
+    assert any(r.get("fq", "").startswith("modifiedDate_tdate:[") for r in hal.requests)
+    assert any(r["fl"] == "docid" for r in hal.requests)
+    index = open_index(tmp_path)
+    assert index.lookup_doi("10.1000/abc.4") is None
+    assert index.lookup_title(normalise(CORPUS[3]["title_s"][0])) is None
+    assert index.lookup_title(normalise("Graph neural networks for molecular property prediction (revised)"))["docid"] == 2
+    assert index.lookup_doi("10.1000/abc.1")["docid"] == 1
+
+
+def test_full_build_removes_deleted_docs(fake_hal, tmp_path):
+    hal = fake_hal(CORPUS)
+    build(tmp_path)
+    del hal.docs[1]
+    build(tmp_path)
+    assert open_index(tmp_path).lookup_doi("10.1000/abc.1") is None
+
+
+def test_empty_docid_list_removes_nothing(fake_hal, tmp_path):
+    hal = fake_hal(CORPUS)
+    build(tmp_path)
+    hal.docs.clear()
+    build(tmp_path, incremental=True)
+    assert open_index(tmp_path).lookup_doi("10.1000/abc.1")["docid"] == 1
+
+
+def test_index_title_status_matches_network_path():
+    doc = CORPUS[2]
+    assert hal_index_title_result(doc["title_s"][0], doc)[0] == HAL_TITLE_EXACT_STATUS
+    # Même titre normalisé, mais pas la même chaîne : approchant, comme match_hal_title
+    assert hal_index_title_result("Evaluation de la qualite de l'air interieur", doc)[0] == HAL_TITLE_APPROX_STATUS
@@ -0,0 +1,119 @@
+# Recherche groupée des titres dans HAL (in_hal_batch) contre un faux Solr :
+# résultats identiques à in_hal et nombre de requêtes HTTP par lot.
+
+import re
+
+import pytest
+import requests
+
+import utils
+from utils import HAL_TITLE_CANDIDATES, HAL_TITLE_EXACT_STATUS, in_hal, in_hal_batch
+
+
+def words(text):
+    return set(re.findall(r"\w{4,}", text.lower()))
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class FakeSolr:
+    """
+    title_t:(...) trouve les documents qui partagent un mot (4 lettres et plus) avec la requête.
+    Requête seule : documents classés par nombre de mots communs. Lot groupé : ordre de l'index,
+    comme un classement fait pour la requête du lot entier et non pour le titre.
+    """
+
+    def __init__(self, titles, fail_batches=False):
+        self.docs = [{"title_s": [t], "docid": str(i), "uri_s": f"https://hal.science/hal-{i}"} for i, t in enumerate(titles)]
+        self.fail_batches = fail_batches
+        self.n_get = 0
+        self.n_post = 0
+
+    def matching(self, query):
+        query_words = words(query)
+        return [doc for doc in self.docs if words(doc["title_s"][0]) & query_words]
+
+    def get(self, url, **kwargs):
+        self.n_get += 1
+        query = re.search(r"q=title_t:\((.*)\)&rows=", url).group(1)
+        docs = sorted(self.matching(query), key=lambda d: -len(words(d["title_s"][0]) & words(query)))
+        return FakeResponse({"response": {"numFound": len(docs), "docs": docs[:HAL_TITLE_CANDIDATES]}})
+
+    def post(self, url, data=None, **kwargs):
+        self.n_post += 1
+        if self.fail_batches:
+            raise requests.exceptions.ConnectionError("lot refusé")
+        grouped = {}
+        for group_query in data["group.query"]:
+            docs = self.matching(group_query)
+            grouped[group_query] = {"doclist": {"numFound": len(docs), "docs": docs[:data["group.limit"]]}}
+        return FakeResponse({"grouped": grouped})
+
+
+@pytest.fixture
+def fake_solr(monkeypatch):
+    def install(hal_titles, **kwargs):
+        solr = FakeSolr(hal_titles, **kwargs)
+        monkeypatch.setattr(utils, "get_hal_global_index", lambda: None)
+        monkeypatch.setattr(utils.http_client, "get", solr.get)
+        monkeypatch.setattr(utils.http_client, "post", solr.post)
+        return solr
+    return install
+
+
+FOUND = [f"Observation {w} of coastal sediment budgets" for w in
+         ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india")]
+MISSING = [f"Unpublished {w} manuscript on glacier retreat" for w in
+           ("kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango")]
+CROWDED = "Cancer immunotherapy outcomes"
+# Titres qui remplissent le groupe de CROWDED avant le bon document (placé en dernier dans l'index)
+CROWDERS = [f"Cancer registry report {n}" for n in range(HAL_TITLE_CANDIDATES + 5)]
+
+
+def test_full_group_is_rechecked_alone(fake_solr):
+    solr = fake_solr(CROWDERS + FOUND + [CROWDED])
+    titles = FOUND + [CROWDED] + MISSING
+
+    results = in_hal_batch(titles, batch_size=len(titles))
+
+    assert [r[0] for r in results] == [HAL_TITLE_EXACT_STATUS] * 10 + ["Hors HAL"] * len(MISSING)
+    assert results[len(FOUND)][1] == CROWDED
+    # Un lot, et une seule requête individuelle : celle du titre dont le groupe est plein
+    assert (solr.n_post, solr.n_get) == (1, 1)
+
+
+def test_all_misses_cost_one_request_per_lot(fake_solr):
+    solr = fake_solr(FOUND)
+    titles = [f"{t} {n}" for n in range(4) for t in MISSING]
+
+    results = in_hal_batch(titles, batch_size=20)
+
+    assert all(r[0] == "Hors HAL" for r in results)
+    assert (solr.n_post, solr.n_get) == (2, 0)
+
+
+def test_failed_lot_falls_back_to_single_queries(fake_solr):
+    solr = fake_solr(FOUND, fail_batches=True)
+    titles = FOUND[:3] + MISSING[:2]
+
+    results = in_hal_batch(titles, batch_size=len(titles))
+
+    assert [r[0] for r in results] == [HAL_TITLE_EXACT_STATUS] * 3 + ["Hors HAL"] * 2
+    assert (solr.n_post, solr.n_get) == (1, len(titles))
+
+
+def test_batch_matches_single_queries(fake_solr):
+    fake_solr(CROWDERS + FOUND + [CROWDED])
+    titles = FOUND + [CROWDED] + MISSING
+    expected = [in_hal(utils.escapeSolrArg(t), t) for t in titles]
+    assert in_hal_batch(titles, batch_size=7) == expected
@@ -0,0 +1,58 @@
+# TEI HAL : fichiers de référence (produits par generate_hal_xml) et équivalence
+# C14N du générateur rapide (squelette lxml), séquentiel et en pool de processus.
+
+import json
+import os
+import random
+
+import pytest
+
+import hal_xml_export
+from benchmarks.bench_tei_generation import random_publication
+from hal_xml_export import generate_hal_xml, generate_hal_xml_fast, iter_hal_xml
+
+LET = pytest.importorskip("lxml.etree")
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "tei")
+
+with open(os.path.join(FIXTURES_DIR, "publications.json"), encoding="utf-8") as f:
+    GOLDEN_PUBLICATIONS = json.load(f)
+
+
+def c14n(xml_bytes):
+    return LET.tostring(LET.fromstring(xml_bytes), method="c14n")
+
+
+def golden(name):
+    with open(os.path.join(FIXTURES_DIR, f"{name}.xml"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", sorted(GOLDEN_PUBLICATIONS))
+def test_generate_hal_xml_matches_golden(name):
+    assert generate_hal_xml(GOLDEN_PUBLICATIONS[name]) == golden(name)
+
+
+@pytest.mark.parametrize("name", sorted(GOLDEN_PUBLICATIONS))
+def test_generate_hal_xml_fast_matches_golden(name):
+    assert c14n(generate_hal_xml_fast(GOLDEN_PUBLICATIONS[name])) == c14n(golden(name))
+
+
+def test_fast_generator_equivalent_on_random_publications():
+    rng = random.Random(1)
+    for _ in range(1000):
+        pub = random_publication(rng)
+        assert c14n(generate_hal_xml_fast(pub)) == c14n(generate_hal_xml(pub)), pub
+
+
+def test_control_characters_fall_back_to_reference():
+    pub = {"Title": "Bad \x0b title"}
+    assert generate_hal_xml_fast(pub) == generate_hal_xml(pub)
+
+
+def test_iter_hal_xml_process_pool_keeps_order(monkeypatch):
+    monkeypatch.setattr(hal_xml_export, "TEI_PARALLEL_MIN_RECORDS", 10)
+    rng = random.Random(2)
+    publications = [random_publication(rng) for _ in range(60)]
+    results = list(iter_hal_xml(publications, n_workers=2, chunk_size=7))
+    assert [c14n(xml_bytes) for xml_bytes in results] == [c14n(generate_hal_xml(pub)) for pub in publications]
@@ -0,0 +1,218 @@
+# Couche HTTP commune : concurrence AIMD, disjoncteur, requêtes doublées et déduplication par exécution.
+# requests.request est remplacé par une fonction locale : aucun appel réseau.
+
+import contextvars
+import threading
+import time
+from collections import deque
+
+import pytest
+
+import http_client
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+
+
+@pytest.fixture
+def fresh_host(monkeypatch):
+    """ Contrôleurs, disjoncteurs et réponses mémorisées neufs pour chaque test. """
+    monkeypatch.setattr(http_client, "_controllers", {})
+    monkeypatch.setattr(http_client, "_breakers", {})
+    http_client.start_run()
+    return "https://api.example.org"
+
+
+def test_slow_harvest_pages_do_not_throttle_fast_lookups(fresh_host, monkeypatch):
+    latencies = {"hal-doi": 0.05, "hal-import": 4.0}
+    clock = {"now": 0.0, "route": None}
+
+    def fake_request(method, url, **kwargs):
+        clock["now"] += latencies[clock["route"]]
+        return FakeResponse()
+
+    monkeypatch.setattr(http_client.requests, "request", fake_request)
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: clock["now"])
+
+    controller = http_client.host_controller(fresh_host)
+    initial = controller.limit
+    for route in ["hal-doi"] * 5 + ["hal-import"] * 5 + ["hal-doi"] * 5:
+        clock["route"] = route
+        http_client.get(f"{fresh_host}/search/", route=route, dedupe=False)
+
+    # Même chemin /search : sans nom de route, les pages à 4 s seraient des pics face aux recherches à 50 ms
+    assert controller.n_overloads == 0
+    assert controller.limit >= initial
+
+
+def test_latency_spike_within_a_route_halves_the_limit(fresh_host, monkeypatch):
+    clock = {"now": 0.0, "latency": 0.05}
+
+    def fake_request(method, url, **kwargs):
+        clock["now"] += clock["latency"]
+        return FakeResponse()
+
+    monkeypatch.setattr(http_client.requests, "request", fake_request)
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: clock["now"])
+
+    controller = http_client.host_controller(fresh_host)
+    http_client.get(f"{fresh_host}/search/", route="hal-doi", dedupe=False)
+    limit = controller.limit
+    clock["latency"] = 4.0
+    http_client.get(f"{fresh_host}/search/", route="hal-doi", dedupe=False)
+    assert controller.limit == max(controller.minimum, limit // 2)
+
+
+def test_route_defaults_to_method_and_first_path_segment():
+    assert http_client._route("GET", "https://api.example.org/search/coll/?q=x") == ("GET", "/search")
+    assert http_client._route("GET", "https://api.example.org/search/", "hal-doi") == "hal-doi"
+
+
+def test_throttling_does_not_trip_the_breaker(fresh_host, monkeypatch):
+    monkeypatch.setattr(http_client.requests, "request", lambda method, url, **kwargs: FakeResponse(429))
+    breaker = http_client.host_breaker(fresh_host)
+    breaker.consecutive_failures = 2
+    for _ in range(2 * breaker.failure_threshold):
+        assert http_client.get(f"{fresh_host}/search/", dedupe=False).status_code == 429
+    # 429 neutre : ni échec compté, ni succès qui remettrait la série à zéro
+    assert breaker.state == "fermé"
+    assert breaker.consecutive_failures == 2
+
+
+def test_throttled_probe_keeps_breaker_half_open(fresh_host, monkeypatch):
+    statuses = [429, 200]
+    monkeypatch.setattr(http_client.requests, "request", lambda method, url, **kwargs: FakeResponse(statuses.pop(0)))
+    breaker = http_client.host_breaker(fresh_host)
+    breaker.state = "ouvert"
+    breaker.cooldown = 0
+
+    assert http_client.get(f"{fresh_host}/search/", dedupe=False).status_code == 429
+    assert breaker.state == "semi-ouvert"
+    # La requête de test est rendue : la suivante peut sonder l'hôte, et son succès referme
+    assert http_client.get(f"{fresh_host}/search/", dedupe=False).status_code == 200
+    assert breaker.state == "fermé"
+
+
+def test_only_the_probe_passes_while_half_open(fresh_host):
+    breaker = http_client.host_breaker(fresh_host)
+    breaker.state = "ouvert"
+    breaker.cooldown = 0
+    assert breaker.allow() == http_client.PROBE
+    assert breaker.state == "semi-ouvert"
+    assert not breaker.reject_queued(probe=True)
+    # Appel admis avant l'ouverture et qui obtient sa place pendant la sonde
+    assert breaker.reject_queued()
+    assert breaker.allow() is None
+
+
+def _ready_to_hedge(controller, route, limit):
+    """ Limite fixe et assez de latences courtes pour que le p95 déclenche un doublon à ~50 ms. """
+    controller.limit = controller.minimum = controller.maximum = limit
+    controller._route_latencies[route] = deque([0.01] * http_client.HEDGE_MIN_SAMPLES)
+    controller.n_requests = 1000
+
+
+def test_backup_waits_for_a_slot_under_the_host_limit(fresh_host, monkeypatch):
+    controller = http_client.host_controller(fresh_host)
+    _ready_to_hedge(controller, "hal-doi", limit=1)
+    lock = threading.Lock()
+    seen = {"calls": 0, "max_in_flight": 0}
+
+    def fake_request(method, url, **kwargs):
+        with lock:
+            seen["calls"] += 1
+            seen["max_in_flight"] = max(seen["max_in_flight"], controller.in_flight)
+        time.sleep(0.3)
+        return FakeResponse()
+
+    monkeypatch.setattr(http_client.requests, "request", fake_request)
+    assert http_client.get(f"{fresh_host}/search/", hedge=True, route="hal-doi").status_code == 200
+
+    # La seule place est prise par la requête initiale : le doublon n'est jamais parti
+    assert seen == {"calls": 1, "max_in_flight": 1}
+    assert controller.n_hedged == 0
+    assert controller.in_flight == 0
+
+
+def test_losing_request_releases_its_slot_without_an_outcome(fresh_host, monkeypatch):
+    controller = http_client.host_controller(fresh_host)
+    _ready_to_hedge(controller, "hal-doi", limit=2)
+    breaker = http_client.host_breaker(fresh_host)
+    gate = threading.Event()
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            gate.wait(5)
+            return FakeResponse(503)
+        return FakeResponse(200)
+
+    monkeypatch.setattr(http_client.requests, "request", fake_request)
+    n_requests = controller.n_requests
+    assert http_client.get(f"{fresh_host}/search/", hedge=True, route="hal-doi").status_code == 200
+    assert controller.n_hedge_wins == 1
+
+    gate.set()
+    deadline = time.monotonic() + 5
+    while controller.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Le 503 tardif de la requête initiale rend sa place sans compter ni surcharge, ni échec
+    assert controller.in_flight == 0
+    assert controller.n_requests == n_requests + 1
+    assert controller.n_overloads == 0
+    assert breaker.consecutive_failures == 0
+    assert breaker.state == "fermé"
+
+
+def _counting_request(calls):
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        return FakeResponse()
+    return fake_request
+
+
+def test_identical_gets_are_shared_within_a_run_only(fresh_host, monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client.requests, "request", _counting_request(calls))
+    url = f"{fresh_host}/search/?q=x"
+
+    http_client.get(url)
+    http_client.get(url)
+    assert len(calls) == 1
+    assert http_client.single_flight_report() == {"appels": 2, "appels évités": 1}
+
+    http_client.start_run()
+    http_client.get(url)
+    assert len(calls) == 2
+
+
+def test_runs_are_scoped_per_context(fresh_host, monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client.requests, "request", _counting_request(calls))
+    url = f"{fresh_host}/search/?q=x"
+    http_client.get(url)
+
+    # Une autre session ouvre sa propre exécution : celle-ci garde ses réponses et ses compteurs
+    contextvars.copy_context().run(http_client.start_run)
+    http_client.get(url)
+    assert len(calls) == 1
+    assert http_client.single_flight_report()["appels évités"] == 1
+
+    # Sans exécution ouverte, aucune réponse n'est partagée
+    contextvars.Context().run(http_client.get, url)
+    assert len(calls) == 2
+
+
+def test_run_executor_threads_share_the_callers_run(fresh_host, monkeypatch):
+    calls = []
+    monkeypatch.setattr(http_client.requests, "request", _counting_request(calls))
+    url = f"{fresh_host}/search/?q=x"
+
+    with http_client.RunExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: http_client.get(url), range(8)))
+    assert len(calls) == 1
+    assert http_client.single_flight_report() == {"appels": 8, "appels évités": 7}
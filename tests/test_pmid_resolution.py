@@ -0,0 +1,115 @@
+# Correspondance exacte par PMID : PMID des lignes fusionnées, recherche par lots dans HAL
+# (toutes les notices d'un lot sont vues) et ordre collection → HAL → titre dans check_df.
+
+import re
+
+import pandas as pd
+import pytest
+
+import utils
+from utils import check_df, pmid_from_row, pmids_in_hal_batch
+
+IN_COLLECTION = "Dans la collection"
+OUT_OF_COLLECTION = "Dans HAL mais hors de la collection"
+TITLE_IN_COLLECTION = "Titre trouvé dans la collection : probablement déjà présent"
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class FakeHal:
+    """ pubmedId_s:(a OR b ...) sur un corpus de notices, tri par docid, pagination start/rows. """
+
+    def __init__(self, docs):
+        self.docs = sorted(docs, key=lambda d: d["docid"])
+        self.requests = []
+
+    def post(self, url, data=None, **kwargs):
+        self.requests.append(dict(data))
+        wanted = set(re.match(r"pubmedId_s:\((.*)\)", data["q"]).group(1).split(" OR "))
+        docs = [doc for doc in self.docs if set(doc["pubmedId_s"]) & wanted]
+        page = docs[data["start"]:data["start"] + data["rows"]]
+        return FakeResponse({"response": {"numFound": len(docs), "docs": page}})
+
+
+def hal_doc(docid, pmid, title="Titre HAL"):
+    return {"docid": docid, "pubmedId_s": [pmid], "title_s": [title], "uri_s": f"https://hal.science/hal-{docid}"}
+
+
+@pytest.fixture
+def fake_hal(monkeypatch):
+    def install(docs):
+        hal = FakeHal(docs)
+        monkeypatch.setattr(utils, "get_hal_global_index", lambda: None)
+        monkeypatch.setattr(utils.http_client, "post", hal.post)
+        return hal
+    return install
+
+
+@pytest.mark.parametrize("data_source, id_value, expected", [
+    ("pubmed", "456789", "456789"),
+    ("openalex|pubmed", "https://openalex.org/W123|456789", "456789"),
+    ("pubmed|scopus", "456789|SCOPUS_ID:8500", "456789"),
+    ("openalex|scopus", "W123|SCOPUS_ID:8500", None),
+    ("openalex|pubmed", None, None),
+    (None, "456789", None),
+])
+def test_pmid_from_merged_rows(data_source, id_value, expected):
+    assert pmid_from_row(data_source, id_value) == expected
+
+
+def test_every_pmid_of_a_crowded_lot_is_found(fake_hal):
+    # Le premier PMID a plus de notices HAL que la taille d'une page (2 × taille du lot)
+    hal = fake_hal([hal_doc(i, "111") for i in range(1, 8)] + [hal_doc(20, "222"), hal_doc(30, "333")])
+
+    found = pmids_in_hal_batch(["111", "222", "333", "444"], batch_size=4)
+
+    assert sorted(found) == ["111", "222", "333"]
+    assert found["111"][2] == 1
+    assert found["333"][2] == 30
+    assert [r["start"] for r in hal.requests] == [0, 8]
+
+
+def test_lot_stops_paging_once_every_pmid_is_found(fake_hal):
+    hal = fake_hal([hal_doc(1, "111"), hal_doc(2, "222")] + [hal_doc(i, "111") for i in range(3, 20)])
+    assert sorted(pmids_in_hal_batch(["111", "222"])) == ["111", "222"]
+    assert len(hal.requests) == 1
+
+
+def test_check_df_resolves_pmid_in_collection_then_hal_then_title(fake_hal, monkeypatch):
+    fake_hal([hal_doc(500, "222"), hal_doc(501, "111")])
+    collection = pd.DataFrame({
+        "Hal_ids": [100, 101], "DOIs": ["", ""], "Titres": ["Titre dans la collection", "Autre titre"],
+        "Types de dépôts": ["file", "notice"], "HAL Link": ["", ""], "HAL Ext ID": ["", ""],
+        "HAL_URI": ["https://hal.science/hal-100", "https://hal.science/hal-101"], "PMID": ["111", ""],
+    })
+    titles_sent_to_hal = []
+
+    def fake_in_hal_batch(titles):
+        titles_sent_to_hal.extend(titles)
+        return [["Hors HAL", t, "", "", "", "", ""] for t in titles]
+    monkeypatch.setattr(utils, "in_hal_batch", fake_in_hal_batch)
+
+    df = pd.DataFrame({
+        "doi": [None, None, None, None],
+        "Title": ["Ignoré", "Ignoré aussi", "Titre dans la collection", "Titre inconnu"],
+        "Data source": ["pubmed", "openalex|pubmed", "pubmed", "pubmed"],
+        "id": ["111", "W9|222", "333", "444"],
+    })
+
+    result = check_df(df, collection)
+
+    # 111 : dans la collection (et non la notice HAL 501) ; 222 : HAL ; 333 et 444 : titres
+    assert result["Statut_HAL"].tolist()[:3] == [IN_COLLECTION, OUT_OF_COLLECTION, TITLE_IN_COLLECTION]
+    assert result["identifiant_hal_si_trouvé"].tolist()[:3] == [100, 500, 100]
+    assert result["Statut_HAL"].tolist()[3] == "Hors HAL"
+    assert titles_sent_to_hal == ["Titre inconnu"]
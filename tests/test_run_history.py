@@ -0,0 +1,134 @@
+# Exécutions différentielles (RunHistory) : reprise des résultats résolus, annotation
+# des changements et enregistrement dans le cache persistant (une ligne par publication).
+
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from persistent_cache import PersistentCache
+from utils import RETRY_COL, RUN_CHANGE_COL, RUN_HISTORY_RESULT_COLS, RUN_HISTORY_STORED_COLS, RunHistory
+
+IN_COLLECTION = "Dans la collection"
+OUT_OF_COLLECTION = "Dans HAL mais hors de la collection"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PersistentCache("run_history", None, path=str(tmp_path / "cache.sqlite"))
+
+
+def result_df(rows):
+    """ rows : (doi, titre, Statut_HAL, Action, À relancer). """
+    df = pd.DataFrame(rows, columns=["doi", "Title", "Statut_HAL", "Action", RETRY_COL])
+    df["Date"] = pd.Timestamp("2026-03-01")
+    df["authors"] = [np.array(["A. Martin", "B. Durand"])] * len(df)
+    df["oa_status"] = "green"
+    return df
+
+
+def saved_history(cache, lab, rows, checked_at=None):
+    history = RunHistory(lab, cache=cache)
+    history.save(result_df(rows))
+    if checked_at is not None:
+        cache.set_many({f"{lab}|{key}": dict(entry, checked_at=checked_at) for key, entry in history.previous.items()})
+    return RunHistory(lab, cache=cache)
+
+
+def test_is_reusable(cache):
+    history = RunHistory("LAB", max_age_days=30, cache=cache)
+    now = time.time()
+
+    def entry(status, retry="", age_days=1):
+        return {"row": {"Statut_HAL": status, RETRY_COL: retry}, "checked_at": now - age_days * 86400}
+
+    assert history._is_reusable(entry(IN_COLLECTION), now)
+    assert not history._is_reusable(None, now)
+    assert not history._is_reusable(entry(OUT_OF_COLLECTION), now)
+    assert not history._is_reusable(entry(IN_COLLECTION, retry="Unpaywall"), now)
+    assert not history._is_reusable(entry(IN_COLLECTION, age_days=31), now)
+
+
+def test_split_reuses_only_resolved_fresh_rows(cache):
+    history = saved_history(cache, "LAB", [
+        ("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+        ("10.1/b", "Beta", OUT_OF_COLLECTION, "Vérifier les affiliations", ""),
+        ("10.1/c", "Gamma", IN_COLLECTION, "Rien à faire", "Unpaywall"),
+        (None, "Delta sans DOI", IN_COLLECTION, "Rien à faire", ""),
+    ])
+    input_df = pd.DataFrame({"doi": ["10.1/A", "10.1/b", "10.1/c", None, "10.1/new"],
+                             "Title": ["Alpha", "Beta", "Gamma", "Delta sans DOI", "New"]})
+
+    to_check, reused = history.split(input_df)
+
+    assert reused["Title"].tolist() == ["Alpha", "Delta sans DOI"]
+    assert to_check["Title"].tolist() == ["Beta", "Gamma", "New"]
+    assert set(RUN_HISTORY_RESULT_COLS) <= set(reused.columns)
+    assert reused["Statut_HAL"].tolist() == [IN_COLLECTION] * 2
+    assert reused["oa_status"].tolist() == ["green"] * 2
+
+
+def test_split_expires_old_results(cache):
+    history = saved_history(cache, "LAB", [("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", "")],
+                            checked_at=time.time() - 60 * 86400)
+    to_check, reused = history.split(pd.DataFrame({"doi": ["10.1/a"], "Title": ["Alpha"]}))
+    assert reused.empty and len(to_check) == 1
+
+
+def test_annotate_changes(cache):
+    history = saved_history(cache, "LAB", [
+        ("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+        ("10.1/b", "Beta", OUT_OF_COLLECTION, "Vérifier les affiliations", ""),
+        ("10.1/c", "Gamma", OUT_OF_COLLECTION, "Vérifier les affiliations", ""),
+        ("10.1/d", "Delta", OUT_OF_COLLECTION, "Vérifier les affiliations", ""),
+    ])
+    _, reused = history.split(pd.DataFrame({"doi": ["10.1/a"], "Title": ["Alpha"]}))
+    final_df = result_df([
+        ("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+        ("10.1/b", "Beta", IN_COLLECTION, "Rien à faire", ""),
+        ("10.1/c", "Gamma", OUT_OF_COLLECTION, "Contacter les auteurs", ""),
+        ("10.1/d", "Delta", OUT_OF_COLLECTION, "Vérifier les affiliations", ""),
+        ("10.1/e", "Epsilon", "Hors HAL", "Déposer", ""),
+    ])
+
+    changes = history.annotate_changes(final_df, reused)[RUN_CHANGE_COL].tolist()
+
+    assert changes[0].startswith("Non revérifiée (résultat du ")
+    assert changes[1] == f"Statut HAL modifié : {OUT_OF_COLLECTION} → {IN_COLLECTION}"
+    assert changes[2:] == ["Action modifiée", "Inchangée", "Nouvelle publication"]
+
+
+def test_save_stores_one_json_safe_row_per_publication(cache):
+    history = RunHistory("LAB", cache=cache)
+    final_df = result_df([("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+                          (None, "Beta", OUT_OF_COLLECTION, "Vérifier", "")])
+    final_df["publisher"] = [pd.Timestamp("2026-01-01"), np.int64(3)]
+    final_df[RUN_CHANGE_COL] = "Nouvelle publication"
+
+    history.save(final_df)   # Timestamp, ndarray, numpy : pas d'erreur de sérialisation
+
+    stored = cache.items("LAB|")
+    assert sorted(stored) == ["LAB|doi:10.1/a", "LAB|titre:beta"]
+    row = stored["LAB|doi:10.1/a"]["row"]
+    assert set(row) == set(RUN_HISTORY_STORED_COLS) & set(final_df.columns)
+    assert row["publisher"] == str(pd.Timestamp("2026-01-01"))
+    assert stored["LAB|titre:beta"]["row"]["publisher"] == 3
+    assert RunHistory("LAB", cache=cache).previous == history.previous
+    assert RunHistory("OTHER", cache=cache).previous == {}
+
+
+def test_save_keeps_check_date_of_reused_rows(cache):
+    old = time.time() - 5 * 86400
+    history = saved_history(cache, "LAB", [("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+                                           ("10.1/b", "Beta", OUT_OF_COLLECTION, "Vérifier", "")], checked_at=old)
+    to_check, reused = history.split(pd.DataFrame({"doi": ["10.1/a", "10.1/b"], "Title": ["Alpha", "Beta"]}))
+    assert reused["doi"].tolist() == ["10.1/a"]
+
+    history.save(result_df([("10.1/a", "Alpha", IN_COLLECTION, "Rien à faire", ""),
+                            ("10.1/b", "Beta", IN_COLLECTION, "Rien à faire", "")]), reused)
+
+    stored = RunHistory("LAB", cache=cache).previous
+    assert stored["doi:10.1/a"]["checked_at"] == old
+    assert stored["doi:10.1/b"]["checked_at"] > old
+    assert stored["doi:10.1/b"]["row"]["Statut_HAL"] == IN_COLLECTION
@@ -0,0 +1,77 @@
+# Calibration des backends de similarité : le backend rapide doit attribuer
+# exactement les mêmes statuts que la référence difflib.
+
+import random
+
+import pytest
+
+from utils import close_matches, compare_inex, normalise
+
+TITLES = [
+    "Deep learning for medical image segmentation: a review",
+    "Effects of climate change on marine biodiversity in the Bay of Biscay",
+    "A randomized controlled trial of vitamin D supplementation in older adults",
+    "Graph neural networks for molecular property prediction",
+    "Évaluation de la qualité de l'air intérieur dans les écoles bretonnes",
+    "Long-term outcomes after liver transplantation",
+    "Sediment transport in macrotidal estuaries",
+    "Ontology-based integration of heterogeneous biomedical data",
+    "Soil organic carbon dynamics under no-till agriculture",
+    "Mechanical properties of bio-based composites",
+    "Hepatitis B",
+    "Brief report",
+]
+
+
+def _perturb(title, rng):
+    """ Variante bruitée d'un titre : fautes, mots supprimés ou ajoutés, troncature. """
+    chars = list(title)
+    for _ in range(rng.randint(0, 6)):
+        pos = rng.randrange(len(chars))
+        action = rng.choice(("sub", "del", "ins"))
+        if action == "sub":
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+        elif action == "del" and len(chars) > 1:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    words = "".join(chars).split()
+    if len(words) > 3 and rng.random() < 0.3:
+        del words[rng.randrange(len(words))]
+    if rng.random() < 0.2:
+        words = words[: max(1, len(words) - rng.randint(1, 3))]
+    if rng.random() < 0.2:
+        words.append(rng.choice(("revisited", "a case study", "in France", "2nd edition")))
+    return " ".join(words)
+
+
+def _sample_pairs(n_pairs=3000, seed=42):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(n_pairs):
+        title = rng.choice(TITLES)
+        other = _perturb(title, rng) if rng.random() < 0.8 else rng.choice(TITLES)
+        pairs.append((normalise(title), normalise(other)))
+    return pairs
+
+
+@pytest.mark.parametrize("short_len_def", [20, 40])
+def test_compare_inex_same_status(short_len_def):
+    pairs = _sample_pairs()
+    statuses = {
+        backend: [compare_inex(a, b, short_len_def=short_len_def, backend=backend) for a, b in pairs]
+        for backend in ("difflib", "fast")
+    }
+    assert statuses["fast"] == statuses["difflib"]
+    # L'échantillon doit couvrir les deux issues pour que la calibration ait un sens
+    assert 0 < sum(statuses["difflib"]) < len(pairs)
+
+
+@pytest.mark.parametrize("cutoff", [0.6, 0.85, 0.9])
+def test_close_matches_same_result(cutoff):
+    rng = random.Random(7)
+    candidates = [normalise(_perturb(rng.choice(TITLES), rng)) for _ in range(500)]
+    for title in TITLES:
+        query = normalise(title)
+        expected = close_matches(query, candidates, n=5, cutoff=cutoff, backend="difflib")
+        assert close_matches(query, candidates, n=5, cutoff=cutoff, backend="fast") == expected
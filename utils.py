@@ -1,23 +1,55 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import requests
 import json
 from metapub import PubMedFetcher
 import regex as re
 from unidecode import unidecode
 import unicodedata
-from difflib import get_close_matches
+from difflib import SequenceMatcher
+import heapq
+import os
+from collections import defaultdict
 from langdetect import detect # Bien que non utilisé directement, gardé si une fonction importée en dépend
 from tqdm import tqdm 
-from concurrent.futures import ThreadPoolExecutor
+from hal_xml_export import extract_authors_from_openalex_json
+from hal_global_index import HalGlobalIndex, HAL_INDEX_DIR, generation_dir
+import http_client
+from persistent_cache import PersistentCache
+from http_client import HTTP_POOL_WORKERS, SERVICE_UNAVAILABLE, RunExecutor
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import time
 
+try:
+    # Optionnel : accélère l'élagage des candidats dans FastSimilarity
+    from rapidfuzz import fuzz as rf_fuzz, process as rf_process
+except ImportError:
+    rf_fuzz = rf_process = None
+
+try:
+    import pyarrow  # noqa: F401 (chaînes Arrow pour HalCollection)
+    COMPACT_STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    COMPACT_STRING_DTYPE = pd.StringDtype("python")
+
 tqdm.pandas()
 
 # --- Constantes Partagées ---
 HAL_API_ENDPOINT = "http://api.archives-ouvertes.fr/search/"
 # Ajout de uri_s pour récupérer l'URL directe de la notice HAL
 HAL_FIELDS_TO_FETCH = "docid,doiId_s,title_s,submitType_s,linkExtUrl_s,linkExtId_s,uri_s"
+# Identifiants externes importés avec la collection (champ HAL -> colonne de HalCollection)
+HAL_EXTERNAL_ID_FIELDS = {"pubmedId_s": "PMID", "pubmedcentralId_s": "PMCID", "arxivId_s": "arXiv ID"}
+HAL_COLLECTION_FIELDS = HAL_FIELDS_TO_FETCH + "," + ",".join(HAL_EXTERNAL_ID_FIELDS)
+# PMID envoyés par requête pubmedId_s:(... OR ...) pour les lignes PubMed sans correspondance DOI
+HAL_PMID_BATCH_SIZE = 50
+# Recherche de titre dans HAL : une seule requête, k candidats re-classés localement
+HAL_TITLE_CANDIDATES = int(os.environ.get("C2LABHAL_HAL_TITLE_CANDIDATES", "10"))
+HAL_TITLE_FIELDS = "docid,title_s,submitType_s,linkExtUrl_s,linkExtId_s,uri_s"
+# Titres regroupés par requête (title_t:(...) OR title_t:(...)) pour les lignes sans correspondance DOI
+HAL_TITLE_BATCH_SIZE = int(os.environ.get("C2LABHAL_HAL_TITLE_BATCH_SIZE", "20"))
 DEFAULT_START_YEAR = 2018
 DEFAULT_END_YEAR = '*' 
 
@@ -27,6 +59,52 @@ SOLR_ESCAPE_RULES = {
     '~': r'\~', '*': r'\*', '?': r'\?', ':': r'\:', '"': r'\"'
 }
 
+# Backend de similarité utilisé par compare_inex, inex_in_coll, in_hal et la détection des auteurs
+# ("fast" par défaut, "difflib" pour le mode de référence)
+DEFAULT_SIMILARITY_BACKEND = os.environ.get("C2LABHAL_SIMILARITY_BACKEND", "fast")
+
+# Nombre de processus pour la similarité de titres dans check_df (1 = mode séquentiel)
+DEFAULT_CHECK_WORKERS = int(os.environ.get("C2LABHAL_CHECK_WORKERS", "1"))
+
+OPENALEX_API_ENDPOINT = 'https://api.openalex.org/works'
+OPENALEX_MAILTO = "laurent.jonchere@univ-rennes.fr"
+OPENALEX_DOI_BATCH_SIZE = 50  # filter=doi:a|b|... (50 valeurs max par filtre OR)
+
+# Crossref : "polite pool" (mailto réel) et requêtes groupées filter=doi:a,doi:b,...
+CROSSREF_API_ENDPOINT = "https://api.crossref.org/works"
+CROSSREF_MAILTO = "laurent.jonchere@univ-rennes.fr"
+CROSSREF_USER_AGENT = f"c2LabHAL/1.0 (https://github.com/GuillaumeGodet/c2labhal; mailto:{CROSSREF_MAILTO})"
+CROSSREF_BATCH_SIZE = 50
+
+# Index local de tout HAL (hal_global_index.py), utilisé s'il a été construit et récolté depuis moins
+# de HAL_INDEX_MAX_AGE_DAYS jours ; ses réponses négatives sont vérifiées auprès de l'API
+USE_HAL_GLOBAL_INDEX = os.environ.get("C2LABHAL_USE_HAL_INDEX", "1") != "0"
+HAL_INDEX_MAX_AGE_DAYS = float(os.environ.get("C2LABHAL_HAL_INDEX_MAX_AGE_DAYS", "7"))
+HAL_INDEX_RECHECK_SECONDS = 60   # nouvelle génération ou index périmé : vérifiés au plus une fois par minute
+
+# Cache persistant (sqlite) partagé entre les exécutions
+PERMISSIONS_API_ENDPOINT = "https://bg.api.oa.works/permissions/"
+PERMISSIONS_CACHE_TTL = 30 * 24 * 3600  # 30 jours
+# Récoltes (OpenAlex, Scopus, PubMed, HAL) mises en cache par année de publication ;
+# une année HAL n'est reprise que si son empreinte (nombre de notices, dernière modification) est inchangée
+HARVEST_CACHE_TTL = int(os.environ.get("C2LABHAL_HARVEST_CACHE_TTL", str(30 * 24 * 3600)))
+# L'année en cours (et les suivantes) est ré-interrogée à chaque exécution, sauf si désactivé
+HARVEST_REFRESH_CURRENT_YEAR = os.environ.get("C2LABHAL_REFRESH_CURRENT_YEAR", "1") != "0"
+
+HAL_OUTPUT_COLS = ['Statut_HAL', 'titre_HAL_si_trouvé', 'identifiant_hal_si_trouvé',
+                   'type_dépôt_si_trouvé', 'HAL Link', 'HAL Ext ID', 'HAL_URI']
+UPW_OUTPUT_COLS = ["Statut Unpaywall", "oa_status", "oa_publisher_license", "oa_publisher_link", "oa_repo_link", "publisher", "doi_interroge"]
+# Exécutions différentielles : résultats repris de l'exécution précédente
+RUN_HISTORY_MAX_AGE_DAYS = int(os.environ.get("C2LABHAL_RUN_HISTORY_MAX_AGE_DAYS", "30"))
+RUN_HISTORY_RESOLVED_STATUSES = ("Dans la collection", "Titre trouvé dans la collection : probablement déjà présent")
+RUN_CHANGE_COL = "Changement depuis la dernière exécution"
+HAL_FOUND_STATUSES = ("Dans la collection", "Dans HAL mais hors de la collection")
+# Lignes dont un service (Unpaywall, oa.works) était indisponible : à relancer
+RETRY_COL = "À relancer"
+RUN_HISTORY_RESULT_COLS = HAL_OUTPUT_COLS + UPW_OUTPUT_COLS + ["Source OA", "deposit_condition", RETRY_COL]
+# Colonnes conservées dans l'historique : résultats repris, plus l'action (comparée d'une exécution à l'autre)
+RUN_HISTORY_STORED_COLS = RUN_HISTORY_RESULT_COLS + ["Action"]
+
 # --- Fonctions Utilitaires ---
 
 def _display_long_warning(base_message, item_identifier, item_value, exception_details, max_len=70):
@@ -45,7 +123,15 @@ def _display_long_warning(base_message, item_identifier, item_value, exception_d
         st.warning(full_error_message)
 
 
-def get_scopus_data(api_key, query, max_items=2000):
+class HarvestError(Exception):
+    """Récolte interrompue (mode strict) ; partial_records contient ce qui a pu être récupéré."""
+
+    def __init__(self, message, partial_records=None):
+        super().__init__(message)
+        self.partial_records = partial_records or []
+
+
+def get_scopus_data(api_key, query, max_items=2000, strict=False):
     found_items_num = -1 
     start_item = 0
     items_per_query = 25 
@@ -57,16 +143,20 @@ def get_scopus_data(api_key, query, max_items=2000):
             break 
 
         try:
-            resp = requests.get(
+            resp = http_client.get(
                 'https://api.elsevier.com/content/search/scopus',
                 headers={'Accept': 'application/json', 'X-ELS-APIKey': api_key},
                 params={'query': query, 'count': items_per_query, 'start': start_item},
-                timeout=30 
+                timeout=30,
+                dedupe=False,
+                route="scopus-recolte"
             )
             resp.raise_for_status()  
             data = resp.json()
         except requests.exceptions.RequestException as e:
             st.error(f"Erreur lors de la requête Scopus (start_item: {start_item}): {e}")
+            if strict:
+                raise HarvestError(f"Scopus : {e}", results_json)
             return results_json 
 
         search_results = data.get('search-results', {})
@@ -97,10 +187,9 @@ def get_scopus_data(api_key, query, max_items=2000):
 
     return results_json[:max_items]
 
-def get_openalex_data(query, max_items=2000):
-    url = 'https://api.openalex.org/works'
-    email = "laurent.jonchere@univ-rennes.fr" 
-    params = {'filter': query, 'per-page': 200, 'mailto': email} 
+def get_openalex_data(query, max_items=2000, strict=False):
+    url = OPENALEX_API_ENDPOINT
+    params = {'filter': query, 'per-page': 200, 'mailto': OPENALEX_MAILTO} 
     results_json = []
     next_cursor = "*" 
 
@@ -115,7 +204,7 @@ def get_openalex_data(query, max_items=2000):
 
         while current_try < retries:
             try:
-                resp = requests.get(url, params=params, timeout=30) 
+                resp = http_client.get(url, params=params, timeout=30, hedge=True, dedupe=False, route="openalex-recolte") 
                 resp.raise_for_status() 
                 data = resp.json()
                 
@@ -130,12 +219,16 @@ def get_openalex_data(query, max_items=2000):
                 st.warning(f"Erreur OpenAlex (tentative {current_try}/{retries}): {e}. Réessai...")
                 if current_try >= retries:
                     st.error(f"Échec de la récupération des données OpenAlex après {retries} tentatives.")
+                    if strict:
+                        raise HarvestError(f"OpenAlex : {e}", results_json[:max_items])
                     return results_json[:max_items] 
             except json.JSONDecodeError:
                 current_try +=1
                 st.warning(f"Erreur de décodage JSON OpenAlex (tentative {current_try}/{retries}). Réessai...")
                 if current_try >= retries:
                     st.error("Échec du décodage JSON OpenAlex.")
+                    if strict:
+                        raise HarvestError("OpenAlex : réponse JSON invalide", results_json[:max_items])
                     return results_json[:max_items]
         
         if current_try >= retries: 
@@ -144,9 +237,10 @@ def get_openalex_data(query, max_items=2000):
     return results_json[:max_items] 
 
 
-def get_pubmed_data(query, max_items=1000):
+def get_pubmed_data(query, max_items=1000, strict=False):
     fetch = PubMedFetcher()
     data = []
+    n_errors = 0
     try:
         pmids = fetch.pmids_for_query(query, retmax=max_items)
         
@@ -180,10 +274,15 @@ def get_pubmed_data(query, max_items=1000):
                     'Data source': 'pubmed', 'Title': "Erreur de récupération", 'doi': None,
                     'id': pmid, 'Source title': "N/A", 'Date': "N/A"
                 })
-        return data
+                n_errors += 1
     except Exception as e_query:
         st.error(f"Erreur lors de la requête PMIDs à PubMed: {e_query}")
+        if strict:
+            raise HarvestError(f"PubMed : {e_query}")
         return [] 
+    if strict and n_errors:
+        raise HarvestError(f"PubMed : {n_errors} article(s) non récupéré(s)", data)
+    return data
 
 def convert_to_dataframe(data, source_name):
     if not data: 
@@ -192,6 +291,81 @@ def convert_to_dataframe(data, source_name):
     df['Data source'] = source_name 
     return df
 
+_harvest_cache = None
+
+
+def get_harvest_cache():
+    """ Cache persistant des récoltes par année (créé à la première utilisation). """
+    global _harvest_cache
+    if _harvest_cache is None:
+        _harvest_cache = PersistentCache("harvest", HARVEST_CACHE_TTL)
+    return _harvest_cache
+
+
+def fetch_years_cached(source, query_key, start_year, end_year, fetch_year, refresh_current_year=None, cache=None,
+                       fingerprint_year=None, max_items=None):
+    """
+    Assemble les notices de start_year à end_year à partir d'un cache par
+    (source, requête du labo, année de publication) : seules les années absentes du cache
+    (et l'année en cours si refresh_current_year) sont récoltées via fetch_year(année),
+    appelée en mode strict. Une récolte incomplète (HarvestError) est utilisée telle quelle
+    mais n'est pas mise en cache.
+    Si fingerprint_year(année) est fourni (requête légère : nombre de notices, dernière
+    modification), une année en cache n'est reprise que si son empreinte n'a pas changé
+    depuis la récolte ; None (empreinte indisponible) force la récolte.
+    max_items plafonne le total sur toutes les années, comme l'ancienne requête unique :
+    les années sont parcourues de la plus récente à la plus ancienne et la récolte s'arrête
+    une fois le plafond atteint (les années plus anciennes sont écartées, avec un avertissement).
+    Retourne (notices triées par année croissante, années récoltées).
+    """
+    if refresh_current_year is None:
+        refresh_current_year = HARVEST_REFRESH_CURRENT_YEAR
+    if cache is None:
+        cache = get_harvest_cache()
+    current_year = pd.Timestamp.now().year
+
+    records_by_year = []
+    n_records = 0
+    fetched_years = []
+    skipped_years = []
+    for year in range(int(end_year), int(start_year) - 1, -1):
+        if max_items is not None and n_records >= max_items:
+            skipped_years.append(year)
+            continue
+        cache_key = f"{source}|{query_key}|{year}"
+        year_records = None
+        fingerprint = None
+        if not (refresh_current_year and year >= current_year):
+            year_records = cache.get(cache_key)
+            if year_records is not None and fingerprint_year is not None:
+                fingerprint = fingerprint_year(year)
+                if fingerprint is None or cache.get(cache_key + "|empreinte") != fingerprint:
+                    year_records = None
+        if year_records is None:
+            fetched_years.append(year)
+            # Empreinte relevée avant la récolte : une modification pendant celle-ci sera vue au prochain passage
+            if fingerprint is None and fingerprint_year is not None:
+                fingerprint = fingerprint_year(year)
+            try:
+                year_records = fetch_year(year) or []
+                cache.set(cache_key, year_records)
+                if fingerprint is not None:
+                    cache.set(cache_key + "|empreinte", fingerprint)
+            except HarvestError as e:
+                st.warning(f"Récolte {source} {year} incomplète, non mise en cache : {e}")
+                year_records = e.partial_records
+        if max_items is not None:
+            # L'année complète reste en cache ; seul le résultat renvoyé est tronqué
+            year_records = year_records[:max_items - n_records]
+        records_by_year.append(year_records)
+        n_records += len(year_records)
+    if skipped_years:
+        st.warning(f"Récolte {source} limitée à {max_items} notices : années {min(skipped_years)} à "
+                   f"{max(skipped_years)} non récoltées.")
+    records = [record for year_records in reversed(records_by_year) for record in year_records]
+    return records, sorted(fetched_years)
+
+
 def clean_doi(doi_value):
     if isinstance(doi_value, str):
         doi_value = doi_value.strip() 
@@ -200,6 +374,20 @@ def clean_doi(doi_value):
     return doi_value
 
 
+def display_http_report():
+    """ Limites de concurrence et latences observées par service externe (voir http_client). """
+    report = http_client.concurrency_report()
+    if not report:
+        return
+    single_flight = http_client.single_flight_report()
+    if single_flight["appels évités"]:
+        st.info(f"Requêtes identiques partagées : {single_flight['appels évités']} appel(s) HTTP évité(s) "
+                f"sur {single_flight['appels']} requêtes GET.")
+    with st.expander("Services externes : concurrence et latence"):
+        st.caption('Limites réglables sans modifier le code : C2LABHAL_HOST_LIMITS="hôte=initial:min:max,..."')
+        st.dataframe(pd.DataFrame(report))
+
+
 def escapedSeq(term_char_list):
     for char in term_char_list:
         yield SOLR_ESCAPE_RULES.get(char, char)
@@ -219,95 +407,257 @@ def normalise(text_to_normalise):
     text_normalised = re.sub(r'\s+', ' ', text_alphanum_spaces).lower().strip()
     return text_normalised
 
-def compare_inex(norm_title1, norm_title2, threshold_strict=0.9, threshold_short=0.85, short_len_def=20):
+# --- Similarité de chaînes ---
+
+class DifflibSimilarity:
+    """
+    Backend de référence : reproduit exactement difflib.get_close_matches
+    (SequenceMatcher appliqué paire par paire).
+    """
+    name = "difflib"
+
+    def ratio(self, query, candidate):
+        # get_close_matches place le candidat en seq1 et la requête en seq2
+        return SequenceMatcher(None, candidate, query).ratio()
+
+    def score_many(self, query, candidates, cutoff=0.0):
+        """
+        Score une requête contre tous les candidats.
+        Retourne [(index, score)] des candidats dont le score atteint cutoff, dans l'ordre d'entrée.
+        """
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        scored = []
+        for idx, candidate in enumerate(candidates):
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((idx, score))
+        return scored
+
+
+class FastSimilarity(DifflibSimilarity):
+    """
+    Backend rapide : élague tous les candidats en un seul appel groupé à l'aide de bornes
+    supérieures du ratio difflib, puis ne calcule le ratio exact que sur les survivants.
+    Les scores retournés sont ceux de difflib, les statuts restent donc identiques.
+    """
+    name = "fast"
+
+    def _candidate_indices(self, query, candidates, cutoff):
+        if cutoff <= 0:
+            return range(len(candidates))
+        if rf_process is not None:
+            # Le ratio Indel (2*LCS / (l1+l2)) majore le ratio de SequenceMatcher
+            survivors = rf_process.extract(
+                query, candidates, scorer=rf_fuzz.ratio, processor=None,
+                score_cutoff=max(cutoff * 100 - 1e-6, 0), limit=None
+            )
+            return sorted(idx for _, _, idx in survivors)
+        # Sans rapidfuzz : borne sur les longueurs (équivalent de real_quick_ratio)
+        len_query = len(query)
+        return [
+            idx for idx, candidate in enumerate(candidates)
+            if 2.0 * min(len_query, len(candidate)) >= cutoff * (len_query + len(candidate))
+        ]
+
+    def score_many(self, query, candidates, cutoff=0.0):
+        if not isinstance(candidates, list):
+            candidates = list(candidates)
+        if not candidates:
+            return []
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        scored = []
+        for idx in self._candidate_indices(query, candidates, cutoff):
+            matcher.set_seq1(candidates[idx])
+            if matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((idx, score))
+        return scored
+
+
+SIMILARITY_BACKENDS = {
+    DifflibSimilarity.name: DifflibSimilarity(),
+    FastSimilarity.name: FastSimilarity(),
+}
+
+
+def get_similarity_backend(backend=None):
+    """Retourne le backend demandé (nom ou instance), ou le backend par défaut."""
+    if backend is None:
+        backend = DEFAULT_SIMILARITY_BACKEND
+    if isinstance(backend, DifflibSimilarity):
+        return backend
+    try:
+        return SIMILARITY_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Backend de similarité inconnu : {backend}") from None
+
+
+def close_matches(word, possibilities, n=3, cutoff=0.6, backend=None):
+    """Équivalent de difflib.get_close_matches utilisant le backend de similarité choisi."""
+    possibilities = list(possibilities)
+    scored = get_similarity_backend(backend).score_many(word, possibilities, cutoff)
+    best = heapq.nlargest(n, [(score, possibilities[idx]) for idx, score in scored])
+    return [match for _, match in best]
+
+
+def compare_inex(norm_title1, norm_title2, threshold_strict=0.9, threshold_short=0.85, short_len_def=20, backend=None):
     if not norm_title1 or not norm_title2: 
         return False
     
     shorter_len = min(len(norm_title1), len(norm_title2))
     current_threshold = threshold_strict if shorter_len > short_len_def else threshold_short
         
-    matches = get_close_matches(norm_title1, [norm_title2], n=1, cutoff=current_threshold)
+    matches = get_similarity_backend(backend).score_many(norm_title1, [norm_title2], current_threshold)
     return bool(matches)
 
 
 def ex_in_coll(original_title_to_check, collection_df):
-    if 'Titres' not in collection_df.columns or collection_df.empty:
+    collection = as_hal_collection(collection_df)
+    if collection.empty:
         return False 
     
-    match_df = collection_df[collection_df['Titres'] == original_title_to_check]
-    if not match_df.empty:
-        row = match_df.iloc[0]
-        return [
-            "Titre trouvé dans la collection : probablement déjà présent",
-            original_title_to_check, 
-            row.get('Hal_ids', ''),
-            row.get('Types de dépôts', ''),
-            row.get('HAL Link', ''), 
-            row.get('HAL Ext ID', ''),
-            row.get('HAL_URI', '') 
-        ]
+    record = collection.lookup_title(original_title_to_check)
+    if record is not None:
+        return ["Titre trouvé dans la collection : probablement déjà présent", original_title_to_check] + record[1:]
     return False
 
-def inex_in_coll(normalised_title_to_check, original_title, collection_df):
-    if 'nti' not in collection_df.columns or collection_df.empty:
+def inex_in_coll(normalised_title_to_check, original_title, collection_df,
+                 threshold_strict=0.9, threshold_short=0.85, short_len_def=20, backend=None):
+    collection = as_hal_collection(collection_df)
+    if collection.empty:
         return False
-        
-    for idx, hal_title_norm_from_coll in enumerate(collection_df['nti']):
-        if compare_inex(normalised_title_to_check, hal_title_norm_from_coll): 
-            row = collection_df.iloc[idx]
-            return [
-                "Titre approchant trouvé dans la collection : à vérifier",
-                row.get('Titres', ''), 
-                row.get('Hal_ids', ''),
-                row.get('Types de dépôts', ''),
-                row.get('HAL Link', ''), 
-                row.get('HAL Ext ID', ''),
-                row.get('HAL_URI', '') 
-            ]
+    if not normalised_title_to_check:
+        return False
+
+    # Un seul appel groupé au seuil le plus bas, puis seuil propre à chaque paire (cf. compare_inex)
+    hal_titles_norm = collection.normalised_titles
+    len_title = len(normalised_title_to_check)
+    scored = get_similarity_backend(backend).score_many(
+        normalised_title_to_check, hal_titles_norm, min(threshold_strict, threshold_short)
+    )
+    for idx, score in scored:
+        hal_title_norm_from_coll = hal_titles_norm[idx]
+        if not hal_title_norm_from_coll:
+            continue
+        shorter_len = min(len_title, len(hal_title_norm_from_coll))
+        if score >= (threshold_strict if shorter_len > short_len_def else threshold_short):
+            return ["Titre approchant trouvé dans la collection : à vérifier"] + collection.title_record(idx)
     return False
 
 
-def in_hal(title_solr_escaped_exact, original_title_to_check):
+_hal_global_index = None
+_hal_global_index_checked_at = None
+
+
+def get_hal_global_index():
+    """
+    Index local HAL (mémoire mappée), rouvert après une mise à jour (nouvelle génération),
+    ou None s'il n'a pas été construit ou si sa dernière récolte date de plus de HAL_INDEX_MAX_AGE_DAYS jours.
+    """
+    global _hal_global_index, _hal_global_index_checked_at
+    now = time.monotonic()
+    if _hal_global_index_checked_at is not None and now - _hal_global_index_checked_at < HAL_INDEX_RECHECK_SECONDS:
+        return _hal_global_index
+    _hal_global_index_checked_at = now
+    index = None
+    if USE_HAL_GLOBAL_INDEX and HalGlobalIndex.exists(HAL_INDEX_DIR):
+        index = _hal_global_index
+        if index is None or index.generation_dir != generation_dir(HAL_INDEX_DIR):
+            index = HalGlobalIndex(HAL_INDEX_DIR, normalise_title=normalise)
+        age = index.age_days()
+        if age is None or age > HAL_INDEX_MAX_AGE_DAYS:
+            index = None
+    _hal_global_index = index
+    return index
+
+
+def _hal_doc_fields(hal_doc):
+    """ Les 6 champs HAL (titre, docid, type de dépôt, liens, URI) d'un document de l'API. """
+    return [
+        (hal_doc.get('title_s') or [""])[0],
+        hal_doc.get('docid', ''),
+        hal_doc.get('submitType_s', ''),
+        hal_doc.get('linkExtUrl_s', ''),
+        hal_doc.get('linkExtId_s', ''),
+        hal_doc.get('uri_s', '')
+    ]
+
+
+HAL_TITLE_EXACT_STATUS = "Titre trouvé dans HAL mais hors de la collection : affiliation probablement à corriger"
+HAL_TITLE_APPROX_STATUS = "Titre approchant trouvé dans HAL mais hors de la collection : vérifier les affiliations"
+
+
+def prepare_hal_title_candidates(hal_docs):
+    """ (titre, titre normalisé, doc) pour chaque titre des documents HAL candidats. """
+    return [(hal_title, normalise(hal_title), doc) for doc in hal_docs for hal_title in doc.get('title_s', [])]
+
+
+def match_hal_title(original_title, hal_docs, threshold_strict=0.9, threshold_short=0.85, short_len_def=20, backend=None,
+                    candidates=None):
+    """
+    Re-classement local des candidats HAL d'un titre : titre identique d'abord (dans l'ordre de HAL),
+    sinon meilleur score de similarité au-dessus des seuils de compare_inex.
+    candidates : résultat de prepare_hal_title_candidates(hal_docs), pour le réutiliser entre titres.
+    Retourne (statut, doc) ou None.
+    """
+    if candidates is None:
+        candidates = prepare_hal_title_candidates(hal_docs)
+    for hal_title, _, doc in candidates:
+        if original_title == hal_title:
+            return HAL_TITLE_EXACT_STATUS, doc
+
+    title_orig_norm = normalise(original_title)
+    if not title_orig_norm:
+        return None
+    norm_titles = [norm for _, norm, _ in candidates]
+    best_score, best_doc = 0.0, None
+    for idx, score in get_similarity_backend(backend).score_many(title_orig_norm, norm_titles, min(threshold_strict, threshold_short)):
+        hal_title_norm = norm_titles[idx]
+        if not hal_title_norm:
+            continue
+        shorter_len = min(len(title_orig_norm), len(hal_title_norm))
+        current_threshold = threshold_strict if shorter_len > short_len_def else threshold_short
+        if score >= current_threshold and score > best_score:
+            best_score, best_doc = score, candidates[idx][2]
+    if best_doc is not None:
+        return HAL_TITLE_APPROX_STATUS, best_doc
+    return None
+
+
+def hal_index_title_result(original_title, hal_doc):
+    """
+    Résultat à 7 champs d'un titre trouvé dans l'index local (égalité des titres normalisés) :
+    statut exact seulement si le titre brut est identique, comme match_hal_title.
+    """
+    status = HAL_TITLE_EXACT_STATUS if original_title in hal_doc.get('title_s', []) else HAL_TITLE_APPROX_STATUS
+    return [status] + _hal_doc_fields(hal_doc)
+
+
+def in_hal(title_solr_escaped, original_title_to_check):
     default_return = ["Hors HAL", original_title_to_check, "", "", "", "", ""]
+    hal_index = get_hal_global_index()
     try:
-        query_exact = f'title_t:({title_solr_escaped_exact})' 
-        
-        r_exact_req = requests.get(f"{HAL_API_ENDPOINT}?q={query_exact}&rows=1&fl={HAL_FIELDS_TO_FETCH}", timeout=10)
-        r_exact_req.raise_for_status()
-        r_exact_json = r_exact_req.json()
-        
-        if r_exact_json.get('response', {}).get('numFound', 0) > 0:
-            doc_exact = r_exact_json['response']['docs'][0]
-            if any(original_title_to_check == hal_title for hal_title in doc_exact.get('title_s', [])):
-                return [
-                    "Titre trouvé dans HAL mais hors de la collection : affiliation probablement à corriger",
-                    doc_exact.get('title_s', [""])[0],
-                    doc_exact.get('docid', ''),
-                    doc_exact.get('submitType_s', ''),
-                    doc_exact.get('linkExtUrl_s', ''), 
-                    doc_exact.get('linkExtId_s', ''),
-                    doc_exact.get('uri_s', '') 
-                ]
-
-        query_approx = f'title_t:({escapeSolrArg(original_title_to_check)})'
-
-        r_approx_req = requests.get(f"{HAL_API_ENDPOINT}?q={query_approx}&rows=1&fl={HAL_FIELDS_TO_FETCH}", timeout=10)
-        r_approx_req.raise_for_status()
-        r_approx_json = r_approx_req.json()
-
-        if r_approx_json.get('response', {}).get('numFound', 0) > 0:
-            doc_approx = r_approx_json['response']['docs'][0]
-            title_orig_norm = normalise(original_title_to_check)
-            if any(compare_inex(title_orig_norm, normalise(hal_title)) for hal_title in doc_approx.get('title_s', [])):
-                return [
-                    "Titre approchant trouvé dans HAL mais hors de la collection : vérifier les affiliations",
-                    doc_approx.get('title_s', [""])[0],
-                    doc_approx.get('docid', ''),
-                    doc_approx.get('submitType_s', ''),
-                    doc_approx.get('linkExtUrl_s', ''), 
-                    doc_approx.get('linkExtId_s', ''),
-                    doc_approx.get('uri_s', '') 
-                ]
+        if hal_index is not None:
+            # Titre normalisé cherché dans l'index local ; absent de l'index, HAL est interrogé
+            doc_local = hal_index.lookup_title(normalise(original_title_to_check))
+            if doc_local is not None:
+                return hal_index_title_result(original_title_to_check, doc_local)
+
+        # Une seule requête : les statuts exact et approchant sont calculés sur les k premiers candidats
+        query = f'title_t:({title_solr_escaped})'
+        r_req = http_client.get(f"{HAL_API_ENDPOINT}?q={query}&rows={HAL_TITLE_CANDIDATES}&fl={HAL_TITLE_FIELDS}", timeout=10, hedge=True, route="hal-titre")
+        r_req.raise_for_status()
+        r_json = r_req.json()
+
+        match = match_hal_title(original_title_to_check, r_json.get('response', {}).get('docs', []))
+        if match is not None:
+            status, doc = match
+            return [status] + _hal_doc_fields(doc)
     except requests.exceptions.RequestException as e:
         _display_long_warning("Erreur de requête à l'API HAL", "titre", original_title_to_check, e)
     except (KeyError, IndexError, json.JSONDecodeError) as e_json:
@@ -316,11 +666,85 @@ def in_hal(title_solr_escaped_exact, original_title_to_check):
     return default_return
 
 
-def statut_titre(title_to_check, collection_df):
-    default_return_statut = ["Titre invalide", "", "", "", "", "", ""]
-    if not isinstance(title_to_check, str) or not title_to_check.strip():
-        return default_return_statut
+def _query_hal_title_batch(titles):
+    """
+    Une requête POST pour un lot de titres, groupée par titre (un group.query title_t:(...) par titre,
+    HAL_TITLE_CANDIDATES documents chacun) : un titre long ou courant ne peut pas occuper les
+    candidats d'un autre. Renvoie (documents candidats, numFound) pour chaque titre, dans l'ordre.
+    Lève KeyError si la réponse n'est pas groupée.
+    """
+    group_queries = [f"title_t:({escapeSolrArg(title)})" for title in titles]
+    params = {
+        'q': " OR ".join(group_queries),
+        'group': 'true',
+        'group.query': group_queries,
+        'group.limit': HAL_TITLE_CANDIDATES,
+        'rows': 1,
+        'fl': HAL_TITLE_FIELDS,
+        'wt': 'json',
+    }
+    r_req = http_client.post(HAL_API_ENDPOINT, data=params, timeout=30, route="hal-titre-lot")
+    r_req.raise_for_status()
+    grouped = r_req.json()['grouped']
+    doclists = [grouped[group_query]['doclist'] for group_query in group_queries]
+    return [(doclist['docs'], doclist['numFound']) for doclist in doclists]
+
+
+def in_hal_batch(titles, batch_size=None, max_workers=5):
+    """
+    Équivalent groupé de in_hal pour une liste de titres : les titres sont envoyés par lots
+    et chaque titre est comparé localement (match_hal_title, mêmes seuils) à ses propres candidats
+    (groupe Solr du titre). Un groupe non plein (numFound <= HAL_TITLE_CANDIDATES) contient tous les
+    documents du titre, donc les candidats de in_hal : sans correspondance, le titre est "Hors HAL".
+    Un groupe plein est classé selon la requête du lot entier et non celle du titre : sans
+    correspondance, le titre est vérifié à nouveau seul avec in_hal, de même que tout un lot en erreur.
+    Retourne les résultats à 7 champs dans l'ordre des titres.
+    """
+    batch_size = batch_size or HAL_TITLE_BATCH_SIZE
+    results = [None] * len(titles)
+
+    hal_index = get_hal_global_index()
+    pending = []
+    for i, title in enumerate(titles):
+        doc_local = hal_index.lookup_title(normalise(title)) if hal_index is not None else None
+        if doc_local is not None:
+            results[i] = hal_index_title_result(title, doc_local)
+        else:
+            pending.append(i)
+
+    batches = [pending[k:k + batch_size] for k in range(0, len(pending), batch_size)]
 
+    def resolve_batch(batch):
+        batch_titles = [titles[i] for i in batch]
+        try:
+            docs_by_title = _query_hal_title_batch(batch_titles)
+        except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError, TypeError):
+            return [in_hal(escapeSolrArg(title), title) for title in batch_titles]
+        batch_results = []
+        for title, (docs, num_found) in zip(batch_titles, docs_by_title):
+            match = match_hal_title(title, docs)
+            if match is not None:
+                batch_results.append([match[0]] + _hal_doc_fields(match[1]))
+            elif num_found > len(docs):
+                # Groupe plein : les candidats de in_hal ont pu être écartés par le classement du lot
+                batch_results.append(in_hal(escapeSolrArg(title), title))
+            else:
+                batch_results.append(["Hors HAL", title, "", "", "", "", ""])
+        return batch_results
+
+    with RunExecutor(max_workers=max_workers) as executor:
+        for batch, batch_results in zip(batches, tqdm(executor.map(resolve_batch, batches), total=len(batches),
+                                                       desc="Recherche groupée des titres dans HAL")):
+            for i, res in zip(batch, batch_results):
+                results[i] = res
+    return results
+
+
+def statut_titre_in_coll(title_to_check, collection_df):
+    """
+    Partie locale (CPU) de statut_titre : titre exact puis titre approchant dans la collection.
+    Retourne le résultat à 7 champs, ou False si le titre n'est pas trouvé dans la collection.
+    """
     original_title = title_to_check 
     processed_title_for_norm = original_title
     try:
@@ -339,11 +763,19 @@ def statut_titre(title_to_check, collection_df):
     if res_ex_coll: 
         return res_ex_coll
 
-    res_inex_coll = inex_in_coll(title_normalised, original_title, collection_df)
-    if res_inex_coll: 
-        return res_inex_coll
+    return inex_in_coll(title_normalised, original_title, collection_df)
+
+
+def statut_titre(title_to_check, collection_df):
+    default_return_statut = ["Titre invalide", "", "", "", "", "", ""]
+    if not isinstance(title_to_check, str) or not title_to_check.strip():
+        return default_return_statut
+
+    res_coll = statut_titre_in_coll(title_to_check, collection_df)
+    if res_coll: 
+        return res_coll
         
-    res_hal_global = in_hal(escapeSolrArg(original_title), original_title) 
+    res_hal_global = in_hal(escapeSolrArg(title_to_check), title_to_check) 
     return res_hal_global
 
 
@@ -354,24 +786,21 @@ def statut_doi(doi_to_check, collection_df):
 
     doi_cleaned_lower = str(doi_to_check).lower().strip()
     
-    if 'DOIs' in collection_df.columns and not collection_df.empty:
-        dois_coll_set = set(collection_df['DOIs'].dropna().astype(str).str.lower().str.strip())
-        if doi_cleaned_lower in dois_coll_set:
-            match_series = collection_df[collection_df['DOIs'].astype(str).str.lower().str.strip() == doi_cleaned_lower].iloc[0]
-            return [
-                "Dans la collection",
-                match_series.get('Titres', ''), 
-                match_series.get('Hal_ids', ''),
-                match_series.get('Types de dépôts', ''),
-                match_series.get('HAL Link', ''), 
-                match_series.get('HAL Ext ID', ''),
-                match_series.get('HAL_URI', '') 
-            ]
+    record = as_hal_collection(collection_df).lookup_doi(doi_cleaned_lower)
+    if record is not None:
+        return ["Dans la collection"] + record
+
+    hal_index = get_hal_global_index()
+    if hal_index is not None:
+        doc_local = hal_index.lookup_doi(doi_cleaned_lower)
+        if doc_local is not None:
+            return ["Dans HAL mais hors de la collection"] + _hal_doc_fields(doc_local)
+        # Absent de l'index : peut-être déposé depuis la dernière récolte, l'API tranche
 
     solr_doi_query_val = escapeSolrArg(doi_cleaned_lower.replace("https://doi.org/", ""))
     
     try:
-        r_req = requests.get(f"{HAL_API_ENDPOINT}?q=doiId_s:\"{solr_doi_query_val}\"&rows=1&fl={HAL_FIELDS_TO_FETCH}", timeout=10)
+        r_req = http_client.get(f"{HAL_API_ENDPOINT}?q=doiId_s:\"{solr_doi_query_val}\"&rows=1&fl={HAL_FIELDS_TO_FETCH}", timeout=10, hedge=True, route="hal-doi")
         r_req.raise_for_status()
         r_json = r_req.json()
         
@@ -394,6 +823,83 @@ def statut_doi(doi_to_check, collection_df):
     return default_return_doi 
 
 
+def pmid_from_row(data_source, id_value):
+    """ PMID d'une ligne issue de PubMed (colonne 'id', éventuellement fusionnée avec '|'), sinon None. """
+    if not isinstance(data_source, str) or 'pubmed' not in data_source.split('|'):
+        return None
+    if id_value is None or (not isinstance(id_value, str) and pd.isna(id_value)):
+        return None
+    for part in str(id_value).split('|'):
+        part = part.strip()
+        if part.isdigit():
+            return part
+    return None
+
+
+def pmids_in_hal_batch(pmids, batch_size=HAL_PMID_BATCH_SIZE):
+    """
+    Recherche exacte de PMID dans tout HAL (pubmedId_s), par lots.
+    Un PMID peut avoir plusieurs notices HAL : les résultats d'un lot sont parcourus page par
+    page (start, tri par docid) jusqu'à numFound ou jusqu'à ce que chaque PMID du lot soit trouvé.
+    Retourne {pmid: résultat à 7 champs} pour les PMID trouvés.
+    """
+    found = {}
+    unique_pmids = list(dict.fromkeys(pmids))
+    for k in range(0, len(unique_pmids), batch_size):
+        batch = unique_pmids[k:k + batch_size]
+        batch_set = set(batch)
+        start = 0
+        while True:
+            params = {
+                'q': f"pubmedId_s:({' OR '.join(batch)})",
+                'rows': len(batch) * 2,
+                'start': start,
+                'sort': 'docid asc',
+                'fl': HAL_TITLE_FIELDS + ",pubmedId_s",
+                'wt': 'json',
+            }
+            try:
+                r_req = http_client.post(HAL_API_ENDPOINT, data=params, timeout=30, route="hal-pmid-lot")
+                r_req.raise_for_status()
+                response = r_req.json().get('response', {})
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                st.warning(f"Recherche des PMID dans HAL impossible pour un lot de {len(batch)} identifiants : {e}")
+                break
+            docs = response.get('docs', [])
+            for doc in docs:
+                doc_pmids = doc.get('pubmedId_s', '')
+                for doc_pmid in (doc_pmids if isinstance(doc_pmids, list) else [doc_pmids]):
+                    doc_pmid = str(doc_pmid).strip()
+                    if doc_pmid in batch_set and doc_pmid not in found:
+                        found[doc_pmid] = ["Dans HAL mais hors de la collection"] + _hal_doc_fields(doc)
+            start += len(docs)
+            if not docs or start >= response.get('numFound', 0) or batch_set.issubset(found):
+                break
+    return found
+
+
+def resolve_pmids(pmid_by_row, collection_df):
+    """
+    Correspondance exacte par PMID : d'abord dans la collection, puis par lots dans HAL.
+    pmid_by_row : {ligne: pmid}. Retourne {ligne: résultat à 7 champs} pour les lignes résolues.
+    """
+    collection = as_hal_collection(collection_df)
+    resolved = {}
+    missing = {}
+    for row_key, pmid in pmid_by_row.items():
+        record = collection.lookup_external_id('PMID', pmid) if len(collection) else None
+        if record is not None:
+            resolved[row_key] = ["Dans la collection"] + record
+        else:
+            missing[row_key] = pmid
+    if missing:
+        found_in_hal = pmids_in_hal_batch(list(missing.values()))
+        for row_key, pmid in missing.items():
+            if pmid in found_in_hal:
+                resolved[row_key] = found_in_hal[pmid]
+    return resolved
+
+
 def query_upw(doi_value):
     if pd.isna(doi_value) or not str(doi_value).strip():
         return {"Statut Unpaywall": "DOI manquant", "doi_interroge": str(doi_value)}
@@ -402,9 +908,11 @@ def query_upw(doi_value):
     email = "hal.dbm@listes.u-paris.fr" 
     
     try:
-        req = requests.get(f"https://api.unpaywall.org/v2/{doi_cleaned}?email={email}", timeout=15)
+        req = http_client.get(f"https://api.unpaywall.org/v2/{normalize_doi_for_matching(doi_cleaned)}?email={email}", timeout=15, route="unpaywall-doi")
         req.raise_for_status()
         res = req.json()
+    except http_client.ServiceUnavailable:
+        return {"Statut Unpaywall": f"Unpaywall : {SERVICE_UNAVAILABLE}", "doi_interroge": doi_cleaned}
     except requests.exceptions.Timeout:
         return {"Statut Unpaywall": "timeout Unpaywall", "doi_interroge": doi_cleaned}
     except requests.exceptions.HTTPError as e:
@@ -446,70 +954,168 @@ def query_upw(doi_value):
 
 
 def enrich_w_upw_parallel(input_df):
+    """
+    Ajoute les colonnes Unpaywall (UPW_OUTPUT_COLS) à input_df, complété sur place et renvoyé
+    (l'appelant cède le DataFrame : pas de copie).
+    """
     if input_df.empty or 'doi' not in input_df.columns:
         st.warning("DataFrame vide ou colonne 'doi' manquante pour l'enrichissement Unpaywall.")
-        upw_cols = ["Statut Unpaywall", "oa_status", "oa_publisher_license", "oa_publisher_link", "oa_repo_link", "publisher", "doi_interroge"]
-        for col in upw_cols:
+        for col in UPW_OUTPUT_COLS:
             if col not in input_df.columns:
                 input_df[col] = pd.NA
         return input_df
 
-    df_copy = input_df.copy() 
-    df_copy.reset_index(drop=True, inplace=True)
+    input_df.reset_index(drop=True, inplace=True)
 
-    dois_to_query = df_copy['doi'].fillna("").tolist()
+    dois_to_query = input_df['doi'].fillna("").tolist()
 
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor: 
+    with RunExecutor(max_workers=HTTP_POOL_WORKERS) as executor: 
         results = list(tqdm(executor.map(query_upw, dois_to_query), total=len(dois_to_query), desc="Enrichissement Unpaywall"))
 
     if results:
         upw_results_df = pd.DataFrame(results)
         for col in upw_results_df.columns:
-            if col not in df_copy.columns: 
-                 df_copy[col] = pd.NA 
-            df_copy[col] = upw_results_df[col].values 
+            if col not in input_df.columns: 
+                 input_df[col] = pd.NA 
+            input_df[col] = upw_results_df[col].values 
     else: 
         st.info("Aucun résultat d'enrichissement Unpaywall à ajouter.")
-        upw_cols = ["Statut Unpaywall", "oa_status", "oa_publisher_license", "oa_publisher_link", "oa_repo_link", "publisher", "doi_interroge"]
-        for col in upw_cols:
-            if col not in df_copy.columns:
-                df_copy[col] = pd.NA
+        for col in UPW_OUTPUT_COLS:
+            if col not in input_df.columns:
+                input_df[col] = pd.NA
                 
-    return df_copy
+    return input_df
 
 
-def add_permissions(row_series_data):
-    doi_val = row_series_data.get('doi') 
-    if pd.isna(doi_val) or not str(doi_val).strip():
-        return "DOI manquant pour permissions"
+def upw_info_from_openalex(openalex_work, doi_value):
+    """
+    Construit le même dictionnaire que query_upw à partir d'une notice OpenAlex
+    (open_access, best_oa_location, primary_location), alimentée par les mêmes données Unpaywall.
+    """
+    open_access = openalex_work.get("open_access") or {}
+    primary_source = (openalex_work.get("primary_location") or {}).get("source") or {}
+    oa_status_val = open_access.get("oa_status") or ""
+    upw_info = {
+        "Statut Unpaywall": "closed" if not open_access.get("is_oa") else "open",
+        # "diamond" n'existe pas dans Unpaywall (classé "gold")
+        "oa_status": "gold" if oa_status_val == "diamond" else oa_status_val,
+        "oa_publisher_license": "",
+        "oa_publisher_link": "",
+        "oa_repo_link": "",
+        "publisher": primary_source.get("host_organization_name") or "",
+        "doi_interroge": str(doi_value).strip()
+    }
+
+    best_oa_loc = openalex_work.get("best_oa_location")
+    if best_oa_loc and best_oa_loc.get("source"):
+        source_type = best_oa_loc["source"].get("type", "")
+        license_val = best_oa_loc.get("license")
+        url_pdf = best_oa_loc.get("pdf_url")
+        url_landing = best_oa_loc.get("landing_page_url")
+
+        if source_type == "repository":
+            upw_info["oa_repo_link"] = str(url_pdf or url_landing or "")
+        else:
+            upw_info["oa_publisher_license"] = license_val if license_val else ""
+            upw_info["oa_publisher_link"] = url_pdf or url_landing or ""
+
+    return upw_info
+
+
+def enrich_oa_status(input_df, openalex_works=None):
+    """
+    Variante de enrich_w_upw_parallel qui remplit les mêmes colonnes en limitant les appels :
+    notices OpenAlex déjà récoltées, puis requêtes OpenAlex groupées par DOI, et Unpaywall
+    (un appel par DOI) uniquement pour les DOI absents d'OpenAlex.
+    La colonne 'Source OA' indique l'origine des informations.
+    input_df est complété sur place et renvoyé.
+    """
+    if input_df.empty or 'doi' not in input_df.columns:
+        return enrich_w_upw_parallel(input_df)
+
+    input_df.reset_index(drop=True, inplace=True)
+
+    dois_list = input_df['doi'].fillna("").tolist()
+    doi_keys = [normalize_doi_for_matching(doi) for doi in dois_list]
+
+    works_by_doi = {}
+    source_by_doi = {}
+    for work in openalex_works or []:
+        key = normalize_doi_for_matching(work.get('doi')) if isinstance(work, dict) else ""
+        if key and key not in works_by_doi and 'open_access' in work:
+            works_by_doi[key] = work
+            source_by_doi[key] = "openalex"
+
+    pending = [key for key in dict.fromkeys(doi_keys) if key and key not in works_by_doi]
+    if pending:
+        fetched = get_openalex_works_by_doi(pending, select='doi,open_access,best_oa_location,primary_location')
+        for key, work in fetched.items():
+            works_by_doi[key] = work
+            source_by_doi[key] = "openalex (requête)"
+
+    results = [None] * len(dois_list)
+    upw_rows = []
+    for i, (doi, key) in enumerate(zip(dois_list, doi_keys)):
+        if key in works_by_doi:
+            results[i] = upw_info_from_openalex(works_by_doi[key], doi)
+        else:
+            upw_rows.append(i)
+
+    with RunExecutor(max_workers=HTTP_POOL_WORKERS) as executor: 
+        upw_results = list(tqdm(executor.map(query_upw, [dois_list[i] for i in upw_rows]), total=len(upw_rows), desc="Enrichissement Unpaywall (repli)"))
+    for i, res in zip(upw_rows, upw_results):
+        results[i] = res
 
-    doi_cleaned_for_api = str(doi_val).strip()
-    permissions_api_url = f"https://bg.api.oa.works/permissions/{doi_cleaned_for_api}"
+    upw_results_df = pd.DataFrame(results)
+    for col in upw_results_df.columns:
+        input_df[col] = upw_results_df[col].values 
+    for col in UPW_OUTPUT_COLS:
+        if col not in input_df.columns:
+            input_df[col] = pd.NA
+    input_df['Source OA'] = [source_by_doi.get(key, "unpaywall" if key else "") for key in doi_keys]
+    return input_df
+
+
+def fetch_permission(doi_cleaned_for_api):
+    """
+    Interroge oa.works pour un DOI.
+    Retourne (message, best_permission, definitif) : message est le texte de la colonne
+    deposit_condition, best_permission le dictionnaire brut (ou None), definitif indique
+    si la réponse peut être mise en cache (pas de timeout ni d'erreur transitoire).
+    """
+    permissions_api_url = f"{PERMISSIONS_API_ENDPOINT}{normalize_doi_for_matching(doi_cleaned_for_api)}"
     try:
-        req = requests.get(permissions_api_url, timeout=15)
+        req = http_client.get(permissions_api_url, timeout=15, route="oaworks-permissions")
         req.raise_for_status() 
         res_json = req.json()
         
         best_permission_info = res_json.get("best_permission") 
         if not best_permission_info:
-            return "Aucune permission trouvée (oa.works)"
+            return "Aucune permission trouvée (oa.works)", None, True
 
+    except http_client.ServiceUnavailable:
+        return f"oa.works : {SERVICE_UNAVAILABLE}", None, False
     except requests.exceptions.Timeout:
-        return f"Timeout permissions (oa.works) pour DOI {doi_cleaned_for_api}"
+        return f"Timeout permissions (oa.works) pour DOI {doi_cleaned_for_api}", None, False
     except requests.exceptions.HTTPError as e:
         status_code = e.response.status_code if hasattr(e, 'response') and e.response is not None else 'N/A'
         if status_code == 404:
-            return f"Permissions non trouvées (404 oa.works) pour DOI {doi_cleaned_for_api}"
+            return f"Permissions non trouvées (404 oa.works) pour DOI {doi_cleaned_for_api}", None, True
         elif status_code == 501: 
-            return f"Permissions API non applicable pour ce type de document (501 oa.works) pour DOI {doi_cleaned_for_api}"
+            return f"Permissions API non applicable pour ce type de document (501 oa.works) pour DOI {doi_cleaned_for_api}", None, True
         else:
-            return f"Erreur HTTP {status_code} permissions (oa.works) pour DOI {doi_cleaned_for_api}: {str(e)}"
+            return f"Erreur HTTP {status_code} permissions (oa.works) pour DOI {doi_cleaned_for_api}: {str(e)}", None, False
     except requests.exceptions.RequestException as e:
-        return f"Erreur requête permissions (oa.works) pour DOI {doi_cleaned_for_api}: {type(e).__name__}"
+        return f"Erreur requête permissions (oa.works) pour DOI {doi_cleaned_for_api}: {type(e).__name__}", None, False
     except json.JSONDecodeError:
-        return f"Erreur JSON permissions (oa.works) pour DOI {doi_cleaned_for_api}"
+        return f"Erreur JSON permissions (oa.works) pour DOI {doi_cleaned_for_api}", None, False
+
+    return format_permission(best_permission_info), best_permission_info, True
 
+
+def format_permission(best_permission_info):
+    """ Texte de la colonne deposit_condition pour une permission oa.works. """
     locations_allowed = best_permission_info.get("locations", [])
     if not any("repository" in str(loc).lower() for loc in locations_allowed):
         return "Dépôt en archive non listé dans les permissions (oa.works)"
@@ -531,35 +1137,196 @@ def add_permissions(row_series_data):
     return f"Info permission (oa.works): {version_allowed} ; {licence_info} ; {embargo_display_str}"
 
 
+def add_permissions(row_series_data):
+    return permission_for_doi(row_series_data.get('doi'))
+
+
+def permission_for_doi(doi_val):
+    if pd.isna(doi_val) or not str(doi_val).strip():
+        return "DOI manquant pour permissions"
+
+    message, _, _ = fetch_permission(str(doi_val).strip())
+    return message
+
+
 def add_permissions_parallel(input_df):
+    """
+    Ajoute la colonne 'deposit_condition' (oa.works) à input_df, complété sur place et renvoyé.
+    """
     if input_df.empty or 'doi' not in input_df.columns: 
         st.warning("DataFrame vide ou colonne 'doi' manquante pour l'ajout des permissions.")
         if 'deposit_condition' not in input_df.columns and not input_df.empty:
              input_df['deposit_condition'] = pd.NA 
         return input_df
 
-    df_copy = input_df.copy() 
-    
-    if 'deposit_condition' not in df_copy.columns:
-        df_copy['deposit_condition'] = pd.NA
-
-    def apply_add_permissions_to_row(row_as_series):
-        return add_permissions(row_as_series)
+    if 'deposit_condition' not in input_df.columns:
+        input_df['deposit_condition'] = pd.NA
 
-    rows_as_series_list = [row_data for _, row_data in df_copy.iterrows()]
+    # Seule la colonne DOI est lue : pas de Series par ligne (iterrows)
+    dois_list = input_df['doi'].tolist()
     
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor: 
-        results = list(tqdm(executor.map(apply_add_permissions_to_row, rows_as_series_list), total=len(df_copy), desc="Ajout des permissions de dépôt"))
+    with RunExecutor(max_workers=HTTP_POOL_WORKERS) as executor: 
+        results = list(tqdm(executor.map(permission_for_doi, dois_list), total=len(dois_list), desc="Ajout des permissions de dépôt"))
 
     if results:
-        df_copy['deposit_condition'] = results
+        input_df['deposit_condition'] = results
     else: 
         st.info("Aucun résultat d'ajout de permissions.")
-        if 'deposit_condition' not in df_copy.columns:
-            df_copy['deposit_condition'] = pd.NA
+        if 'deposit_condition' not in input_df.columns:
+            input_df['deposit_condition'] = pd.NA
             
-    return df_copy
+    return input_df
+
+
+# Émetteurs dont la politique vaut pour toute la revue (les politiques "article",
+# "funder" ou "university" dépendent de l'article et ne sont pas réutilisées)
+JOURNAL_LEVEL_PERMISSION_ISSUERS = ("journal", "publisher")
+
+_permissions_cache = None
+
+
+def get_permissions_cache():
+    """ Cache persistant des permissions oa.works (créé à la première utilisation). """
+    global _permissions_cache
+    if _permissions_cache is None:
+        _permissions_cache = PersistentCache("permissions", PERMISSIONS_CACHE_TTL)
+    return _permissions_cache
+
+
+def _issn_by_doi_from_openalex(openalex_works):
+    """ {doi normalisé: ISSN-L de la revue} à partir des notices OpenAlex. """
+    issn_by_doi = {}
+    for work in openalex_works or []:
+        if not isinstance(work, dict):
+            continue
+        doi_key = normalize_doi_for_matching(work.get('doi'))
+        source = (work.get('primary_location') or {}).get('source') or {}
+        issn = source.get('issn_l') or (source.get('issn') or [None])[0]
+        if doi_key and issn:
+            issn_by_doi.setdefault(doi_key, str(issn).strip().upper())
+    return issn_by_doi
+
+
+def _journal_key(doi_key, source_title, issn_by_doi):
+    """ Clé de regroupement par revue : ISSN-L (OpenAlex) sinon titre de la source normalisé. """
+    if doi_key in issn_by_doi:
+        return "issn:" + issn_by_doi[doi_key]
+    title = _safe_str(source_title)
+    # Titres absents ou fusionnés depuis plusieurs sources ("A|B") : pas de regroupement
+    if not title or title.upper() == "N/A" or '|' in title:
+        return None
+    return "titre:" + normalise(title)
+
+
+def _has_article_level_override(publisher_license):
+    """ Article publié sous licence CC chez l'éditeur : la politique de la revue ne s'applique pas. """
+    return _safe_str(publisher_license).lower().startswith("cc")
+
+
+def add_permissions_by_journal(input_df, openalex_works=None, cache=None):
+    """
+    Variante de add_permissions_parallel qui regroupe les DOI par revue (ISSN-L ou titre de
+    la source) : un DOI représentatif est interrogé par revue et sa politique, si elle est
+    émise par la revue ou l'éditeur, est reprise pour les autres articles.
+    Les articles sous licence CC éditeur sont interrogés individuellement.
+    Les réponses sont conservées dans un cache persistant (PERMISSIONS_CACHE_TTL).
+    input_df est complété sur place et renvoyé.
+    """
+    if input_df.empty or 'doi' not in input_df.columns:
+        return add_permissions_parallel(input_df)
+
+    if cache is None:
+        cache = get_permissions_cache()
+
+    n_rows = len(input_df)
+    doi_values = [_safe_str(d) for d in input_df['doi'].tolist()]
+    doi_keys = [normalize_doi_for_matching(d) for d in doi_values]
+    source_titles = input_df['Source title'].tolist() if 'Source title' in input_df.columns else [None] * n_rows
+    publisher_licenses = input_df['oa_publisher_license'].tolist() if 'oa_publisher_license' in input_df.columns else [None] * n_rows
+    issn_by_doi = _issn_by_doi_from_openalex(openalex_works)
+
+    results = {}
+    from_cache = from_journal = 0
+    groups = defaultdict(list)
+    singles = []
+    seen = set()
+    for doi, doi_key, source_title, licence in zip(doi_values, doi_keys, source_titles, publisher_licenses):
+        if not doi_key or doi_key in seen:
+            continue
+        seen.add(doi_key)
+        cached = cache.get("doi:" + doi_key)
+        if cached is not None:
+            results[doi_key] = cached
+            from_cache += 1
+            continue
+        journal_key = _journal_key(doi_key, source_title, issn_by_doi)
+        if journal_key is None or _has_article_level_override(licence):
+            singles.append(doi)
+        else:
+            groups[journal_key].append(doi)
+
+    for journal_key in list(groups):
+        cached = cache.get("journal:" + journal_key)
+        if cached is not None:
+            for doi in groups.pop(journal_key):
+                results[normalize_doi_for_matching(doi)] = cached
+                from_journal += 1
+
+    def resolve_dois(journal_key, dois):
+        # Interroge les DOI un par un jusqu'à obtenir une politique réutilisable pour la revue
+        resolved, calls = [], 0
+        for idx, doi in enumerate(dois):
+            message, best_permission, definitive = fetch_permission(doi)
+            calls += 1
+            resolved.append((normalize_doi_for_matching(doi), message, False))
+            if definitive:
+                cache.set("doi:" + normalize_doi_for_matching(doi), message)
+            issuer_type = ((best_permission or {}).get('issuer') or {}).get('type')
+            if journal_key and issuer_type in JOURNAL_LEVEL_PERMISSION_ISSUERS:
+                cache.set("journal:" + journal_key, message)
+                resolved.extend((normalize_doi_for_matching(d), message, True) for d in dois[idx + 1:])
+                break
+        return resolved, calls
+
+    tasks = [(None, [doi]) for doi in singles] + list(groups.items())
+    n_calls = 0
+    with RunExecutor(max_workers=HTTP_POOL_WORKERS) as executor:
+        for resolved, calls in tqdm(executor.map(lambda task: resolve_dois(*task), tasks), total=len(tasks), desc="Ajout des permissions de dépôt (par revue)"):
+            n_calls += calls
+            for doi_key, message, inherited in resolved:
+                results[doi_key] = message
+                from_journal += inherited
+
+    input_df['deposit_condition'] = [
+        results.get(doi_key, "DOI manquant pour permissions") if doi_key else "DOI manquant pour permissions"
+        for doi_key in doi_keys
+    ]
+    if seen:
+        st.info(f"Permissions oa.works : {n_calls} requête(s) pour {len(seen)} DOI "
+                f"({from_cache} depuis le cache, {from_journal} déduits de la politique de la revue).")
+    return input_df
+
+
+def flag_rows_for_retry(input_df):
+    """
+    Renseigne RETRY_COL avec les services indisponibles pendant l'exécution (disjoncteur ouvert
+    ou timeout) pour chaque ligne, afin de les relancer plus tard ; vide si la ligne est complète.
+    """
+    services_by_col = {"Statut Unpaywall": "Unpaywall", "deposit_condition": "oa.works"}
+    flags = [[] for _ in range(len(input_df))]
+    for col, service in services_by_col.items():
+        if col not in input_df.columns:
+            continue
+        for i, value in enumerate(input_df[col].tolist()):
+            if isinstance(value, str) and (SERVICE_UNAVAILABLE in value or value.lower().startswith("timeout")):
+                flags[i].append(service)
+    input_df[RETRY_COL] = [", ".join(services) for services in flags]
+    n_flagged = sum(1 for services in flags if services)
+    if n_flagged:
+        st.warning(f"{n_flagged} publication(s) incomplète(s) car un service était indisponible "
+                   f"(colonne « {RETRY_COL} ») : elles seront revérifiées à la prochaine exécution.")
+    return input_df
 
 
 def deduce_todo(row_data):
@@ -726,17 +1493,311 @@ def addCaclLinkFormula(pre_url_str, post_url_str, text_for_link):
     return "" 
 
 
-def check_df(input_df_to_check, hal_collection_df, progress_bar_st=None, progress_text_st=None):
+class HalCollection:
+    """
+    Représentation compacte d'une collection HAL importée : un enregistrement par document
+    (chaînes Arrow, types de dépôt catégoriels) et titres stockés à plat avec leurs offsets.
+    Expose les recherches utilisées par check_df (DOI, titre exact, titres normalisés).
+    """
+    DOC_COLUMNS = ['Hal_ids', 'DOIs', 'Types de dépôts', 'HAL Link', 'HAL Ext ID', 'HAL_URI'] + list(HAL_EXTERNAL_ID_FIELDS.values())
+    LEGACY_COLUMNS = ['Hal_ids', 'DOIs', 'Titres', 'Types de dépôts', 'HAL Link', 'HAL Ext ID', 'HAL_URI', 'nti']
+
+    def __init__(self, docs_columns, titles, title_offsets):
+        hal_ids = pd.to_numeric(pd.Series(docs_columns['Hal_ids'], dtype=object), errors='coerce')
+        docs_df = pd.DataFrame({
+            col: pd.array([_safe_str(v) for v in docs_columns[col]], dtype=COMPACT_STRING_DTYPE)
+            for col in self.DOC_COLUMNS if col not in ('Hal_ids', 'Types de dépôts')
+        })
+        if hal_ids.notna().all():
+            docs_df.insert(0, 'Hal_ids', hal_ids.astype('int64').to_numpy())
+        else:
+            docs_df.insert(0, 'Hal_ids', pd.array([_safe_str(v) for v in docs_columns['Hal_ids']], dtype=COMPACT_STRING_DTYPE))
+        docs_df.insert(2, 'Types de dépôts', pd.Categorical([_safe_str(v) for v in docs_columns['Types de dépôts']]))
+        self.docs = docs_df
+
+        self.titles = pd.array([str(t) for t in titles], dtype=COMPACT_STRING_DTYPE)
+        self.title_offsets = np.asarray(title_offsets, dtype=np.int64)
+        self.title_doc = np.repeat(np.arange(len(docs_df), dtype=np.int32), np.diff(self.title_offsets))
+        self.nti = pd.array([normalise(str(t)) for t in titles], dtype=COMPACT_STRING_DTYPE)
+
+        # Index construits à la demande
+        self._doi_index = None
+        self._external_id_index = {}
+        self._title_index = None
+        self._nti_list = None
+
+    @classmethod
+    def from_hal_docs(cls, hal_docs):
+        """Construit la collection à partir des documents renvoyés par l'API HAL (HAL_COLLECTION_FIELDS)."""
+        docs_columns = {col: [] for col in cls.DOC_COLUMNS}
+        titles = []
+        title_offsets = [0]
+        for doc_data in hal_docs:
+            hal_titles_list = doc_data.get('title_s', [""]) 
+            if not isinstance(hal_titles_list, list): hal_titles_list = [str(hal_titles_list)] 
+            titles.extend(str(title_item) for title_item in hal_titles_list)
+            title_offsets.append(len(titles))
+
+            docs_columns['Hal_ids'].append(doc_data.get('docid', ''))
+            docs_columns['DOIs'].append(str(doc_data.get('doiId_s', '')).lower() if doc_data.get('doiId_s') else '')
+            docs_columns['Types de dépôts'].append(doc_data.get('submitType_s', ''))
+            docs_columns['HAL Link'].append(doc_data.get('linkExtUrl_s', ''))
+            docs_columns['HAL Ext ID'].append(doc_data.get('linkExtId_s', ''))
+            docs_columns['HAL_URI'].append(doc_data.get('uri_s', ''))
+            for hal_field, col in HAL_EXTERNAL_ID_FIELDS.items():
+                ext_value = doc_data.get(hal_field, '')
+                docs_columns[col].append(ext_value[0] if isinstance(ext_value, list) and ext_value else ext_value)
+        return cls(docs_columns, titles, title_offsets)
+
+    @classmethod
+    def from_dataframe(cls, collection_df):
+        """Construit la collection depuis l'ancien format (une ligne par titre, colonnes LEGACY_COLUMNS)."""
+        if collection_df is None or collection_df.empty or 'Titres' not in collection_df.columns:
+            return cls.from_hal_docs([])
+        docs_columns = {col: [] for col in cls.DOC_COLUMNS}
+        titles_by_doc = []
+        doc_positions = {}
+        for rec in collection_df.to_dict(orient='records'):
+            doc_key = rec.get('Hal_ids', '')
+            if doc_key not in doc_positions:
+                doc_positions[doc_key] = len(titles_by_doc)
+                titles_by_doc.append([])
+                for col in cls.DOC_COLUMNS:
+                    docs_columns[col].append(rec.get(col, ''))
+            titles_by_doc[doc_positions[doc_key]].append(rec.get('Titres', ''))
+        titles = [title for doc_titles in titles_by_doc for title in doc_titles]
+        title_offsets = np.concatenate([[0], np.cumsum([len(doc_titles) for doc_titles in titles_by_doc])])
+        return cls(docs_columns, titles, title_offsets)
+
+    @property
+    def empty(self):
+        return len(self.titles) == 0
+
+    @property
+    def num_titles(self):
+        return len(self.titles)
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def normalised_titles(self):
+        """Titres normalisés (liste Python, pour le backend de similarité)."""
+        if self._nti_list is None:
+            self._nti_list = list(self.nti)
+        return self._nti_list
+
+    def _doc_record(self, doc_pos):
+        hal_id = self.docs['Hal_ids'].iat[doc_pos]
+        return [hal_id.item() if isinstance(hal_id, np.generic) else hal_id] + [
+            self.docs[col].iat[doc_pos] for col in ('Types de dépôts', 'HAL Link', 'HAL Ext ID', 'HAL_URI')
+        ]
+
+    def title_record(self, title_pos):
+        """[Titres, Hal_ids, Types de dépôts, HAL Link, HAL Ext ID, HAL_URI] pour un titre donné."""
+        return [self.titles[title_pos]] + self._doc_record(int(self.title_doc[title_pos]))
+
+    def doc_record(self, doc_pos):
+        """Même format que title_record, avec le premier titre du document."""
+        first_title = int(self.title_offsets[doc_pos])
+        title = self.titles[first_title] if first_title < self.title_offsets[doc_pos + 1] else ""
+        return [title] + self._doc_record(doc_pos)
+
+    def lookup_doi(self, doi):
+        if self._doi_index is None:
+            self._doi_index = {}
+            for doc_pos, doi_val in enumerate(self.docs['DOIs']):
+                key = str(doi_val).lower().strip()
+                if key:
+                    self._doi_index.setdefault(key, doc_pos)
+        doc_pos = self._doi_index.get(str(doi).lower().strip())
+        return None if doc_pos is None else self.doc_record(doc_pos)
+
+    def lookup_external_id(self, id_column, value):
+        """Recherche exacte sur un identifiant externe (colonne de HAL_EXTERNAL_ID_FIELDS, ex. 'PMID')."""
+        if id_column not in self._external_id_index:
+            index = {}
+            for doc_pos, id_val in enumerate(self.docs[id_column]):
+                key = str(id_val).strip().lower()
+                if key:
+                    index.setdefault(key, doc_pos)
+            self._external_id_index[id_column] = index
+        doc_pos = self._external_id_index[id_column].get(str(value).strip().lower())
+        return None if doc_pos is None else self.doc_record(doc_pos)
+
+    def lookup_title(self, title):
+        if self._title_index is None:
+            self._title_index = {}
+            for title_pos, title_val in enumerate(self.titles):
+                self._title_index.setdefault(title_val, title_pos)
+        title_pos = self._title_index.get(title)
+        return None if title_pos is None else self.title_record(title_pos)
+
+    def to_dataframe(self):
+        """Vue à l'ancien format : une ligne par titre, colonnes LEGACY_COLUMNS (objets Python)."""
+        if self.empty:
+            return pd.DataFrame(columns=self.LEGACY_COLUMNS)
+        df = self.docs.iloc[self.title_doc].reset_index(drop=True).astype(object)
+        df.insert(2, 'Titres', np.asarray(self.titles, dtype=object))
+        df['nti'] = np.asarray(self.nti, dtype=object)
+        return df[self.LEGACY_COLUMNS]
+
+    def memory_usage(self):
+        """Empreinte mémoire (octets) des données de la collection, hors index de recherche."""
+        return int(
+            self.docs.memory_usage(deep=True).sum()
+            + self.titles.nbytes + self.nti.nbytes
+            + self.title_offsets.nbytes + self.title_doc.nbytes
+        )
+
+
+def _safe_str(value):
+    if value is None:
+        return ""
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+def as_hal_collection(collection):
+    """Accepte une HalCollection ou un DataFrame à l'ancien format (une ligne par titre)."""
+    if isinstance(collection, HalCollection):
+        return collection
+    return HalCollection.from_dataframe(collection)
+
+
+# Collection HAL des processus de check_df (héritée au fork ou transmise une fois par l'initialiseur)
+_WORKER_HAL_COLLECTION = None
+
+
+def _init_title_worker(hal_collection):
+    global _WORKER_HAL_COLLECTION
+    _WORKER_HAL_COLLECTION = hal_collection
+
+
+def _statut_titre_in_coll_chunk(titles_chunk):
+    return [statut_titre_in_coll(title, _WORKER_HAL_COLLECTION) for title in titles_chunk]
+
+
+def _titles_in_coll_process_pool(titles, hal_collection_df, n_workers):
+    """
+    Répartit les titres entre n_workers processus pour la partie CPU de statut_titre.
+    La collection n'est diffusée qu'une fois par processus : héritée sans copie avec 'fork',
+    sinon transmise à l'initialiseur de chaque processus.
+    """
+    global _WORKER_HAL_COLLECTION
+    if not titles:
+        return []
+
+    chunk_size = max(1, -(-len(titles) // (n_workers * 4)))
+    chunks = [titles[i:i + chunk_size] for i in range(0, len(titles), chunk_size)]
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        _WORKER_HAL_COLLECTION = hal_collection_df
+        pool_kwargs = {'mp_context': multiprocessing.get_context("fork")}
+    else:
+        pool_kwargs = {'initializer': _init_title_worker, 'initargs': (hal_collection_df,)}
+
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, **pool_kwargs) as executor:
+            chunk_results = list(tqdm(executor.map(_statut_titre_in_coll_chunk, chunks), total=len(chunks),
+                                      desc="Similarité des titres (processus)"))
+    finally:
+        _WORKER_HAL_COLLECTION = None
+
+    return [res for chunk_res in chunk_results for res in chunk_res]
+
+
+def _check_rows_process_pool(dois, titles, hal_collection_df, n_workers, progress_bar_st=None, pmids=None):
+    """
+    Variante de la boucle de check_df par étapes : requêtes DOI (threads), PMID exacts (collection
+    puis HAL), similarité des titres dans la collection (processus), puis recherche groupée des
+    titres restants dans HAL.
+    Produit les mêmes résultats à 7 champs que le mode séquentiel.
+    """
+    def has_value(val):
+        return pd.notna(val) and bool(str(val).strip())
+
+    results = [["Pas de DOI valide", "", "", "", "", "", ""] for _ in dois]
+
+    doi_rows = [i for i, doi in enumerate(dois) if has_value(doi)]
+    with RunExecutor(max_workers=HTTP_POOL_WORKERS) as executor:
+        doi_results = list(tqdm(executor.map(lambda i: statut_doi(str(dois[i]), hal_collection_df), doi_rows),
+                                total=len(doi_rows), desc="Vérification HAL des DOI"))
+    for i, res in zip(doi_rows, doi_results):
+        results[i] = res
+    if progress_bar_st is not None: progress_bar_st.progress(30)
+
+    if pmids is not None:
+        pmid_by_row = {i: pmid for i, pmid in enumerate(pmids) if pmid and results[i][0] not in HAL_FOUND_STATUSES}
+        for i, res in resolve_pmids(pmid_by_row, hal_collection_df).items():
+            results[i] = res
+
+    title_rows = []
+    for i, res in enumerate(results):
+        if res[0] in HAL_FOUND_STATUSES:
+            continue
+        if has_value(titles[i]):
+            title_rows.append(i)
+        elif not has_value(dois[i]):
+            results[i] = ["Données d'entrée insuffisantes (ni DOI ni Titre)", "", "", "", "", "", ""]
+
+    titles_to_check = [str(titles[i]) for i in title_rows]
+    coll_results = _titles_in_coll_process_pool(titles_to_check, hal_collection_df, n_workers)
+    if progress_bar_st is not None: progress_bar_st.progress(60)
+
+    hal_rows = []
+    for i, title, res in zip(title_rows, titles_to_check, coll_results):
+        if res:
+            results[i] = res
+        else:
+            hal_rows.append((i, title))
+
+    hal_results = in_hal_batch([title for _, title in hal_rows])
+    for (i, _), res in zip(hal_rows, hal_results):
+        results[i] = res
+
+    return results
+
+
+def _pmids_of_df(df):
+    """ PMID de chaque ligne (None si la ligne ne vient pas de PubMed). """
+    if 'Data source' not in df.columns or 'id' not in df.columns:
+        return [None] * len(df)
+    return [pmid_from_row(source, id_value) for source, id_value in zip(df['Data source'], df['id'])]
+
+
+def check_df(input_df_to_check, hal_collection_df, progress_bar_st=None, progress_text_st=None, n_workers=None):
+    """
+    Ajoute les 7 colonnes de statut HAL à input_df_to_check, complété sur place et renvoyé
+    (l'appelant cède le DataFrame : pas de copie).
+    n_workers > 1 active le mode multi-processus pour la similarité des titres
+    (par défaut : C2LABHAL_CHECK_WORKERS).
+    """
     if input_df_to_check.empty:
         st.info("Le DataFrame d'entrée pour check_df est vide. Aucune vérification HAL à effectuer.")
-        hal_output_cols = ['Statut_HAL', 'titre_HAL_si_trouvé', 'identifiant_hal_si_trouvé', 
-                           'type_dépôt_si_trouvé', 'HAL Link', 'HAL Ext ID', 'HAL_URI']
-        for col_name in hal_output_cols:
+        for col_name in HAL_OUTPUT_COLS:
             if col_name not in input_df_to_check.columns:
                 input_df_to_check[col_name] = pd.NA
         return input_df_to_check
 
-    df_to_process = input_df_to_check.copy() 
+    df_to_process = input_df_to_check
+    n_workers = DEFAULT_CHECK_WORKERS if n_workers is None else n_workers
+    hal_collection_df = as_hal_collection(hal_collection_df)
+
+    if n_workers > 1:
+        dois_list = df_to_process['doi'].tolist() if 'doi' in df_to_process.columns else [None] * len(df_to_process)
+        titles_list = df_to_process['Title'].tolist() if 'Title' in df_to_process.columns else [None] * len(df_to_process)
+        pmids_list = _pmids_of_df(df_to_process)
+        hal_results = _check_rows_process_pool(dois_list, titles_list, hal_collection_df, n_workers, progress_bar_st,
+                                               pmids=pmids_list)
+        for col_idx, col_name in enumerate(HAL_OUTPUT_COLS):
+            df_to_process[col_name] = [res[col_idx] for res in hal_results]
+        if progress_bar_st: progress_bar_st.progress(100)
+        return df_to_process
 
     statuts_hal_list = []
     titres_hal_list = []
@@ -747,19 +1808,38 @@ def check_df(input_df_to_check, hal_collection_df, progress_bar_st=None, progres
     hal_uris_list = [] 
 
 
+    # Lignes PubMed sans correspondance DOI : PMID exact (collection puis HAL) avant les titres
+    pending_pmid_rows = {}
+    # Titres absents de la collection : résolus ensuite dans HAL par lots (in_hal_batch)
+    pending_hal_titles = []
+
     total_rows_to_process = len(df_to_process)
-    for index, row_to_check in tqdm(df_to_process.iterrows(), total=total_rows_to_process, desc="Vérification HAL (check_df)"):
-        doi_value_from_row = row_to_check.get('doi') 
-        title_value_from_row = row_to_check.get('Title') 
+    # Lecture par colonnes (listes) plutôt que iterrows : pas de Series par ligne
+    def column_values(col_name):
+        return df_to_process[col_name].tolist() if col_name in df_to_process.columns else [None] * total_rows_to_process
+
+    rows_to_check = zip(column_values('doi'), column_values('Title'), column_values('Data source'), column_values('id'))
+    for index, (doi_value_from_row, title_value_from_row, data_source_value, id_value) in enumerate(
+            tqdm(rows_to_check, total=total_rows_to_process, desc="Vérification HAL (check_df)")):
+        pmid_value_from_row = pmid_from_row(data_source_value, id_value)
 
         hal_status_result = ["Pas de DOI valide", "", "", "", "", "", ""] 
         
         if pd.notna(doi_value_from_row) and str(doi_value_from_row).strip():
             hal_status_result = statut_doi(str(doi_value_from_row), hal_collection_df)
         
-        if hal_status_result[0] not in ("Dans la collection", "Dans HAL mais hors de la collection"):
-            if pd.notna(title_value_from_row) and str(title_value_from_row).strip():
-                hal_status_result = statut_titre(str(title_value_from_row), hal_collection_df)
+        if hal_status_result[0] not in HAL_FOUND_STATUSES:
+            if pmid_value_from_row:
+                fallback_result = hal_status_result
+                if not (pd.notna(doi_value_from_row) and str(doi_value_from_row).strip()):
+                    fallback_result = ["Données d'entrée insuffisantes (ni DOI ni Titre)", "", "", "", "", "", ""]
+                pending_pmid_rows[len(statuts_hal_list)] = (pmid_value_from_row, fallback_result, title_value_from_row)
+            elif pd.notna(title_value_from_row) and str(title_value_from_row).strip():
+                res_coll = statut_titre_in_coll(str(title_value_from_row), hal_collection_df)
+                if res_coll:
+                    hal_status_result = res_coll
+                else:
+                    pending_hal_titles.append((len(statuts_hal_list), str(title_value_from_row)))
             elif not (pd.notna(doi_value_from_row) and str(doi_value_from_row).strip()): 
                 hal_status_result = ["Données d'entrée insuffisantes (ni DOI ni Titre)", "", "", "", "", "", ""]
         
@@ -775,6 +1855,29 @@ def check_df(input_df_to_check, hal_collection_df, progress_bar_st=None, progres
             current_progress_val = (index + 1) / total_rows_to_process
             progress_bar_st.progress(int(current_progress_val * 100))
 
+    def set_result(pos, res):
+        statuts_hal_list[pos], titres_hal_list[pos], ids_hal_list[pos], types_depot_hal_list[pos], \
+            links_hal_list[pos], ext_ids_hal_list[pos], hal_uris_list[pos] = res
+
+    if pending_pmid_rows:
+        pmid_results = resolve_pmids({pos: pending[0] for pos, pending in pending_pmid_rows.items()}, hal_collection_df)
+        for pos, (_, fallback_result, title_value) in pending_pmid_rows.items():
+            if pos in pmid_results:
+                set_result(pos, pmid_results[pos])
+            elif pd.notna(title_value) and str(title_value).strip():
+                res_coll = statut_titre_in_coll(str(title_value), hal_collection_df)
+                if res_coll:
+                    set_result(pos, res_coll)
+                else:
+                    pending_hal_titles.append((pos, str(title_value)))
+            else:
+                set_result(pos, fallback_result)
+
+    if pending_hal_titles:
+        batch_results = in_hal_batch([title for _, title in pending_hal_titles])
+        for (pos, _), res in zip(pending_hal_titles, batch_results):
+            set_result(pos, res)
+
     df_to_process['Statut_HAL'] = statuts_hal_list
     df_to_process['titre_HAL_si_trouvé'] = titres_hal_list
     df_to_process['identifiant_hal_si_trouvé'] = ids_hal_list
@@ -793,6 +1896,7 @@ class HalCollImporter:
         self.start_year = start_year_val if start_year_val is not None else DEFAULT_START_YEAR
         self.end_year = end_year_val if end_year_val is not None else DEFAULT_END_YEAR 
         
+        self.incomplete = False
         self.num_docs_in_collection = self._get_num_docs()
 
     def _get_num_docs(self):
@@ -805,23 +1909,72 @@ class HalCollImporter:
             }
             base_search_url = f"{HAL_API_ENDPOINT}{self.collection_code}/" if self.collection_code else HAL_API_ENDPOINT
             
-            response_count = requests.get(base_search_url, params=query_params_count, timeout=15)
+            response_count = http_client.get(base_search_url, params=query_params_count, timeout=15, route="hal-comptage")
             response_count.raise_for_status()
             return response_count.json().get('response', {}).get('numFound', 0)
         except requests.exceptions.RequestException as e:
             st.error(f"Erreur API HAL (comptage) pour '{self.collection_code or 'HAL global'}': {e}")
+            self.incomplete = True
             return 0
         except (KeyError, json.JSONDecodeError):
             st.error(f"Réponse API HAL (comptage) inattendue pour '{self.collection_code or 'HAL global'}'.")
+            self.incomplete = True
             return 0
 
     def import_data(self):
-        expected_cols = ['Hal_ids', 'DOIs', 'Titres', 'Types de dépôts', 
-                         'HAL Link', 'HAL Ext ID', 'HAL_URI', 'nti']
+        """Importe la collection et la retourne sous forme compacte (HalCollection)."""
         if self.num_docs_in_collection == 0:
             st.info(f"Aucun document trouvé pour la collection '{self.collection_code or 'HAL global'}' entre {self.start_year} et {self.end_year}.")
-            return pd.DataFrame(columns=expected_cols)
-
+            return HalCollection.from_hal_docs([])
+        return HalCollection.from_hal_docs(self.import_docs())
+
+    def import_data_cached(self, refresh_current_year=None, cache=None):
+        """
+        Comme import_data, mais les documents sont lus dans le cache des récoltes par année
+        de publication : seules les années manquantes (et l'année en cours) sont importées.
+        """
+        if self.end_year == '*':
+            return self.import_data()
+
+        def fetch_year(year):
+            year_importer = HalCollImporter(self.collection_code, year, year)
+            docs = year_importer.import_docs() if year_importer.num_docs_in_collection else []
+            if year_importer.incomplete:
+                raise HarvestError(f"import HAL interrompu pour {year}", docs)
+            return docs
+
+        # Les champs importés font partie de la clé : un cache antérieur à leur ajout n'est pas réutilisé
+        query_key = f"{self.collection_code or 'HAL global'}|{HAL_COLLECTION_FIELDS}"
+        # Dépôts et modifications postérieurs à la récolte : l'année est réimportée (empreinte modifiée)
+        docs, _ = fetch_years_cached("hal", query_key, self.start_year, self.end_year,
+                                     fetch_year, refresh_current_year, cache, fingerprint_year=self.year_fingerprint)
+        return HalCollection.from_hal_docs(docs)
+
+    def year_fingerprint(self, year):
+        """
+        Empreinte d'une année de la collection : nombre de notices et date de la dernière
+        modification (une requête rows=1). None si HAL ne répond pas.
+        """
+        query_params = {
+            'q': '*:*',
+            'fq': f'publicationDateY_i:{year}',
+            'rows': 1,
+            'fl': 'modifiedDate_tdate',
+            'sort': 'modifiedDate_tdate desc',
+            'wt': 'json'
+        }
+        base_search_url = f"{HAL_API_ENDPOINT}{self.collection_code}/" if self.collection_code else HAL_API_ENDPOINT
+        try:
+            response = http_client.get(base_search_url, params=query_params, timeout=15, route="hal-comptage")
+            response.raise_for_status()
+            data = response.json().get('response', {})
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        docs = data.get('docs') or [{}]
+        return f"{data.get('numFound', 0)}|{docs[0].get('modifiedDate_tdate', '')}"
+
+    def import_docs(self):
+        """Documents bruts (HAL_COLLECTION_FIELDS) de la collection, par pagination cursorMark."""
         all_docs_list = []
         rows_per_api_page = 1000 
         current_api_cursor = "*" 
@@ -833,41 +1986,30 @@ class HalCollImporter:
                 query_params_page = {
                     'q': '*:*',
                     'fq': f'publicationDateY_i:[{self.start_year} TO {self.end_year}]',
-                    'fl': HAL_FIELDS_TO_FETCH, 
+                    'fl': HAL_COLLECTION_FIELDS, 
                     'rows': rows_per_api_page,
                     'sort': 'docid asc', 
                     'cursorMark': current_api_cursor,
                     'wt': 'json'
                 }
                 try:
-                    response_page = requests.get(base_search_url, params=query_params_page, timeout=45) 
+                    response_page = http_client.get(base_search_url, params=query_params_page, timeout=45, dedupe=False, route="hal-import") 
                     response_page.raise_for_status()
                     data_page = response_page.json()
                 except requests.exceptions.RequestException as e:
                     st.error(f"Erreur API HAL (import page, curseur {current_api_cursor}): {e}")
+                    self.incomplete = True
                     break 
                 except json.JSONDecodeError:
                     st.error(f"Erreur décodage JSON (import page HAL, curseur {current_api_cursor}).")
+                    self.incomplete = True
                     break
 
                 docs_on_current_page = data_page.get('response', {}).get('docs', [])
                 if not docs_on_current_page: 
                     break
 
-                for doc_data in docs_on_current_page:
-                    hal_titles_list = doc_data.get('title_s', [""]) 
-                    if not isinstance(hal_titles_list, list): hal_titles_list = [str(hal_titles_list)] 
-
-                    for title_item in hal_titles_list:
-                        all_docs_list.append({
-                            'Hal_ids': doc_data.get('docid', ''),
-                            'DOIs': str(doc_data.get('doiId_s', '')).lower() if doc_data.get('doiId_s') else '', 
-                            'Titres': str(title_item), 
-                            'Types de dépôts': doc_data.get('submitType_s', ''),
-                            'HAL Link': doc_data.get('linkExtUrl_s', ''), 
-                            'HAL Ext ID': doc_data.get('linkExtId_s', ''),
-                            'HAL_URI': doc_data.get('uri_s', '') 
-                        })
+                all_docs_list.extend(docs_on_current_page)
                 pbar_hal.update(len(docs_on_current_page)) 
 
                 next_api_cursor = data_page.get('nextCursorMark')
@@ -875,16 +2017,122 @@ class HalCollImporter:
                     break
                 current_api_cursor = next_api_cursor
         
-        if not all_docs_list: 
-             return pd.DataFrame(columns=expected_cols)
+        return all_docs_list
 
-        df_collection_hal = pd.DataFrame(all_docs_list)
-        if 'Titres' in df_collection_hal.columns:
-            df_collection_hal['nti'] = df_collection_hal['Titres'].apply(normalise)
-        else: 
-            df_collection_hal['nti'] = ""
-            
-        return df_collection_hal
+
+def _json_safe(value):
+    """ Valeur sérialisable en JSON : NA / NaN -> None, scalaires numpy -> Python, tout autre type -> str. """
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+class RunHistory:
+    """
+    Historique des résultats finaux d'un laboratoire (une entrée par publication, clé :
+    DOI normalisé, sinon titre normalisé), conservé dans le cache persistant à raison d'une
+    ligne par publication ("<labo>|<clé>") limitée à RUN_HISTORY_STORED_COLS.
+    Permet de ne revérifier que les publications nouvelles, non résolues (hors collection,
+    affiliation à vérifier, erreurs) ou vérifiées il y a plus de max_age_days jours.
+    """
+
+    def __init__(self, lab_key, max_age_days=None, cache=None):
+        self.lab_key = str(lab_key).strip()
+        self.max_age_days = RUN_HISTORY_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self.cache = cache if cache is not None else PersistentCache("run_history", None)
+        self._prefix = self.lab_key + "|"
+        self.previous = {
+            key[len(self._prefix):]: entry for key, entry in self.cache.items(self._prefix).items()
+        }
+
+    @staticmethod
+    def publication_key(doi_value, title_value):
+        doi_key = normalize_doi_for_matching(_safe_str(doi_value))
+        if doi_key:
+            return "doi:" + doi_key
+        title_key = normalise(_safe_str(title_value)) if _safe_str(title_value) else ""
+        return "titre:" + title_key if title_key else None
+
+    def _keys(self, df):
+        doi_values = df['doi'].tolist() if 'doi' in df.columns else [None] * len(df)
+        title_values = df['Title'].tolist() if 'Title' in df.columns else [None] * len(df)
+        return [self.publication_key(d, t) for d, t in zip(doi_values, title_values)]
+
+    def _is_reusable(self, entry, now):
+        if entry is None:
+            return False
+        if entry["row"].get("Statut_HAL") not in RUN_HISTORY_RESOLVED_STATUSES:
+            return False
+        if entry["row"].get(RETRY_COL):
+            return False
+        return now - entry["checked_at"] <= self.max_age_days * 24 * 3600
+
+    def split(self, input_df):
+        """
+        Sépare input_df en (publications à vérifier, publications reprises). Les lignes reprises
+        reçoivent les colonnes de résultat (RUN_HISTORY_RESULT_COLS) de l'exécution précédente.
+        """
+        now = time.time()
+        keys = self._keys(input_df)
+        reuse_mask = [self._is_reusable(self.previous.get(k) if k else None, now) for k in keys]
+        reuse_series = pd.Series(reuse_mask, index=input_df.index, dtype=bool)
+
+        to_check_df = input_df[~reuse_series]
+        reused_df = input_df[reuse_series].copy()
+        if not reused_df.empty:
+            reused_rows = [self.previous[k]["row"] for k, reuse in zip(keys, reuse_mask) if reuse]
+            for col in RUN_HISTORY_RESULT_COLS:
+                reused_df[col] = [row.get(col) for row in reused_rows]
+        return to_check_df, reused_df
+
+    def annotate_changes(self, final_df, reused_df=None):
+        """ Ajoute RUN_CHANGE_COL : nouveauté, changement de statut HAL ou d'action, reprise. """
+        reused_keys = set(self._keys(reused_df)) if reused_df is not None and not reused_df.empty else set()
+        statuses = final_df['Statut_HAL'].tolist() if 'Statut_HAL' in final_df.columns else [None] * len(final_df)
+        actions = final_df['Action'].tolist() if 'Action' in final_df.columns else [None] * len(final_df)
+        changes = []
+        for key, status, action in zip(self._keys(final_df), statuses, actions):
+            entry = self.previous.get(key) if key else None
+            if entry is None:
+                changes.append("Nouvelle publication")
+            elif key in reused_keys:
+                checked_on = pd.Timestamp(entry["checked_at"], unit="s").strftime("%Y-%m-%d")
+                changes.append(f"Non revérifiée (résultat du {checked_on})")
+            elif _safe_str(entry["row"].get("Statut_HAL")) != _safe_str(status):
+                changes.append(f"Statut HAL modifié : {_safe_str(entry['row'].get('Statut_HAL'))} → {_safe_str(status)}")
+            elif _safe_str(entry["row"].get("Action")) != _safe_str(action):
+                changes.append("Action modifiée")
+            else:
+                changes.append("Inchangée")
+        final_df[RUN_CHANGE_COL] = changes
+        return final_df
+
+    def save(self, final_df, reused_df=None):
+        """
+        Enregistre les résultats finaux (RUN_HISTORY_STORED_COLS) ; les lignes reprises gardent
+        leur date de vérification. Seules les entrées nouvelles ou modifiées sont réécrites.
+        """
+        now = time.time()
+        reused_keys = set(self._keys(reused_df)) if reused_df is not None and not reused_df.empty else set()
+        columns = [col for col in RUN_HISTORY_STORED_COLS if col in final_df.columns]
+        changed = {}
+        for key, row in zip(self._keys(final_df), final_df[columns].to_dict(orient='records')):
+            if not key:
+                continue
+            previous = self.previous.get(key)
+            checked_at = previous["checked_at"] if key in reused_keys and previous is not None else now
+            entry = {"row": {col: _json_safe(val) for col, val in row.items()}, "checked_at": checked_at}
+            if entry != previous:
+                changed[key] = entry
+        self.cache.set_many({self._prefix + key: entry for key, entry in changed.items()})
+        self.previous.update(changed)
 
 
 def merge_rows_with_sources(grouped_data):
@@ -909,19 +2157,41 @@ def merge_rows_with_sources(grouped_data):
     return pd.Series(merged_row_content_dict)
 
 
+def _crossref_author_names(authors_data_list):
+    author_names_list = []
+    for author_entry in authors_data_list or []:
+        if not isinstance(author_entry, dict): continue 
+
+        given_name = str(author_entry.get('given', '')).strip()
+        family_name = str(author_entry.get('family', '')).strip()
+        
+        full_name = ""
+        if given_name and family_name:
+            full_name = f"{given_name} {family_name}"
+        elif family_name: 
+            full_name = family_name
+        elif given_name: 
+            full_name = given_name
+        
+        if full_name: 
+            author_names_list.append(full_name)
+
+    return author_names_list
+
+
 def get_authors_from_crossref(doi_value):
     if pd.isna(doi_value) or not str(doi_value).strip():
         return ["DOI manquant pour Crossref"]
 
     doi_cleaned_for_api = str(doi_value).strip()
     headers = {
-        'User-Agent': 'c2LabHAL/1.0 (mailto:YOUR_EMAIL@example.com; https://github.com/GuillaumeGodet/c2labhal)', 
+        'User-Agent': CROSSREF_USER_AGENT, 
         'Accept': 'application/json'
     }
-    url_crossref = f"https://api.crossref.org/works/{doi_cleaned_for_api}"
+    url_crossref = f"{CROSSREF_API_ENDPOINT}/{normalize_doi_for_matching(doi_cleaned_for_api)}"
     
     try:
-        response_crossref = requests.get(url_crossref, headers=headers, timeout=10)
+        response_crossref = http_client.get(url_crossref, headers=headers, params={'mailto': CROSSREF_MAILTO}, timeout=10, route="crossref-doi")
         response_crossref.raise_for_status()
         data_crossref = response_crossref.json()
     except requests.exceptions.Timeout:
@@ -934,29 +2204,153 @@ def get_authors_from_crossref(doi_value):
     except json.JSONDecodeError:
         return ["Erreur JSON Crossref"]
 
-    authors_data_list = data_crossref.get('message', {}).get('author', [])
-    if not authors_data_list:
-        return [] 
+    return _crossref_author_names(data_crossref.get('message', {}).get('author', []))
 
-    author_names_list = []
-    for author_entry in authors_data_list:
-        if not isinstance(author_entry, dict): continue 
 
-        given_name = str(author_entry.get('given', '')).strip()
-        family_name = str(author_entry.get('family', '')).strip()
-        
-        full_name = ""
-        if given_name and family_name:
-            full_name = f"{given_name} {family_name}"
-        elif family_name: 
-            full_name = family_name
-        elif given_name: 
-            full_name = given_name
-        
-        if full_name: 
-            author_names_list.append(full_name)
+def _get_authors_from_crossref_filter(dois_batch):
+    """Une requête /works?filter=doi:a,doi:b,... ; retourne {doi normalisé: liste d'auteurs ou [message d'erreur]}."""
+    params = {
+        'filter': ','.join(f"doi:{doi}" for doi in dois_batch),
+        'select': 'DOI,author',
+        'rows': len(dois_batch),
+        'mailto': CROSSREF_MAILTO,
+    }
+    headers = {'User-Agent': CROSSREF_USER_AGENT, 'Accept': 'application/json'}
+    try:
+        response_crossref = http_client.get(CROSSREF_API_ENDPOINT, params=params, headers=headers, timeout=30, route="crossref-doi-lot")
+        response_crossref.raise_for_status()
+        items = response_crossref.json().get('message', {}).get('items', [])
+    except requests.exceptions.Timeout:
+        return {doi: ["Timeout Crossref"] for doi in dois_batch}
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code if hasattr(e.response, 'status_code') else 'N/A'
+        return {doi: [f"Erreur HTTP Crossref ({status_code})"] for doi in dois_batch}
+    except requests.exceptions.RequestException as e_req:
+        return {doi: [f"Erreur requête Crossref: {type(e_req).__name__}"] for doi in dois_batch}
+    except json.JSONDecodeError:
+        return {doi: ["Erreur JSON Crossref"] for doi in dois_batch}
 
-    return author_names_list
+    found = {normalize_doi_for_matching(item.get('DOI')): _crossref_author_names(item.get('author', [])) for item in items}
+    # DOI absent de la réponse : équivalent du 404 de la requête unitaire
+    return {doi: found.get(doi, ["Erreur HTTP Crossref (404)"]) for doi in dois_batch}
+
+
+def get_authors_from_crossref_batch(dois, batch_size=CROSSREF_BATCH_SIZE, max_workers=4):
+    """
+    Récupère les auteurs Crossref de plusieurs DOI en requêtes groupées (DOI dédoublonnés,
+    vides ignorés). Retourne {doi normalisé: liste d'auteurs} au format de get_authors_from_crossref.
+    """
+    unique_dois = list(dict.fromkeys(normalize_doi_for_matching(d) for d in dois if pd.notna(d)))
+    unique_dois = [d for d in unique_dois if d]
+    # Une virgule dans un DOI casserait la syntaxe du filtre : requête unitaire dans ce cas
+    single_dois = [d for d in unique_dois if ',' in d]
+    batches = [d for d in unique_dois if ',' not in d]
+    batches = [batches[i:i + batch_size] for i in range(0, len(batches), batch_size)]
+
+    authors_by_doi = {}
+    with RunExecutor(max_workers=max_workers) as executor:
+        for batch_result in tqdm(executor.map(_get_authors_from_crossref_filter, batches), total=len(batches),
+                                 desc="Récupération auteurs Crossref (lots)"):
+            authors_by_doi.update(batch_result)
+        for doi, authors in zip(single_dois, executor.map(get_authors_from_crossref, single_dois)):
+            authors_by_doi[doi] = authors
+    return authors_by_doi
+
+
+def _get_openalex_works_filter(dois_batch, select):
+    params = {
+        'filter': 'doi:' + '|'.join(dois_batch),
+        'per-page': len(dois_batch),
+        'mailto': OPENALEX_MAILTO,
+    }
+    if select:
+        params['select'] = select
+    try:
+        resp = http_client.get(OPENALEX_API_ENDPOINT, params=params, timeout=30, hedge=True, route="openalex-doi-lot")
+        resp.raise_for_status()
+        works = resp.json().get('results', [])
+    except (requests.exceptions.RequestException, json.JSONDecodeError):
+        return {}
+    return {normalize_doi_for_matching(work.get('doi')): work for work in works if work.get('doi')}
+
+
+def get_openalex_works_by_doi(dois, select=None, batch_size=OPENALEX_DOI_BATCH_SIZE, max_workers=4):
+    """
+    Récupère les notices OpenAlex de plusieurs DOI par lots (filter=doi:a|b|...).
+    Retourne {doi normalisé: notice} ; les DOI en erreur ou inconnus d'OpenAlex sont absents.
+    """
+    unique_dois = list(dict.fromkeys(normalize_doi_for_matching(d) for d in dois if pd.notna(d)))
+    # ',' et '|' sont des séparateurs de la syntaxe de filtre OpenAlex
+    unique_dois = [d for d in unique_dois if d and ',' not in d and '|' not in d]
+    batches = [unique_dois[i:i + batch_size] for i in range(0, len(unique_dois), batch_size)]
+
+    works_by_doi = {}
+    with RunExecutor(max_workers=max_workers) as executor:
+        for batch_result in tqdm(executor.map(lambda batch: _get_openalex_works_filter(batch, select), batches),
+                                 total=len(batches), desc="Requêtes OpenAlex par DOI (lots)"):
+            works_by_doi.update(batch_result)
+    return works_by_doi
+
+
+def _openalex_author_names(openalex_work):
+    return [author['name'] for author in extract_authors_from_openalex_json(openalex_work) if author.get('name')]
+
+
+def resolve_authors(doi_values, openalex_works=None):
+    """
+    Résout les auteurs de chaque ligne en limitant les requêtes :
+      1. notices OpenAlex déjà récoltées (openalex_works, liste de notices brutes) ;
+      2. requêtes OpenAlex groupées (filter=doi:a|b|..., 50 DOI par appel) pour les DOI restants ;
+      3. Crossref groupé uniquement pour les DOI toujours non résolus.
+    Retourne (valeurs de la colonne Auteurs_Crossref, source des auteurs de chaque ligne).
+    """
+    doi_values = list(doi_values)
+    doi_keys = [normalize_doi_for_matching(doi) if pd.notna(doi) else "" for doi in doi_values]
+    unique_keys = list(dict.fromkeys(key for key in doi_keys if key))
+
+    authors_by_doi = {}
+    source_by_doi = {}
+
+    for work in openalex_works or []:
+        key = normalize_doi_for_matching(work.get('doi')) if isinstance(work, dict) else ""
+        if key and key not in authors_by_doi:
+            names = _openalex_author_names(work)
+            if names:
+                authors_by_doi[key] = names
+                source_by_doi[key] = "openalex"
+
+    pending = [key for key in unique_keys if key not in authors_by_doi]
+    if pending:
+        for key, work in get_openalex_works_by_doi(pending, select='doi,authorships').items():
+            names = _openalex_author_names(work)
+            if names:
+                authors_by_doi[key] = names
+                source_by_doi[key] = "openalex (requête)"
+
+    pending = [key for key in unique_keys if key not in authors_by_doi]
+    if pending:
+        for key, authors in get_authors_from_crossref_batch(pending).items():
+            authors_by_doi[key] = authors
+            source_by_doi[key] = "crossref"
+
+    column, sources = [], []
+    for key in doi_keys:
+        if not key:
+            column.append(format_authors_for_column(["DOI manquant pour Crossref"]))
+            sources.append("")
+        else:
+            column.append(format_authors_for_column(authors_by_doi.get(key, [])))
+            sources.append(source_by_doi.get(key, ""))
+    return column, sources
+
+
+def format_authors_for_column(author_list):
+    """Liste d'auteurs -> 'A; B; C' (ou le message d'erreur) pour la colonne Auteurs_Crossref."""
+    if not isinstance(author_list, list) or not author_list:
+        return ''
+    if any("Erreur" in str(a) or "Timeout" in str(a) for a in author_list):
+        return author_list[0]
+    return '; '.join(author_list)
 
 
 def normalize_name(name_to_normalize):
@@ -986,6 +2380,70 @@ def get_initial_form(normalised_author_name):
         return normalised_author_name 
     return "" 
     
+
+
+class ResearcherIndex:
+    """
+    Index des chercheurs d'un laboratoire (liste issue du CSV téléversé) pour repérer leurs noms
+    parmi les auteurs d'une publication. Correspondance exacte sur les clés normalize_name /
+    get_initial_form, puis similarité limitée aux chercheurs partageant un bloc de nom
+    (3 premières lettres d'un des mots du nom) ; si le bloc est vide ou sans correspondance
+    (faute de frappe dans ces lettres, translittération « Müller » / « Mueller »), similarité
+    sur tous les chercheurs, comme la comparaison directe.
+    """
+    BLOCK_PREFIX_LEN = 3
+
+    def __init__(self, researcher_names, full_cutoff=0.85, initial_cutoff=0.9, backend=None):
+        self.full_cutoff = full_cutoff
+        self.initial_cutoff = initial_cutoff
+        self.backend = backend
+        self.full_map = {normalize_name(n): n for n in researcher_names}
+        self.initial_map = {get_initial_form(normalize_name(n)): n for n in researcher_names}
+        self.full_keys = sorted(self.full_map)
+        self.initial_keys = sorted(self.initial_map)
+        self.full_blocks = self._build_blocks(self.full_map)
+        self.initial_blocks = self._build_blocks(self.initial_map)
+
+    @classmethod
+    def _block_keys(cls, normalised_name):
+        return {part[:cls.BLOCK_PREFIX_LEN] for part in normalised_name.split() if len(part) > 1}
+
+    @classmethod
+    def _build_blocks(cls, names_map):
+        blocks = defaultdict(list)
+        for key in names_map:
+            for block_key in cls._block_keys(key):
+                blocks[block_key].append(key)
+        return blocks
+
+    def _match(self, name_key, names_map, all_keys, blocks, cutoff):
+        if name_key in names_map:
+            return names_map[name_key]
+        candidates = {key for block_key in self._block_keys(name_key) for key in blocks.get(block_key, ())}
+        match = close_matches(name_key, sorted(candidates), n=1, cutoff=cutoff, backend=self.backend) if candidates else []
+        if not match and len(candidates) < len(all_keys):
+            match = close_matches(name_key, all_keys, n=1, cutoff=cutoff, backend=self.backend)
+        return names_map[match[0]] if match else None
+
+    def match(self, author_name):
+        """Retourne le nom (forme du CSV) du chercheur correspondant à author_name, ou None."""
+        author_norm = normalize_name(author_name)
+        if not author_norm:
+            return None
+        found = self._match(author_norm, self.full_map, self.full_keys, self.full_blocks, self.full_cutoff)
+        if found is None:
+            found = self._match(get_initial_form(author_norm), self.initial_map, self.initial_keys,
+                                self.initial_blocks, self.initial_cutoff)
+        return found
+
+    def detect_known_authors(self, authors_str):
+        """Chercheurs du laboratoire présents dans une liste d'auteurs 'A; B; C' (noms triés, séparés par '; ')."""
+        if pd.isna(authors_str) or not str(authors_str).strip() or "Erreur" in authors_str or "Timeout" in authors_str:
+            return ""
+        authors_from_pub = [a.strip() for a in str(authors_str).split(';') if a.strip()]
+        detected_names = {name for name in map(self.match, authors_from_pub) if name is not None}
+        return "; ".join(sorted(detected_names))
+
 """
 def extract_authors_from_openalex_json(openalex_json):
     # Extrait les auteurs et affiliations d'un enregistrement OpenAlex.